@@ -1,18 +1,24 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Response
 from pydantic import BaseModel
 from datetime import datetime
 from loguru import logger
+import json
+import threading
 import uvicorn
 import os
 from dotenv import load_dotenv
 
 # Import our services
 from API.services.db.db_service import DBService
-from API.services.message_broker.broker_service import MessageBroker
+from API.services.message_broker.backend import create_message_broker, PRIORITY_BULK, PRIORITY_INTERACTIVE, SYNC_QUEUES
 from API.services.data_sync.customers import CustomerSyncService
 from API.services.data_sync.events import EventSyncService
+from API.services.data_sync.ranges import parse_date
+from API.services.data_sync.availability import ParkingAvailabilityCache, PARKING_AVAILABILITY_EXCHANGE
 from API.services.scheduler.scheduler_service import SchedulerService
-from API.BbApiConnector.BbApiConnector import BbApiConnector
+from API.services.webhooks import WebhookReceiver, SIGNATURE_HEADER
+from API.services.auth.bb_api_connector import BbApiConnector
+from API.services.worker import WORKER_QUEUES
 
 app = FastAPI(
     title="Hagley Museum OLAP API",
@@ -28,6 +34,18 @@ class SyncRange(BaseModel):
 class CustomerSync(BaseModel):
     altru_id: str
 
+def range_priority(sync_range: SyncRange):
+    """
+    Interactive for short ranges a user is waiting on, bulk for anything longer than
+    SYNC_INTERACTIVE_MAX_DAYS (default 7) so long syncs cannot tie up the interactive lane
+    """
+    max_days = int(os.getenv('SYNC_INTERACTIVE_MAX_DAYS', '7'))
+    try:
+        days = (parse_date(sync_range.end_date) - parse_date(sync_range.start_date)).days
+    except ValueError:
+        return PRIORITY_BULK
+    return PRIORITY_INTERACTIVE if days <= max_days else PRIORITY_BULK
+
 # Initialize services
 db_service = None
 message_broker = None
@@ -35,11 +53,14 @@ api_connector = None
 scheduler_service = None
 customer_sync_service = None
 event_sync_service = None
+webhook_receiver = None
+parking_availability = None
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services when the API starts"""
     global db_service, message_broker, api_connector, scheduler_service, customer_sync_service, event_sync_service
+    global webhook_receiver, parking_availability
     
     load_dotenv()
     
@@ -49,7 +70,7 @@ async def startup_event():
     
     # Initialize the message broker
     logger.info("Initializing message broker")
-    message_broker = MessageBroker()
+    message_broker = create_message_broker()
     
     # Initialize the API connector
     logger.info("Initializing Blackbaud API connector")
@@ -72,6 +93,21 @@ async def startup_event():
     # Start the scheduler in the background
     scheduler_service.start_scheduler()
     
+    # Change notifications pushed by SKY API become targeted syncs
+    webhook_receiver = WebhookReceiver(message_broker)
+    if not webhook_receiver.configured:
+        logger.warning("WEBHOOK_SECRET is not set, webhook notifications will be refused")
+    
+    # Parking availability is served from memory and dropped as parking pass syncs complete;
+    # each API process subscribes to the completions with a queue of its own
+    parking_availability = ParkingAvailabilityCache(db_service)
+    availability_thread = threading.Thread(
+        target=message_broker.consume_broadcast,
+        args=(PARKING_AVAILABILITY_EXCHANGE, parking_availability.handle_sync_event),
+        daemon=True
+    )
+    availability_thread.start()
+    
     logger.info("API startup complete")
 
 @app.on_event("shutdown")
@@ -105,15 +141,15 @@ async def sync_all(sync_range: SyncRange, background_tasks: BackgroundTasks):
     if not message_broker:
         raise HTTPException(status_code=503, detail="Message broker service is not available")
     
-    # Use the message broker to publish sync events
+    # Use the message broker to publish sync events; full syncs are always bulk work
     background_tasks.add_task(
-        message_broker.publish_message,
-        'sync_queue',
+        message_broker.publish_sync_request,
         {
             'type': 'full_sync',
             'start_date': sync_range.start_date,
             'end_date': sync_range.end_date
-        }
+        },
+        PRIORITY_BULK
     )
     
     return {
@@ -133,14 +169,14 @@ async def sync_customer(customer: CustomerSync, background_tasks: BackgroundTask
     if not message_broker:
         raise HTTPException(status_code=503, detail="Message broker service is not available")
     
-    # Use the message broker to publish a customer sync event
+    # Use the message broker to publish a customer sync event on the interactive lane
     background_tasks.add_task(
-        message_broker.publish_message,
-        'sync_queue',
+        message_broker.publish_sync_request,
         {
             'type': 'customer_sync',
             'altru_id': customer.altru_id
-        }
+        },
+        PRIORITY_INTERACTIVE
     )
     
     return {
@@ -160,13 +196,13 @@ async def sync_events(sync_range: SyncRange, background_tasks: BackgroundTasks):
     
     # Use the message broker to publish an event sync event
     background_tasks.add_task(
-        message_broker.publish_message,
-        'sync_queue',
+        message_broker.publish_sync_request,
         {
             'type': 'event_sync',
             'start_date': sync_range.start_date,
             'end_date': sync_range.end_date
-        }
+        },
+        range_priority(sync_range)
     )
     
     return {
@@ -176,5 +212,97 @@ async def sync_events(sync_range: SyncRange, background_tasks: BackgroundTasks):
         "end_date": sync_range.end_date
     }
 
+@app.get("/events/{event_id}/parking-availability")
+def get_parking_availability(event_id: int):
+    """
+    Endpoint for the remaining parking passes of every pass type for an event, served from cache
+    """
+    if not parking_availability:
+        raise HTTPException(status_code=503, detail="Parking availability is not available")
+    
+    availability = parking_availability.get(event_id)
+    if availability is None:
+        raise HTTPException(status_code=503, detail="Parking availability could not be read")
+    return availability
+
+@app.options("/webhooks/sky")
+async def webhook_handshake(request: Request):
+    """
+    CloudEvents validation handshake, sent when a webhook subscription is created
+    """
+    origin = request.headers.get('WebHook-Request-Origin', '*')
+    return Response(status_code=200, headers={'WebHook-Allowed-Origin': origin, 'Allow': 'POST'})
+
+@app.post("/webhooks/sky")
+async def receive_webhook(request: Request, background_tasks: BackgroundTasks):
+    """
+    Endpoint for SKY API change notifications
+    Constituent changes are enqueued as a sync of that constituent, ticket, registrant and parking
+    pass changes as a poll of their event, and event changes as a delta event sync
+    """
+    if not webhook_receiver or not webhook_receiver.configured:
+        raise HTTPException(status_code=503, detail="Webhooks are not configured")
+    
+    body = await request.body()
+    if not webhook_receiver.verify(body, request.headers.get(SIGNATURE_HEADER), request.query_params.get('token')):
+        logger.warning("Rejected webhook notification with a missing or invalid signature")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    try:
+        notifications = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body must be JSON")
+    
+    if not message_broker:
+        raise HTTPException(status_code=503, detail="Message broker service is not available")
+    
+    # Publishing blocks on the broker, so it runs after the response, off the event loop
+    background_tasks.add_task(webhook_receiver.enqueue, notifications)
+    return {
+        "status": "accepted",
+        "notifications": len(notifications) if isinstance(notifications, list) else 1
+    }
+
+def dead_letter_source(queue_name: str):
+    """
+    Validate the queue whose dead letters are being accessed
+    Only queues the workers consume can have dead letters, and looking up any other name would
+    declare a durable .dlq queue for it
+    """
+    if not message_broker:
+        raise HTTPException(status_code=503, detail="Message broker service is not available")
+    if queue_name.endswith('.dlq') or '.retry.' in queue_name:
+        raise HTTPException(status_code=400, detail="Use the name of the original queue, e.g. sync_queue")
+    if queue_name not in set(WORKER_QUEUES) | set(SYNC_QUEUES.values()):
+        raise HTTPException(status_code=404, detail=f"Unknown queue: {queue_name}")
+    return queue_name
+
+@app.get("/dead-letters/{queue_name}")
+def get_dead_letters(queue_name: str, limit: int = 50):
+    """
+    Endpoint to inspect messages that failed every retry on a queue, without removing them
+    """
+    queue_name = dead_letter_source(queue_name)
+    messages = message_broker.dead_letters(queue_name, limit=max(1, min(limit, 500)))
+    return {
+        "queue": queue_name,
+        "count": len(messages),
+        "messages": messages
+    }
+
+@app.post("/dead-letters/{queue_name}/replay")
+def replay_dead_letters(queue_name: str, limit: int = None):
+    """
+    Endpoint to send dead-lettered messages back to their queue for another round of attempts
+    """
+    queue_name = dead_letter_source(queue_name)
+    logger.info("Received request to replay dead letters for {}", queue_name)
+    replayed = message_broker.replay_dead_letters(queue_name, limit=limit)
+    return {
+        "status": "accepted",
+        "queue": queue_name,
+        "replayed": replayed
+    }
+
 if __name__ == "__main__":
     uvicorn.run("API:app", host="0.0.0.0", port=8000, reload=True)
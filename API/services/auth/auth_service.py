@@ -5,6 +5,13 @@ import os
 from loguru import logger
 from dotenv import load_dotenv
 
+def config_file_path(config_file_name):
+    """A config file named on its own lives in API/resources; a path (e.g. from BB_CONFIG_PATH) is used as given"""
+    if os.path.dirname(config_file_name):
+        return config_file_name
+    return os.path.join('API', 'resources', config_file_name)
+
+
 class AuthService:
     """
     Authentication Service for Blackbaud SKY API
@@ -12,7 +19,7 @@ class AuthService:
     """
     _instance = None
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(AuthService, cls).__new__(cls)
             cls._instance.initialized = False
@@ -27,7 +34,7 @@ class AuthService:
         # Support both .ini and .json config files
         if config_file_name.endswith('.ini'):
             self.config = ConfigParser()
-            self.config.read(os.path.join('API', 'resources', config_file_name))
+            self.config.read(config_file_path(config_file_name))
             self.token_uri = 'https://oauth2.sky.blackbaud.com/token'
             self.auth_uri = 'https://oauth2.sky.blackbaud.com/authorization'
             self.redirect_uri = self.config['other']['redirect_uri']
@@ -35,7 +42,7 @@ class AuthService:
             self.app_secret = self.config['app_secrets']['app_secret']
             self.api_subscription_key = self.config['other']['api_subscription_key']
         else:
-            with open(os.path.join('API', 'resources', config_file_name), 'r') as f:
+            with open(config_file_path(config_file_name), 'r') as f:
                 self.config = json.load(f)
             self.token_uri = 'https://oauth2.sky.blackbaud.com/token'
             self.auth_uri = 'https://oauth2.sky.blackbaud.com/authorization'
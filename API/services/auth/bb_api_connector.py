@@ -3,7 +3,8 @@ import json
 import os
 from loguru import logger
 from dotenv import load_dotenv
-from .auth_service import AuthService
+from .auth_service import AuthService, config_file_path
+from API.services.resilience.circuit_breaker import get_circuit_breaker, SKY_API_CIRCUIT
 
 class BbApiConnector:
     """
@@ -12,7 +13,7 @@ class BbApiConnector:
     """
     _instance = None
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(BbApiConnector, cls).__new__(cls)
             cls._instance.initialized = False
@@ -31,14 +32,16 @@ class BbApiConnector:
         if config_file_name.endswith('.ini'):
             from configparser import ConfigParser
             config = ConfigParser()
-            config.read(os.path.join('API', 'resources', config_file_name))
+            config.read(config_file_path(config_file_name))
             self.test_api_endpoint = config['other']['test_api_endpoint']
         else:
-            with open(os.path.join('API', 'resources', config_file_name), 'r') as f:
+            with open(config_file_path(config_file_name), 'r') as f:
                 config = json.load(f)
             self.test_api_endpoint = config['other']['test_api_endpoint']
         
         self.session = None
+        # Shared with the worker, which pauses consumption while the SKY API is down
+        self.circuit_breaker = get_circuit_breaker(SKY_API_CIRCUIT)
         self.initialized = True
 
     def get_session(self):
@@ -106,9 +109,16 @@ class BbApiConnector:
     def make_request(self, method, url, **kwargs):
         """
         Make a request to the Blackbaud API with automatic token refresh
+        Connection errors, timeouts, 429s and 5xx responses count against the SKY API circuit
+        breaker; while it is open requests fail fast, returning None without being sent
         """
+        if not self.circuit_breaker.allow_request():
+            logger.debug("SKY API circuit is open, not requesting {}", url)
+            return None
+        
         session = self.get_session()
         if not session:
+            self.circuit_breaker.release()  # an auth problem, not an outage
             return None
             
         try:
@@ -122,15 +132,21 @@ class BbApiConnector:
                 if refresh_result:
                     # Update session headers with new token and retry request
                     session.headers.update(self.auth_service.get_auth_headers())
-                    return session.request(method, url, **kwargs)
+                    response = session.request(method, url, **kwargs)
                 else:
                     logger.error("Failed to refresh access token")
+                    self.circuit_breaker.release()
                     return None
-                    
+            
+            if response.status_code == 429 or response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
             return response
             
         except Exception as e:
             logger.error(f"Error making request: {str(e)}")
+            self.circuit_breaker.record_failure()
             return None
             
     def get_constituent(self, altru_id):
@@ -142,41 +158,75 @@ class BbApiConnector:
             return response.json()
         return None
         
-    def get_events(self, start_date, end_date):
-        """Get events from Blackbaud API"""
+    def get_constituents(self, modified_since=None, offset=None, limit=None):
+        """
+        Get constituents changed since a timestamp from Blackbaud API, a page at a time with offset/limit
+        Returns None if the request failed, so a failure is never mistaken for no changes
+        """
+        url = "https://api.sky.blackbaud.com/altru/v1/constituents"
+        params = self._build_range_params(None, None, modified_since, offset, limit)
+        response = self.make_request("GET", url, params=params)
+        
+        if response and response.status_code == 200:
+            return response.json().get('value', [])
+        return None
+        
+    def get_events(self, start_date=None, end_date=None, modified_since=None, offset=None, limit=None):
+        """
+        Get events from Blackbaud API, a page at a time when given offset/limit
+        Returns None if the request failed, so a failure is never mistaken for no events
+        """
         url = "https://api.sky.blackbaud.com/altru/v1/events"
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
+        params = self._build_range_params(start_date, end_date, modified_since, offset, limit)
         response = self.make_request("GET", url, params=params)
         
         if response and response.status_code == 200:
             return response.json().get('value', [])
-        return []
+        return None
         
-    def get_tickets(self, start_date, end_date):
-        """Get ticket/wristband data from Blackbaud API"""
+    def get_tickets(self, start_date=None, end_date=None, modified_since=None, offset=None, limit=None, event_id=None):
+        """
+        Get ticket/wristband data from Blackbaud API, optionally for a single event
+        Returns None if the request failed, so a failure is never mistaken for an empty page
+        """
         url = "https://api.sky.blackbaud.com/altru/v1/registrants/tickets"
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
+        params = self._build_range_params(start_date, end_date, modified_since, offset, limit, event_id)
         response = self.make_request("GET", url, params=params)
         
         if response and response.status_code == 200:
             return response.json().get('value', [])
-        return []
+        return None
         
-    def get_parking_passes(self, start_date, end_date):
-        """Get parking pass data from Blackbaud API"""
+    def get_parking_passes(self, start_date=None, end_date=None, modified_since=None, offset=None, limit=None, event_id=None):
+        """
+        Get parking pass data from Blackbaud API, optionally for a single event
+        Returns None if the request failed, so a failure is never mistaken for an empty page
+        """
         url = "https://api.sky.blackbaud.com/altru/v1/parkingpasses"
-        params = {
-            'start_date': start_date,
-            'end_date': end_date
-        }
+        params = self._build_range_params(start_date, end_date, modified_since, offset, limit, event_id)
         response = self.make_request("GET", url, params=params)
         
         if response and response.status_code == 200:
             return response.json().get('value', [])
-        return []
\ No newline at end of file
+        return None
+
+    def _build_range_params(self, start_date, end_date, modified_since, offset=None, limit=None, event_id=None):
+        """
+        Build query parameters for list endpoints
+        Delta syncs pass only modified_since; range syncs pass the date window,
+        and checkpointed syncs page through it with offset/limit.
+        Event-day polls narrow a delta to one event with event_id
+        """
+        params = {}
+        if event_id:
+            params['event_id'] = event_id
+        if start_date:
+            params['start_date'] = start_date
+        if end_date:
+            params['end_date'] = end_date
+        if modified_since:
+            params['last_modified'] = modified_since
+        if limit:
+            params['limit'] = limit
+            params['offset'] = offset or 0
+        return params
@@ -0,0 +1,148 @@
+"""
+Queue-depth-driven scaling of a worker's consumer threads.
+"""
+
+import os
+import json
+import time
+from collections import deque
+from datetime import datetime
+from loguru import logger
+
+
+class ConsumerAutoscaler:
+    """
+    Scales a Worker's consumer threads per queue between configured bounds
+
+    Every WORKER_AUTOSCALE_INTERVAL seconds (default 10) it reads each queue's depth from the
+    broker and how busy its consumers were since the last poll (the fraction of their time spent
+    handling messages). A queue scales up by one consumer once its backlog has stayed above
+    WORKER_SCALE_UP_BACKLOG messages per consumer (default 20) for WORKER_SCALE_UP_PERIODS polls
+    (default 2), and down by one once it has been empty with utilization under
+    WORKER_SCALE_DOWN_UTILIZATION (default 0.3) for WORKER_SCALE_DOWN_PERIODS polls (default 6).
+    The gap between the two conditions and the longer wait before scaling down keep the consumer
+    count from flapping.
+
+    A queue never drops below the worker's consumer_count and never exceeds
+    WORKER_MAX_CONSUMERS_<QUEUE>, falling back to WORKER_MAX_CONSUMERS (default 8). Every decision
+    is logged and kept in metrics(), which is also written to WORKER_METRICS_FILE as JSON if set.
+    """
+    def __init__(self, worker, interval=None):
+        self.worker = worker
+        self.message_broker = worker.message_broker
+        self.interval = float(interval or os.getenv('WORKER_AUTOSCALE_INTERVAL', '10'))
+        self.scale_up_backlog = float(os.getenv('WORKER_SCALE_UP_BACKLOG', '20'))
+        self.scale_up_periods = int(os.getenv('WORKER_SCALE_UP_PERIODS', '2'))
+        self.scale_down_utilization = float(os.getenv('WORKER_SCALE_DOWN_UTILIZATION', '0.3'))
+        self.scale_down_periods = int(os.getenv('WORKER_SCALE_DOWN_PERIODS', '6'))
+        self.metrics_file = os.getenv('WORKER_METRICS_FILE')
+
+        self.last_poll = None
+        self.decisions = deque(maxlen=100)
+        self.queues = {}
+        for queue_name, _, _ in worker.queues:
+            minimum = worker.consumer_count(queue_name)
+            default_maximum = os.getenv('WORKER_MAX_CONSUMERS', '8')
+            maximum = int(os.getenv(f"WORKER_MAX_CONSUMERS_{queue_name.upper().replace('.', '_')}", default_maximum))
+            self.queues[queue_name] = {
+                'min_consumers': minimum,
+                'max_consumers': max(minimum, maximum),
+                'consumers': minimum,
+                'depth': None,
+                'utilization': None,
+                'busy_seconds': worker.busy_seconds(queue_name),
+                'up_streak': 0,
+                'down_streak': 0,
+                'scale_ups': 0,
+                'scale_downs': 0
+            }
+
+    def poll(self):
+        """Take a scaling decision for every queue if the interval has passed since the last one"""
+        now = time.monotonic()
+        if self.last_poll is not None and now - self.last_poll < self.interval:
+            return
+        elapsed = now - self.last_poll if self.last_poll is not None else None
+        self.last_poll = now
+
+        for queue_name, state in self.queues.items():
+            try:
+                self.poll_queue(queue_name, state, elapsed)
+            except Exception as e:
+                logger.error(f"Error autoscaling consumers for {queue_name}: {e}")
+
+        if self.metrics_file:
+            self.write_metrics()
+
+    def poll_queue(self, queue_name, state, elapsed):
+        consumers = self.worker.active_consumers(queue_name)
+        busy_seconds = self.worker.busy_seconds(queue_name)
+        depth = self.message_broker.queue_depth(queue_name)
+
+        state['consumers'] = consumers
+        state['depth'] = depth
+        if elapsed and consumers:
+            state['utilization'] = round(min(1.0, (busy_seconds - state['busy_seconds']) / (elapsed * consumers)), 3)
+        state['busy_seconds'] = busy_seconds
+
+        if depth is None or state['utilization'] is None:
+            # Without a reading there is nothing to go on; keep the current consumers
+            return
+
+        if consumers < state['max_consumers'] and depth / max(consumers, 1) > self.scale_up_backlog:
+            state['up_streak'] += 1
+        else:
+            state['up_streak'] = 0
+
+        if consumers > state['min_consumers'] and depth == 0 and state['utilization'] < self.scale_down_utilization:
+            state['down_streak'] += 1
+        else:
+            state['down_streak'] = 0
+
+        if state['up_streak'] >= self.scale_up_periods:
+            self.worker.add_consumer(queue_name)
+            self.record(queue_name, state, 'scale_up', consumers + 1)
+        elif state['down_streak'] >= self.scale_down_periods:
+            self.worker.remove_consumer(queue_name)
+            self.record(queue_name, state, 'scale_down', consumers - 1)
+
+    def record(self, queue_name, state, action, consumers):
+        state['up_streak'] = 0
+        state['down_streak'] = 0
+        state['scale_ups' if action == 'scale_up' else 'scale_downs'] += 1
+        state['consumers'] = consumers
+
+        decision = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'queue': queue_name,
+            'action': action,
+            'consumers': consumers,
+            'depth': state['depth'],
+            'utilization': state['utilization']
+        }
+        self.decisions.append(decision)
+        logger.info(
+            f"Autoscaler {action} on {queue_name} to {consumers} consumers "
+            f"(depth {state['depth']}, utilization {state['utilization']})"
+        )
+
+    def metrics(self):
+        """Current consumers, depth, utilization and scaling counts per queue, plus recent decisions"""
+        return {
+            'pid': os.getpid(),
+            'queues': {
+                queue_name: {key: value for key, value in state.items() if not key.endswith('_streak')}
+                for queue_name, state in self.queues.items()
+            },
+            'decisions': list(self.decisions)
+        }
+
+    def write_metrics(self):
+        """Write metrics() to WORKER_METRICS_FILE; {pid} in the path gives each worker process its own file"""
+        path = self.metrics_file.format(pid=os.getpid())
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.metrics(), f, indent=2)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.error(f"Failed to write worker metrics to {path}: {e}")
@@ -1,4 +1,11 @@
 from .customers import CustomerSyncService
 from .events import EventSyncService
 from .wristbands import WristbandSyncService
-from .parking_passes import ParkingPassSyncService
\ No newline at end of file
+from .parking_passes import ParkingPassSyncService
+from .sync_state import SyncStateService, SYNC_MODE_FULL, SYNC_MODE_DELTA
+from .orchestrator import SyncOrchestrator
+from .checkpoint import SyncRunService
+from .backfill import BackfillCoordinator
+from .dedup import SyncRequestRegistry
+from .event_day import EventDaySyncService
+from .availability import ParkingAvailabilityCache
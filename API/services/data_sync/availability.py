@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from loguru import logger
+
+# Limits on the parking passes sold per event, by pass type
+PASS_TYPE_LIMITS = {
+    'General': 800,
+    'Premium': 60,
+    'Catering': 30,
+    'Buck Road': 40
+}
+
+# Fanout exchange of parking pass sync completions, mirrored from parking_pass_sync_events since
+# the workers drain that queue themselves. Every API process subscribes with a queue of its own
+PARKING_AVAILABILITY_EXCHANGE = 'parking_availability_events'
+
+
+class ParkingAvailabilityCache:
+    """
+    In-process cache of each event's remaining parking passes by pass type
+
+    A miss counts the event's passes per type in one GROUP BY query; concurrent misses for the
+    same event share that query. Entries are dropped when a parking pass sync that changed the
+    event completes (see handle_sync_event, subscribed to PARKING_AVAILABILITY_EXCHANGE) and
+    expire after PARKING_AVAILABILITY_TTL_SECONDS (default 30) in any case, which bounds
+    staleness should a completion message be missed while the broker is unreachable.
+    """
+    def __init__(self, db_service, ttl=None):
+        self.db_service = db_service
+        self.ttl = float(ttl or os.getenv('PARKING_AVAILABILITY_TTL_SECONDS', '30'))
+        self._entries = {}  # event ID -> (expires at, availability)
+        self._loading = {}  # event ID -> lock held while its availability is queried
+        self._generation = 0  # bumped by every invalidation, so a load it overlaps is not cached
+        self._lock = threading.Lock()
+
+    def get(self, event_id):
+        """An event's parking availability, or None if it could not be read from the database"""
+        key = str(event_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        try:
+            with loading:
+                # Another request may have loaded it while this one waited
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+
+                generation = self._generation
+                availability = self.load(event_id)
+                if availability is None:
+                    return None
+                with self._lock:
+                    if generation == self._generation:
+                        self._entries[key] = (time.monotonic() + self.ttl, availability)
+                return availability
+        finally:
+            # Forget the lock once no request holds it, so there is not one left behind per event ever asked for
+            with self._lock:
+                if self._loading.get(key) is loading and not loading.locked():
+                    del self._loading[key]
+
+    def load(self, event_id):
+        """Count an event's issued passes per type and work out what is left of each type's limit"""
+        rows = self.db_service.execute_query(
+            """
+                SELECT pt.PassTypes, COUNT(*)
+                FROM ParkingPasses pp
+                JOIN PassTypes pt ON pt.PP_id = pp.PP_id
+                WHERE pp.Event_ID = %s
+                GROUP BY pt.PassTypes
+            """,
+            (event_id,),
+            fetch=True
+        )
+        if rows is None:
+            return None
+
+        issued = {pass_type: count for pass_type, count in rows}
+        pass_types = []
+        for pass_type in list(PASS_TYPE_LIMITS) + sorted(set(issued) - set(PASS_TYPE_LIMITS)):
+            limit = PASS_TYPE_LIMITS.get(pass_type)
+            count = issued.get(pass_type, 0)
+            pass_types.append({
+                'pass_type': pass_type,
+                'limit': limit,
+                'issued': count,
+                'available': max(0, limit - count) if limit is not None else None
+            })
+        return {
+            'event_id': event_id,
+            'pass_types': pass_types,
+            'as_of': datetime.now().isoformat(timespec='seconds')
+        }
+
+    def invalidate(self, event_ids=None):
+        """Drop the cached availability of the given events, or of every event"""
+        with self._lock:
+            self._generation += 1
+            if event_ids is None:
+                self._entries.clear()
+            else:
+                for event_id in event_ids:
+                    self._entries.pop(str(event_id), None)
+
+    def handle_sync_event(self, ch, method, properties, body):
+        """Handle parking pass sync completions, dropping the availability of the events they changed"""
+        try:
+            message = json.loads(body)
+            if message.get('event') != 'parking_pass_sync_completed':
+                return
+            event_ids = message.get('event_ids')
+            self.invalidate(event_ids)
+            logger.debug("Parking availability invalidated for {}", event_ids if event_ids is not None else 'every event')
+        except Exception as e:
+            logger.error("Error handling parking availability message: {}", e)
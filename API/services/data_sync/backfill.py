@@ -0,0 +1,152 @@
+import os
+from loguru import logger
+from .ranges import split_date_range, parse_date
+
+BACKFILL_QUEUE = 'backfill_queue'
+BACKFILL_EVENTS_QUEUE = 'backfill_events'
+
+SHARD_STATUS_PENDING = 'pending'
+SHARD_STATUS_RUNNING = 'running'
+SHARD_STATUS_COMPLETED = 'completed'
+SHARD_STATUS_FAILED = 'failed'
+
+
+class BackfillCoordinator:
+    """
+    Splits a long date range into shard jobs that every worker replica can consume in parallel
+
+    Planning records the backfill and its shards in the Backfills and BackfillShards tables and
+    publishes one message per shard to the backfill queue. Each shard is synced independently,
+    and whichever worker finishes the last shard publishes the single completion event.
+    """
+    def __init__(self, db_service, message_broker, sync_orchestrator, shard_days=None):
+        self.db_service = db_service
+        self.message_broker = message_broker
+        self.sync_orchestrator = sync_orchestrator
+        self.shard_days = int(shard_days or os.getenv('BACKFILL_SHARD_DAYS', '1'))
+        self.threshold_days = int(os.getenv('BACKFILL_THRESHOLD_DAYS', '7'))
+
+    def should_backfill(self, start_date, end_date) -> bool:
+        """Whether a range is long enough to be fanned out rather than synced by one worker"""
+        return (parse_date(end_date) - parse_date(start_date)).days > self.threshold_days
+
+    def plan(self, start_date, end_date):
+        """
+        Record a backfill and publish one job per shard
+        Returns the backfill ID, or None if the backfill could not be recorded
+        """
+        shards = split_date_range(start_date, end_date, self.shard_days)
+
+        backfill_id = self.db_service.execute_query(
+            "INSERT INTO Backfills (StartDate, EndDate, ShardCount) VALUES (%s, %s, %s)",
+            (start_date, end_date, len(shards))
+        )
+        if not backfill_id:
+            logger.error("Failed to record backfill from {} to {}", start_date, end_date)
+            return None
+
+        if not self.db_service.execute_many(
+            "INSERT INTO BackfillShards (Backfill_id, StartDate, EndDate) VALUES (%s, %s, %s)",
+            [(backfill_id, shard_start, shard_end) for shard_start, shard_end in shards]
+        ):
+            logger.error("Failed to record shards for backfill {}", backfill_id)
+            return None
+
+        result = self.db_service.execute_query(
+            "SELECT Shard_id, StartDate, EndDate FROM BackfillShards WHERE Backfill_id = %s ORDER BY StartDate",
+            (backfill_id,),
+            fetch=True
+        ) or []
+
+        self.message_broker.declare_queue(BACKFILL_QUEUE)
+        for shard_id, shard_start, shard_end in result:
+            self.message_broker.publish_message(
+                BACKFILL_QUEUE,
+                {
+                    'type': 'backfill_shard',
+                    'backfill_id': backfill_id,
+                    'shard_id': shard_id,
+                    'start_date': shard_start.strftime('%Y-%m-%d'),
+                    'end_date': shard_end.strftime('%Y-%m-%d')
+                }
+            )
+
+        logger.info("Planned backfill {} from {} to {} as {} shards", backfill_id, start_date, end_date, len(result))
+        return backfill_id
+
+    def run_shard(self, message, final_attempt=True) -> bool:
+        """
+        Sync one shard of a backfill and record its outcome
+        A failed shard goes back to pending unless this is its final attempt, so the backfill
+        only finishes once every shard has succeeded or run out of attempts
+        """
+        backfill_id = message.get('backfill_id')
+        shard_id = message.get('shard_id')
+        start_date = message.get('start_date')
+        end_date = message.get('end_date')
+
+        logger.info("Running backfill {} shard {} from {} to {}", backfill_id, shard_id, start_date, end_date)
+        self.db_service.execute_query(
+            "UPDATE BackfillShards SET Status = %s, Attempts = Attempts + 1 WHERE Shard_id = %s",
+            (SHARD_STATUS_RUNNING, shard_id)
+        )
+
+        try:
+            success = self.sync_orchestrator.range_sync(start_date, end_date)
+        except Exception as e:
+            logger.error("Backfill {} shard {} failed: {}", backfill_id, shard_id, e)
+            success = False
+
+        self.db_service.execute_query(
+            "UPDATE BackfillShards SET Status = %s WHERE Shard_id = %s",
+            (SHARD_STATUS_COMPLETED if success else SHARD_STATUS_FAILED if final_attempt else SHARD_STATUS_PENDING, shard_id)
+        )
+        self.finish_if_complete(backfill_id)
+        return success
+
+    def finish_if_complete(self, backfill_id):
+        """
+        Mark the backfill finished once no shard is pending or running
+        The conditional update succeeds for exactly one worker, which publishes the completion event
+        """
+        claimed = self.db_service.execute_query(
+            """
+                UPDATE Backfills SET Status = 'completed', CompletedAt = NOW()
+                WHERE Backfill_id = %s AND Status = 'running'
+                AND NOT EXISTS (
+                    SELECT 1 FROM BackfillShards
+                    WHERE Backfill_id = %s AND Status IN (%s, %s)
+                )
+            """,
+            (backfill_id, backfill_id, SHARD_STATUS_PENDING, SHARD_STATUS_RUNNING)
+        )
+        if claimed != 1:
+            return False
+
+        result = self.db_service.execute_query(
+            """
+                SELECT b.StartDate, b.EndDate, b.ShardCount, SUM(s.Status = %s)
+                FROM Backfills b JOIN BackfillShards s ON s.Backfill_id = b.Backfill_id
+                WHERE b.Backfill_id = %s
+                GROUP BY b.Backfill_id, b.StartDate, b.EndDate, b.ShardCount
+            """,
+            (SHARD_STATUS_FAILED, backfill_id),
+            fetch=True
+        )
+        start_date, end_date, shard_count, failed_count = result[0] if result else (None, None, 0, 0)
+        failed_count = int(failed_count or 0)
+
+        logger.info("Backfill {} finished: {}/{} shards succeeded", backfill_id, shard_count - failed_count, shard_count)
+        self.message_broker.publish_message(
+            BACKFILL_EVENTS_QUEUE,
+            {
+                'event': 'backfill_completed',
+                'backfill_id': backfill_id,
+                'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
+                'end_date': end_date.strftime('%Y-%m-%d') if end_date else None,
+                'shard_count': shard_count,
+                'failed_count': failed_count,
+                'status': 'success' if failed_count == 0 else 'partial_failure'
+            }
+        )
+        return True
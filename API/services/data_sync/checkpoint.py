@@ -0,0 +1,129 @@
+import os
+from loguru import logger
+
+RUN_STATUS_RUNNING = 'running'
+RUN_STATUS_COMPLETED = 'completed'
+RUN_STATUS_PARTIAL_FAILURE = 'partial_failure'
+
+
+class SyncRunService:
+    """
+    Service responsible for checkpointing long-running range syncs in the SyncRuns table
+
+    A run is identified by its entity and date range. Progress (the shard being synced, the page
+    offset within it and the last record written) is saved at every chunk boundary, so a job that
+    is redelivered or re-requested after a worker dies picks up where the last checkpoint left off.
+    """
+    def __init__(self, db_service, page_size=None, shard_days=None):
+        self.db_service = db_service
+        self.page_size = int(page_size or os.getenv('SYNC_PAGE_SIZE', '500'))
+        self.shard_days = int(shard_days or os.getenv('SYNC_CHECKPOINT_SHARD_DAYS', '1'))
+
+    @staticmethod
+    def run_key(entity, start_date, end_date):
+        """Build the key that identifies a run of an entity over a date range"""
+        return f'{entity}:{start_date}..{end_date}'
+
+    def start_or_resume(self, entity, start_date, end_date):
+        """
+        Resume the unfinished run for this entity and range, or start a new one
+        Returns a run dict with run_id, shard_start, page_cursor, last_record_id and resumed
+        """
+        run_key = self.run_key(entity, start_date, end_date)
+
+        query = """
+            SELECT Run_id, ShardStart, PageCursor, LastRecordId FROM SyncRuns
+            WHERE Run_key = %s AND Status = %s
+            ORDER BY Run_id DESC LIMIT 1
+        """
+        result = self.db_service.execute_query(query, (run_key, RUN_STATUS_RUNNING), fetch=True)
+
+        if result and result[0]:
+            run_id, shard_start, page_cursor, last_record_id = result[0]
+            if shard_start is not None and not isinstance(shard_start, str):
+                shard_start = shard_start.strftime('%Y-%m-%d')
+            logger.info(
+                "Resuming {} run {} at shard {} offset {} (last record: {})",
+                run_key, run_id, shard_start, page_cursor, last_record_id
+            )
+            return {
+                'run_id': run_id,
+                'shard_start': shard_start,
+                'page_cursor': page_cursor or 0,
+                'last_record_id': last_record_id,
+                'resumed': True
+            }
+
+        insert_query = """
+            INSERT INTO SyncRuns (Run_key, Entity, StartDate, EndDate, Status)
+            VALUES (%s, %s, %s, %s, %s)
+        """
+        run_id = self.db_service.execute_query(
+            insert_query, (run_key, entity, start_date, end_date, RUN_STATUS_RUNNING)
+        )
+        if not run_id:
+            # Syncing without checkpoints is still better than not syncing
+            logger.warning("Failed to record sync run for {}, continuing without checkpoints", run_key)
+            run_id = None
+
+        return {
+            'run_id': run_id,
+            'shard_start': None,
+            'page_cursor': 0,
+            'last_record_id': None,
+            'resumed': False
+        }
+
+    def checkpoint(self, run, shard_start, page_cursor, last_record_id=None):
+        """Persist progress after a chunk has been fully written"""
+        run['shard_start'] = shard_start
+        run['page_cursor'] = page_cursor
+        if last_record_id is not None:
+            run['last_record_id'] = str(last_record_id)
+
+        if not run['run_id']:
+            return False
+
+        query = """
+            UPDATE SyncRuns SET ShardStart = %s, PageCursor = %s, LastRecordId = %s
+            WHERE Run_id = %s
+        """
+        result = self.db_service.execute_query(
+            query, (shard_start, page_cursor, run['last_record_id'], run['run_id'])
+        )
+        return result is not None
+
+    def finish(self, run, status=RUN_STATUS_COMPLETED):
+        """Mark a run as finished so the next request for the same range starts afresh"""
+        if not run['run_id']:
+            return False
+
+        query = "UPDATE SyncRuns SET Status = %s WHERE Run_id = %s"
+        return self.db_service.execute_query(query, (status, run['run_id'])) is not None
+
+    def claim_interrupted_runs(self, stale_minutes=None):
+        """
+        Claim runs still marked running that have not checkpointed recently
+        These belong to workers that died mid-sync and need to be re-requested. Each run is
+        claimed by touching its UpdatedAt with a conditional update, so when several workers
+        start together only one of them re-requests it.
+        Returns a list of (entity, start_date, end_date) tuples
+        """
+        stale_minutes = int(stale_minutes or os.getenv('SYNC_RUN_STALE_MINUTES', '15'))
+        query = """
+            SELECT Run_id, Entity, StartDate, EndDate FROM SyncRuns
+            WHERE Status = %s AND UpdatedAt < NOW() - INTERVAL %s MINUTE
+        """
+        result = self.db_service.execute_query(query, (RUN_STATUS_RUNNING, stale_minutes), fetch=True)
+        if not result:
+            return []
+
+        claim_query = """
+            UPDATE SyncRuns SET UpdatedAt = NOW()
+            WHERE Run_id = %s AND Status = %s AND UpdatedAt < NOW() - INTERVAL %s MINUTE
+        """
+        claimed = []
+        for run_id, entity, start_date, end_date in result:
+            if self.db_service.execute_query(claim_query, (run_id, RUN_STATUS_RUNNING, stale_minutes)) == 1:
+                claimed.append((entity, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+        return claimed
@@ -0,0 +1,160 @@
+"""
+Column-wise normalization of sync batches into bulk-insert parameter rows
+
+A page of decoded records is split into one list per field, each column is normalized and
+validated in a single comprehension (or array conversion), and the columns are zipped back into
+the parameter tuples passed to executemany. This keeps the per-record work to a handful of
+C-level operations instead of a chain of Python calls per field.
+"""
+import os
+import re
+from array import array
+from datetime import datetime
+from operator import attrgetter
+from zoneinfo import ZoneInfo
+
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}').match
+
+
+def column(records, field):
+    """Extract one field from every record"""
+    return list(map(attrgetter(field), records))
+
+
+def tinyint_column(values):
+    """Map True/False/None flags to the 1/0/NULL stored in TINYINT columns"""
+    return [1 if value else (0 if value is False else None) for value in values]
+
+
+def datetime_column(values, timezone=None):
+    """
+    Normalize ISO 8601 timestamps to MySQL DATETIME strings, leaving unparseable values as None
+    Timestamps carrying a UTC offset are first converted to timezone (default SYNC_TIMEZONE, or the
+    server's local time zone if unset), so DATETIME columns hold a single clock; timestamps without
+    an offset are taken to be in it already
+    """
+    timezone = timezone or sync_timezone()
+    return [
+        _datetime_string(value, timezone) if value and _ISO_DATE(value) else None
+        for value in values
+    ]
+
+
+def sync_timezone():
+    """The time zone synced timestamps are stored in: SYNC_TIMEZONE, or None for the local time zone"""
+    name = os.getenv('SYNC_TIMEZONE')
+    return ZoneInfo(name) if name else None
+
+
+def _datetime_string(value, timezone):
+    # Offsets and Z follow the seconds, possibly after a fraction
+    offset = value[19:]
+    if not offset.endswith(('Z', 'z')) and '+' not in offset and '-' not in offset:
+        return value[:19].replace('T', ' ')
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + '+00:00' if offset.endswith(('Z', 'z')) else value)
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def date_column(values):
+    """Normalize ISO 8601 dates or timestamps to MySQL DATE strings, leaving unparseable values as None"""
+    return [value[:10] if value and _ISO_DATE(value) else None for value in values]
+
+
+def decimal_column(values, default=0.0):
+    """Coerce amounts to floats, substituting the default for missing or malformed values"""
+    try:
+        return array('d', [default if value is None or value == '' else float(value) for value in values])
+    except (TypeError, ValueError):
+        return array('d', [_to_float(value, default) for value in values])
+
+
+def _to_float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class ColumnBatch:
+    """
+    A batch of records held as named columns
+
+    Columns are added with add(), required columns mark the rows where they are missing
+    as invalid, and rows() zips the chosen columns back into parameter tuples for the
+    valid rows only.
+    """
+    def __init__(self, records):
+        self.records = records
+        self.size = len(records)
+        self.columns = {}
+        self.invalid = set()
+
+    def add(self, name, values, required=False):
+        """Add a column, optionally rejecting the rows where it is None"""
+        self.columns[name] = values
+        if required:
+            self.invalid.update(index for index, value in enumerate(values) if value is None)
+        return values
+
+    def rows(self, *names):
+        """Parameter tuples of the named columns for every valid row"""
+        rows = zip(*(self.columns[name] for name in names))
+        if not self.invalid:
+            return list(rows)
+        return [row for index, row in enumerate(rows) if index not in self.invalid]
+
+    def valid_indexes(self):
+        return [index for index in range(self.size) if index not in self.invalid]
+
+    def invalid_indexes(self):
+        return sorted(self.invalid)
+
+
+CUSTOMER_COLUMNS = (
+    'member_id', 'membership_level', 'first_name', 'last_name', 'phone', 'email', 'address1',
+    'address2', 'city', 'state', 'postal_code', 'attended', 'paid', 'cancelled', 'altru_id'
+)
+
+
+def customer_batch(records):
+    """Build the Customers columns, in upsert order, for a batch of ConstituentRecords"""
+    batch = ColumnBatch(records)
+    for field in CUSTOMER_COLUMNS[:11]:
+        batch.add(field, column(records, field))
+    batch.add('attended', tinyint_column(column(records, 'attended')))
+    batch.add('paid', tinyint_column(column(records, 'paid')))
+    batch.add('cancelled', [1 if status == 'Cancelled' else 0 for status in column(records, 'status')])
+    batch.add('altru_id', column(records, 'altru_id'), required=True)
+    return batch
+
+
+def ticket_batch(records):
+    """Build the Wristbands columns for a batch of TicketRecords"""
+    batch = ColumnBatch(records)
+    batch.add('event_id', column(records, 'event_id'), required=True)
+    batch.add('issued', datetime_column(column(records, 'issued_at')))
+    batch.add('ticket_id', column(records, 'id'), required=True)
+    return batch
+
+
+def parking_pass_batch(records):
+    """Build the ParkingPasses and PassTypes columns for a batch of ParkingPassRecords"""
+    batch = ColumnBatch(records)
+    batch.add('event_id', column(records, 'event_id'), required=True)
+    batch.add('issued', datetime_column(column(records, 'issued_at')))
+    batch.add('pass_id', column(records, 'id'), required=True)
+    batch.add('pass_type', column(records, 'pass_type'))
+    batch.add('cost', decimal_column(column(records, 'cost')))
+    return batch
+
+
+def event_batch(records):
+    """Build the Events columns for a batch of EventRecords"""
+    batch = ColumnBatch(records)
+    batch.add('constituent_id', column(records, 'constituent_id'))
+    batch.add('name', column(records, 'name'), required=True)
+    batch.add('event_date', date_column(column(records, 'start_date')), required=True)
+    return batch
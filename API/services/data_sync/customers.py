@@ -1,13 +1,38 @@
 from loguru import logger
 from mysql.connector import Error
+from API.services.message_broker.backend import MessageFailed
+from API.services.message_broker.sync_publisher import SyncEventPublisher
+from .sync_state import SyncStateService, SYNC_MODE_DELTA
+from .fingerprint import ChangeDetector, row_fingerprint
+from .records import ConstituentRecord
+from .columnar import customer_batch, CUSTOMER_COLUMNS
 
 class CustomerSyncService:
     """
     Service responsible for syncing customer data from the Blackbaud API to the local database
     """
+    ENTITY = 'customer'
+
+    # Customers upsert, now including MembershipLevel, Attended, Paid, Cancelled fields
+    UPSERT_QUERY = """
+            INSERT INTO Customers
+            (Member_id, MembershipLevel, Fname, Lname, Phone, Email, Address1, Address2,
+            City, State, Zip, Attended, Paid, Cancelled, Altru_id, RowHash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            MembershipLevel=VALUES(MembershipLevel),
+            Fname=VALUES(Fname), Lname=VALUES(Lname), Phone=VALUES(Phone),
+            Email=VALUES(Email), Address1=VALUES(Address1),
+            Address2=VALUES(Address2), City=VALUES(City), State=VALUES(State),
+            Zip=VALUES(Zip), Attended=VALUES(Attended), Paid=VALUES(Paid), 
+            Cancelled=VALUES(Cancelled), RowHash=VALUES(RowHash)
+        """
+
     def __init__(self, db_service, api_connector):
         self.db_service = db_service
         self.api_connector = api_connector
+        self.sync_state = SyncStateService(db_service)
+        self.change_detector = ChangeDetector(db_service, 'Customers', 'Altru_id')
         self.message_broker = None  # Will be set if event-driven
 
     def set_message_broker(self, message_broker):
@@ -16,6 +41,8 @@ class CustomerSyncService:
 
     def sync_customer(self, altru_id: str) -> bool:
         """Sync customer data from Altru to local database"""
+        publisher = SyncEventPublisher(self.message_broker, 'customer_sync_events')
+
         logger.info("Starting customer sync for Altru ID: {}", altru_id)
         
         # Get constituent from Blackbaud API
@@ -24,97 +51,159 @@ class CustomerSyncService:
             logger.error("Failed to fetch constituent data for Altru ID: {}", altru_id)
             return False
 
-        # Prepare query and data - now including MembershipLevel, Attended, Paid, Cancelled fields
-        query = """
-            INSERT INTO Customers
-            (Member_id, MembershipLevel, Fname, Lname, Phone, Email, Address1, Address2,
-            City, State, Zip, Attended, Paid, Cancelled, Altru_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-            MembershipLevel=VALUES(MembershipLevel),
-            Fname=VALUES(Fname), Lname=VALUES(Lname), Phone=VALUES(Phone),
-            Email=VALUES(Email), Address1=VALUES(Address1),
-            Address2=VALUES(Address2), City=VALUES(City), State=VALUES(State),
-            Zip=VALUES(Zip), Attended=VALUES(Attended), Paid=VALUES(Paid), 
-            Cancelled=VALUES(Cancelled)
-        """
-
-        # Extract membership level from constituent data if available
-        membership_level = constituent.get('membership', {}).get('level', None)
+        data = self.build_customer_row(constituent, altru_id)
+        row_hash = row_fingerprint(data)
         
-        # Extract attendance and payment status from constituent data if available
-        # Default values: Attended=NULL, Paid=NULL, Cancelled=NULL
-        attended = constituent.get('attended', None)  
-        paid = constituent.get('payment_status', {}).get('is_paid', None)
-        cancelled = constituent.get('status', '') == 'Cancelled'
-        
-        # Convert boolean values to 0/1 for MySQL TINYINT
-        attended = 1 if attended else (0 if attended is False else None)
-        paid = 1 if paid else (0 if paid is False else None)
-        cancelled = 1 if cancelled else 0
-
-        data = (
-            constituent.get('member_id'),
-            membership_level,
-            constituent.get('first_name'),
-            constituent.get('last_name'),
-            constituent.get('phone'),
-            constituent.get('email'),
-            constituent.get('address_lines', [None])[0],
-            constituent.get('address_lines', [None, None])[1],
-            constituent.get('city'),
-            constituent.get('state'),
-            constituent.get('postal_code'),
-            attended,
-            paid,
-            cancelled,
-            altru_id
-        )
-
-        # Execute the query
-        result = self.db_service.execute_query(query, data)
+        # Skip the write entirely if the stored row already matches
+        changed, skipped_count = self.change_detector.filter_changed([(altru_id, row_hash, data)])
+        if skipped_count:
+            logger.info("Customer data unchanged for Altru ID: {}", altru_id)
+            result = True
+        else:
+            # Execute the query
+            result = self.upsert_customer(data, row_hash)
         
         if result:
             logger.info("Successfully synced customer data for Altru ID: {}", altru_id)
             
-            # Publish event for successful sync if message broker is available
-            if self.message_broker:
-                self.message_broker.publish_message(
-                    'customer_sync_events', 
-                    {
-                        'event': 'customer_synced',
-                        'altru_id': altru_id,
-                        'status': 'success'
-                    }
-                )
+            # Publish event for successful sync
+            publisher.summary(
+                {
+                    'event': 'customer_synced',
+                    'altru_id': altru_id,
+                    'status': 'success',
+                    'changed': not skipped_count
+                }
+            )
             return True
         else:
             logger.error("Failed to sync customer data for Altru ID: {}", altru_id)
             
-            # Publish event for failed sync if message broker is available
-            if self.message_broker:
-                self.message_broker.publish_message(
-                    'customer_sync_events', 
-                    {
-                        'event': 'customer_sync_failed',
-                        'altru_id': altru_id,
-                        'status': 'failed'
-                    }
-                )
+            # Publish event for failed sync
+            publisher.summary(
+                {
+                    'event': 'customer_sync_failed',
+                    'altru_id': altru_id,
+                    'status': 'failed'
+                }
+            )
             return False
 
+    def sync_customers_delta(self) -> bool:
+        """
+        Sync every constituent modified since the customer watermark
+        On the first run there is no watermark, so all constituents are pulled once
+        """
+        publisher = SyncEventPublisher(self.message_broker, 'customer_sync_events')
+
+        modified_since = self.sync_state.get_watermark(self.ENTITY)
+        logger.info("Starting customer delta sync since {}", modified_since)
+
+        constituents = self.sync_state.fetch_changes(self.api_connector.get_constituents, modified_since)
+        if constituents is None:
+            # Not a quiet period, so nothing is recorded for the adaptive cadence
+            logger.error("Failed to fetch constituents changed since {}", modified_since)
+            return False
+        if not constituents:
+            logger.info("No constituents changed since {}", modified_since)
+            self.sync_state.record_changes(self.ENTITY, 0)
+            return True
+
+        success_count = 0
+        failed_count = 0
+
+        # Fingerprint the whole batch and compare against stored hashes in bulk
+        items = []
+        records = [ConstituentRecord.from_api(constituent) for constituent in constituents]
+        batch = customer_batch(records)
+        for data in batch.rows(*CUSTOMER_COLUMNS):
+            items.append((data[-1], row_fingerprint(data), data))
+        changed, skipped_count = self.change_detector.filter_changed(items)
+
+        # Constituents without an ID can't be matched to a Customers row
+        if batch.invalid:
+            logger.warning("Skipping {} constituents without an ID", len(batch.invalid))
+
+        results = self.upsert_customers([data + (row_hash,) for _, row_hash, data in changed])
+        for (altru_id, _, _), result in zip(changed, results):
+            if result:
+                success_count += 1
+            else:
+                failed_count += 1
+                logger.error("Failed to sync customer data for Altru ID: {}", altru_id)
+
+        total = success_count + failed_count + skipped_count
+        logger.info(
+            "Synced {}/{} customers since {} (Changed: {}, Unchanged: {})",
+            success_count + skipped_count, total, modified_since, success_count, skipped_count
+        )
+
+        # Only move the watermark once every changed record is stored, otherwise retry them next run
+        if failed_count == 0:
+            self.sync_state.advance_watermark(self.ENTITY, self.sync_state.high_water_mark(records))
+        self.sync_state.record_changes(self.ENTITY, success_count)
+
+        publisher.summary(
+            {
+                'event': 'customers_sync_completed',
+                'mode': SYNC_MODE_DELTA,
+                'modified_since': modified_since,
+                'success_count': success_count,
+                'failed_count': failed_count,
+                'changed_count': success_count,
+                'skipped_count': skipped_count,
+                'total': total
+            }
+        )
+
+        return failed_count == 0
+
+    def upsert_customer(self, data, row_hash):
+        """Write a single customer row, with its content fingerprint, to the Customers table"""
+        return self.db_service.execute_query(self.UPSERT_QUERY, data + (row_hash,))
+
+    def upsert_customers(self, rows):
+        """
+        Write customer rows, each ending with its fingerprint, as one batch
+        If the batch fails each row is retried on its own so one bad row doesn't fail the rest.
+        Returns each row's outcome
+        """
+        if not rows:
+            return []
+        if self.db_service.execute_many(self.UPSERT_QUERY, rows):
+            return [True] * len(rows)
+        logger.warning("Batch upsert of {} customers failed, retrying row by row", len(rows))
+        return [bool(self.db_service.execute_query(self.UPSERT_QUERY, row)) for row in rows]
+
+    def build_customer_row(self, constituent, altru_id):
+        """Map a constituent record to the Customers column values"""
+        batch = customer_batch([ConstituentRecord.from_api(constituent, altru_id)])
+        return batch.rows(*CUSTOMER_COLUMNS)[0]
+
     def handle_customer_sync_message(self, ch, method, properties, body):
-        """Handle customer sync messages from the message broker"""
+        """Handle customer sync messages from the message broker, raising MessageFailed if the sync fails so it is retried"""
         try:
             import json
             message = json.loads(body)
             logger.info("Received customer sync message: {}", message)
             
+            # Notifications published by the sync services share this queue; only act on requests
+            if message.get('event'):
+                return
+            
             altru_id = message.get('altru_id')
             if not altru_id:
+                if message.get('mode') == SYNC_MODE_DELTA:
+                    if not self.sync_customers_delta():
+                        raise MessageFailed("Customer delta sync failed")
+                    return
                 logger.error("No Altru ID in message")
                 return
                 
-            self.sync_customer(altru_id)
+            if not self.sync_customer(altru_id):
+                raise MessageFailed(f"Customer sync of {altru_id} failed")
+        except MessageFailed:
+            raise
         except Exception as e:
-            logger.error("Error handling customer sync message: {}", e)
\ No newline at end of file
+            logger.error("Error handling customer sync message: {}", e)
+            raise MessageFailed(f"Error handling customer sync message: {e}") from e
\ No newline at end of file
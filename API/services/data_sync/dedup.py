@@ -0,0 +1,202 @@
+import os
+from datetime import timedelta
+from loguru import logger
+from .ranges import parse_date, format_date
+from .sync_state import SYNC_MODE_DELTA
+
+REQUEST_STATUS_IN_FLIGHT = 'in_flight'
+REQUEST_STATUS_COMPLETED = 'completed'
+REQUEST_STATUS_FAILED = 'failed'
+REQUEST_STATUS_COALESCED = 'coalesced'
+
+# A request of the key type is already covered by requests of any of these types
+COVERING_TYPES = {
+    'event_sync': ('event_sync', 'full_sync'),
+    'wristband_sync': ('wristband_sync', 'full_sync'),
+    'parking_pass_sync': ('parking_pass_sync', 'full_sync'),
+    'customer_sync': ('customer_sync',),
+    'full_sync': ('full_sync',),
+}
+
+
+def subtract_ranges(start, end, covered):
+    """
+    Remove the covered [start, end) date ranges from [start, end)
+    Returns the minimal list of (start, end) date ranges left, in order
+    """
+    remaining = []
+    cursor = start
+    for covered_start, covered_end in sorted(covered):
+        if covered_end <= cursor or covered_start >= end:
+            continue
+        if covered_start > cursor:
+            remaining.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        remaining.append((cursor, end))
+    return remaining
+
+
+class SyncRequestRegistry:
+    """
+    Tracks sync requests in the SyncRequests table so identical or overlapping requests run once
+
+    Every request is recorded before it runs. Its range is then reduced by the earlier requests
+    (lower Request_id) of a covering type and the same mode that are still in flight, or that
+    completed within the last SYNC_DEDUP_WINDOW_MINUTES. Only what is left is synced. A delta
+    request is only covered by one still in flight, since a finished delta sync cannot have
+    picked up changes made after it ran. Comparing
+    against earlier requests only means that of two racing requests the later one gives way, so
+    no range is ever skipped by both. In-flight requests older than SYNC_DEDUP_STALE_MINUTES are
+    assumed to belong to a dead worker and no longer cover anything.
+    """
+    def __init__(self, db_service, window_minutes=None, stale_minutes=None):
+        self.db_service = db_service
+        self.window_minutes = int(window_minutes or os.getenv('SYNC_DEDUP_WINDOW_MINUTES', '10'))
+        self.stale_minutes = int(stale_minutes or os.getenv('SYNC_DEDUP_STALE_MINUTES', '120'))
+
+    def run_once(self, sync_type, mode, start_date, end_date, run):
+        """
+        Run a sync only for the part of its range no earlier request covers
+        run(start_date, end_date) is called once per remaining range and returns a bool.
+        Returns True if everything that ran succeeded (or nothing needed to run)
+        """
+        claim = self.claim(sync_type, mode, start_date, end_date)
+        if claim is None:
+            # Without the registry, syncing everything is still better than syncing nothing
+            return run(start_date, end_date) is not False
+
+        request_id, ranges = claim
+        if not ranges:
+            return True
+
+        success = True
+        try:
+            for range_start, range_end in ranges:
+                success = (run(range_start, range_end) is not False) and success
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.complete(request_id, success)
+        return success
+
+    def claim(self, sync_type, mode, start_date, end_date):
+        """
+        Record a request and work out which of its ranges still need syncing
+        Returns (request_id, [(start_date, end_date), ...]), an empty list when the whole
+        request is already covered, or None if the request could not be recorded
+        """
+        is_delta = mode == SYNC_MODE_DELTA or not (start_date and end_date)
+        request_id = self.db_service.execute_query(
+            "INSERT INTO SyncRequests (SyncType, Mode, StartDate, EndDate, Status) VALUES (%s, %s, %s, %s, %s)",
+            (sync_type, mode, None if is_delta else start_date, None if is_delta else end_date, REQUEST_STATUS_IN_FLIGHT)
+        )
+        if not request_id or request_id is True:
+            logger.warning("Failed to record {} request, running it without deduplication", sync_type)
+            return None
+
+        covering_types = COVERING_TYPES.get(sync_type, (sync_type,))
+        query = f"""
+            SELECT StartDate, EndDate FROM SyncRequests
+            WHERE Request_id < %s AND Mode = %s
+            AND SyncType IN ({', '.join(['%s'] * len(covering_types))})
+        """
+        params = [request_id, mode, *covering_types]
+        if is_delta:
+            # Only a delta sync still running will see the changes this one was requested for
+            query += " AND StartDate IS NULL AND Status = %s AND CreatedAt > NOW() - INTERVAL %s MINUTE"
+            params += [REQUEST_STATUS_IN_FLIGHT, self.stale_minutes]
+        else:
+            start, end = self._bounds(start_date, end_date)
+            query += """
+                AND (
+                    (Status = %s AND CreatedAt > NOW() - INTERVAL %s MINUTE)
+                    OR (Status = %s AND CompletedAt > NOW() - INTERVAL %s MINUTE)
+                )
+                AND StartDate < %s AND EndDate >= %s
+            """
+            params += [REQUEST_STATUS_IN_FLIGHT, self.stale_minutes, REQUEST_STATUS_COMPLETED, self.window_minutes,
+                       format_date(end), format_date(start)]
+
+        earlier = self.db_service.execute_query(query, tuple(params), fetch=True)
+        if earlier is None:
+            return request_id, [(start_date, end_date)]
+
+        if is_delta:
+            ranges = [] if earlier else [(start_date, end_date)]
+        else:
+            ranges = self._remaining(start_date, end_date, earlier)
+
+        if not ranges:
+            logger.info("Coalesced {} {} request for {}..{} into an earlier request", mode, sync_type, start_date, end_date)
+            self._set_status(request_id, REQUEST_STATUS_COALESCED)
+        elif ranges != [(start_date, end_date)]:
+            logger.info("Reduced {} {} request for {}..{} to {}", mode, sync_type, start_date, end_date, ranges)
+        return request_id, ranges
+
+    def track(self, sync_type, mode, run):
+        """
+        Record a request while run() runs, without coalescing it with earlier ones
+        For short recurring requests such as event-day polls, which must never be skipped but
+        should not be started while the previous one is in_flight. Returns run()'s result
+        """
+        request_id = self.db_service.execute_query(
+            "INSERT INTO SyncRequests (SyncType, Mode, Status) VALUES (%s, %s, %s)",
+            (sync_type, mode, REQUEST_STATUS_IN_FLIGHT)
+        )
+        if not request_id or request_id is True:
+            return run() is not False
+
+        success = False
+        try:
+            success = run() is not False
+        finally:
+            self.complete(request_id, success)
+        return success
+
+    def in_flight(self, sync_type, stale_minutes=None):
+        """Whether a request of this type is running now (and not older than stale_minutes)"""
+        result = self.db_service.execute_query(
+            """
+                SELECT 1 FROM SyncRequests
+                WHERE SyncType = %s AND Status = %s AND CreatedAt > NOW() - INTERVAL %s MINUTE
+                LIMIT 1
+            """,
+            (sync_type, REQUEST_STATUS_IN_FLIGHT, stale_minutes or self.stale_minutes),
+            fetch=True
+        )
+        return bool(result)
+
+    def complete(self, request_id, success=True):
+        """Mark a request finished; failed requests stop covering their range"""
+        self._set_status(request_id, REQUEST_STATUS_COMPLETED if success else REQUEST_STATUS_FAILED)
+
+    def _set_status(self, request_id, status):
+        self.db_service.execute_query(
+            "UPDATE SyncRequests SET Status = %s, CompletedAt = NOW() WHERE Request_id = %s",
+            (status, request_id)
+        )
+
+    @staticmethod
+    def _bounds(start_date, end_date):
+        """The half-open [start, end) dates a request covers; a today..today request covers the day itself"""
+        start = parse_date(start_date)
+        end = parse_date(end_date)
+        return start, max(end, start + timedelta(days=1))
+
+    @staticmethod
+    def _remaining(start_date, end_date, earlier):
+        """Subtract earlier requests' ranges from this one, returning YYYY-MM-DD string ranges"""
+        start, end = SyncRequestRegistry._bounds(start_date, end_date)
+        covered = [
+            (row_start, row_end if row_end > row_start else row_start + timedelta(days=1))
+            for row_start, row_end in earlier
+        ]
+
+        remaining = subtract_ranges(start, end, covered)
+        if remaining == [(start, end)]:
+            return [(start_date, end_date)]
+        return [(format_date(range_start), format_date(range_end)) for range_start, range_end in remaining]
@@ -0,0 +1,139 @@
+import os
+from datetime import datetime
+from loguru import logger
+from API.services.message_broker.sync_publisher import SyncEventPublisher
+from .sync_state import SyncStateService
+from .records import TicketRecord, ParkingPassRecord, decode_all
+
+EVENT_DAY_SYNC_TYPE = 'event_day_sync'
+SYNC_MODE_EVENT_DAY = 'event_day'
+
+# SKY API requests made by one poll of one event: its tickets and its parking passes
+REQUESTS_PER_EVENT_POLL = 2
+
+
+class EventDaySyncService:
+    """
+    High-frequency polling of tickets and parking passes on days with an event
+
+    Event-day mode is on whenever the Events table has rows dated today. Each of those events is
+    polled every EVENT_DAY_POLL_SECONDS (default 30) for tickets and parking passes changed since
+    its last poll, using a per-event watermark (e.g. wristband:event:12) so one event's poll never
+    skips another's changes. Only records whose fingerprint changed are written, and the API
+    processes are told to drop the event's cached parking availability when passes were written.
+
+    Polls are kept within EVENT_DAY_REQUESTS_PER_MINUTE SKY API requests (default 30); with many
+    events the interval is stretched to fit, see poll_interval. The wristband and parking pass
+    services are only needed to poll; a scheduler that just dispatches polls can leave them out.
+    """
+    def __init__(self, db_service, api_connector, wristband_service=None, parking_pass_service=None):
+        self.db_service = db_service
+        self.api_connector = api_connector
+        self.wristband_service = wristband_service
+        self.parking_pass_service = parking_pass_service
+        self.sync_state = SyncStateService(db_service)
+        self.message_broker = None
+        self.poll_seconds = max(1, int(os.getenv('EVENT_DAY_POLL_SECONDS', '30')))
+        self.requests_per_minute = max(1, int(os.getenv('EVENT_DAY_REQUESTS_PER_MINUTE', '30')))
+
+    def set_message_broker(self, message_broker):
+        """Set a message broker for event-driven sync"""
+        self.message_broker = message_broker
+
+    @property
+    def can_poll(self):
+        return self.wristband_service is not None and self.parking_pass_service is not None
+
+    def todays_events(self, day=None):
+        """The IDs of the events taking place on day (default today); empty outside event days"""
+        day = day or datetime.now().strftime('%Y-%m-%d')
+        rows = self.db_service.execute_query(
+            "SELECT Event_ID FROM Events WHERE EventDate = %s ORDER BY Event_ID", (day,), fetch=True
+        )
+        return [row[0] for row in rows or []]
+
+    def poll_interval(self, event_count):
+        """
+        Seconds between polls of each event
+        EVENT_DAY_POLL_SECONDS, stretched when polling every event that often would exceed
+        EVENT_DAY_REQUESTS_PER_MINUTE
+        """
+        budget_seconds = 60.0 * REQUESTS_PER_EVENT_POLL * event_count / self.requests_per_minute
+        return max(float(self.poll_seconds), budget_seconds)
+
+    def poll_events(self, event_ids):
+        """Poll each event once; returns True if every poll succeeded"""
+        success = True
+        for event_id in event_ids:
+            success = self.poll_event(event_id) and success
+        return success
+
+    def poll_event(self, event_id):
+        """
+        Pull one event's tickets and parking passes changed since its last poll and write the new ones
+        Returns False if a fetch failed or any record failed to store, in which case its watermark stays put
+        """
+        if not self.can_poll:
+            logger.error("Event-day polling needs the wristband and parking pass sync services")
+            return False
+
+        wristband_counts = self.poll_entity(
+            event_id, self.wristband_service, TicketRecord, self.api_connector.get_tickets,
+            SyncEventPublisher(self.message_broker, 'wristband_sync_events'), 'wristbands_sync_completed',
+            {'success': 0, 'failed': 0, 'skipped': 0}
+        )
+        parking_counts = self.poll_entity(
+            event_id, self.parking_pass_service, ParkingPassRecord, self.api_connector.get_parking_passes,
+            SyncEventPublisher(self.message_broker, 'parking_pass_sync_events'), 'parking_pass_sync_completed',
+            {'success': 0, 'failed': 0, 'limit_reached': 0, 'skipped': 0}
+        )
+
+        if parking_counts['success']:
+            self.parking_pass_service.notify_availability([event_id])
+
+        logger.info(
+            "Event-day poll of event {}: {} new wristbands, {} new parking passes",
+            event_id, wristband_counts['success'], parking_counts['success']
+        )
+        return not any(
+            counts['failed'] or counts.get('fetch_failed') for counts in (wristband_counts, parking_counts)
+        )
+
+    def poll_entity(self, event_id, service, record_type, fetch, publisher, summary_event, counts):
+        """Fetch, write and advance the per-event watermark for one entity, returning its counts"""
+        entity = f"{service.ENTITY}:event:{event_id}"
+        modified_since = self.sync_state.get_watermark(entity)
+
+        records = self.sync_state.fetch_changes(fetch, modified_since, event_id=event_id)
+        if records is None:
+            logger.error("Failed to fetch {} changes for event {}", service.ENTITY, event_id)
+            counts['fetch_failed'] = True
+            return counts
+        if not records:
+            return counts
+
+        records = decode_all(record_type, records)
+        service.sync_chunk(records, publisher, counts)
+
+        # Only move the watermark once every changed record is stored, otherwise retry them next poll
+        if counts['failed'] == 0:
+            self.sync_state.advance_watermark(entity, self.sync_state.high_water_mark(records))
+
+        if counts['success']:
+            publisher.summary(
+                {
+                    'event': summary_event,
+                    'mode': SYNC_MODE_EVENT_DAY,
+                    'modified_since': modified_since,
+                    'event_id': event_id,
+                    'success_count': counts['success'],
+                    'failed_count': counts['failed'],
+                    'changed_count': counts['success'],
+                    'skipped_count': counts['skipped'],
+                    'total': len(records),
+                    'status': 'success' if counts['failed'] == 0 else 'partial_failure'
+                }
+            )
+        else:
+            publisher.flush()
+        return counts
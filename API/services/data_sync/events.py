@@ -1,38 +1,85 @@
 from loguru import logger
 from mysql.connector import Error
+from API.services.message_broker.backend import MessageFailed
+from API.services.message_broker.sync_publisher import SyncEventPublisher
+from .sync_state import SyncStateService, SYNC_MODE_FULL, SYNC_MODE_DELTA
+from .fingerprint import ChangeDetector, row_fingerprint
+from .records import EventRecord, decode_all
+from .columnar import event_batch
 
 class EventSyncService:
     """
     Service responsible for syncing events data from the Blackbaud API to the local database
     """
+    ENTITY = 'event'
+
     def __init__(self, db_service, api_connector):
         self.db_service = db_service
         self.api_connector = api_connector
+        self.sync_state = SyncStateService(db_service)
+        self.change_detector = ChangeDetector(db_service, 'Events', 'Name')
         self.message_broker = None  # Will be set if event-driven
 
     def set_message_broker(self, message_broker):
         """Set a message broker for event-driven sync"""
         self.message_broker = message_broker
 
-    def sync_events(self, start_date: str, end_date: str) -> bool:
-        """Sync events data from Altru to local database"""
-        logger.info("Starting events sync from {} to {}", start_date, end_date)
-        
-        # Get events from Blackbaud API
-        events = self.api_connector.get_events(start_date, end_date)
-        if not events:
-            logger.error("Failed to fetch events data from {} to {}", start_date, end_date)
-            return False
+    def sync_events(self, start_date: str = None, end_date: str = None, mode: str = SYNC_MODE_FULL) -> bool:
+        """
+        Sync events data from Altru to local database
+        In delta mode the date range is ignored and only events modified since the watermark are pulled
+        """
+        publisher = SyncEventPublisher(self.message_broker, 'event_sync_events')
 
+        modified_since = None
+        if mode == SYNC_MODE_DELTA:
+            modified_since = self.sync_state.get_watermark(self.ENTITY)
+            logger.info("Starting events delta sync since {}", modified_since)
+            events = self.sync_state.fetch_changes(self.api_connector.get_events, modified_since)
+            if events is None:
+                # Not a quiet period, so nothing is recorded for the adaptive cadence
+                logger.error("Failed to fetch events changed since {}", modified_since)
+                return False
+            if not events:
+                logger.info("No events changed since {}", modified_since)
+                self.sync_state.record_changes(self.ENTITY, 0)
+                return True
+        else:
+            logger.info("Starting events sync from {} to {}", start_date, end_date)
+            
+            # Get events from Blackbaud API
+            events = self.api_connector.get_events(start_date, end_date)
+            if events is None:
+                logger.error("Failed to fetch events data from {} to {}", start_date, end_date)
+                return False
+            if not events:
+                logger.info("No events from {} to {}", start_date, end_date)
+                return True
+
+        events = decode_all(EventRecord, events)
         success_count = 0
         failed_count = 0
 
-        # Insert each event
-        for event in events:
+        # Compare the whole batch against stored fingerprints so unchanged events skip
+        # both the coordinator lookup and the upsert
+        changed, skipped_count = self.change_detector.filter_changed(
+            [(event.name, self.event_fingerprint(event), event) for event in events]
+        )
+
+        batch = event_batch([event for _, _, event in changed])
+        event_dates = batch.columns['event_date']
+
+        # Insert each changed event
+        for index, (_, row_hash, event) in enumerate(changed):
+            # Events without a name or a parseable date can never be stored
+            if index in batch.invalid:
+                logger.error("Skipping event {} with a missing name or start date", event.id)
+                failed_count += 1
+                continue
+            
             # Check if event has an employee/coordinator assigned
             employee_id = None
-            coordinator = event.get('coordinator', {})
-            if coordinator:
+            if event.has_coordinator:
                 # Try to look up the employee in the database first
                 employee_query = """
                     SELECT E_id FROM Employees 
@@ -40,9 +87,9 @@ class EventSyncService:
                     LIMIT 1
                 """
                 employee_data = (
-                    coordinator.get('email'),
-                    coordinator.get('first_name'),
-                    coordinator.get('last_name')
+                    event.coordinator_email,
+                    event.coordinator_first_name,
+                    event.coordinator_last_name
                 )
                 employee_result = self.db_service.execute_query(employee_query, employee_data, fetch=True)
                 
@@ -55,28 +102,30 @@ class EventSyncService:
                         VALUES (%s, %s, %s, %s)
                     """
                     insert_employee_data = (
-                        coordinator.get('first_name'),
-                        coordinator.get('last_name'),
-                        coordinator.get('phone'),
-                        coordinator.get('email')
+                        event.coordinator_first_name,
+                        event.coordinator_last_name,
+                        event.coordinator_phone,
+                        event.coordinator_email
                     )
                     employee_id = self.db_service.execute_query(insert_employee_query, insert_employee_data)
             
             # Now insert the event with the employee reference if available
             query = """
-                INSERT INTO Events (C_id, E_id, Name, EventDate)
+                INSERT INTO Events (C_id, E_id, Name, EventDate, RowHash)
                 VALUES (
                     (SELECT C_id FROM Customers WHERE Altru_id = %s),
-                    %s, %s, %s)
+                    %s, %s, %s, %s)
                 ON DUPLICATE KEY UPDATE
-                E_id=VALUES(E_id), Name=VALUES(Name), EventDate=VALUES(EventDate)
+                E_id=VALUES(E_id), Name=VALUES(Name), EventDate=VALUES(EventDate),
+                RowHash=VALUES(RowHash)
             """
 
             data = (
-                event.get('constituent_id'),
+                event.constituent_id,
                 employee_id,  # Will be None if no employee/coordinator is found or created
-                event.get('name'),
-                event.get('start_date')
+                event.name,
+                event_dates[index],
+                row_hash
             )
 
             result = self.db_service.execute_query(query, data)
@@ -84,64 +133,84 @@ class EventSyncService:
                 success_count += 1
                 
                 # Notify that an event was synced
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'event_sync_events',
-                        {
-                            'event': 'event_synced',
-                            'event_id': event.get('id'),
-                            'status': 'success',
-                            'name': event.get('name')
-                        }
-                    )
+                publisher.record(
+                    {
+                        'event': 'event_synced',
+                        'event_id': event.id,
+                        'status': 'success',
+                        'name': event.name
+                    }
+                )
             else:
                 failed_count += 1
                 
                 # Notify that an event sync failed
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'event_sync_events',
-                        {
-                            'event': 'event_sync_failed',
-                            'event_id': event.get('id'),
-                            'status': 'failed',
-                            'name': event.get('name')
-                        }
-                    )
+                publisher.record(
+                    {
+                        'event': 'event_sync_failed',
+                        'event_id': event.id,
+                        'status': 'failed',
+                        'name': event.name
+                    }
+                )
 
-        total = success_count + failed_count
-        logger.info("Synced {}/{} events from {} to {}", success_count, total, start_date, end_date)
+        total = success_count + failed_count + skipped_count
+        logger.info(
+            "Synced {}/{} events from {} to {} (Changed: {}, Unchanged: {})",
+            success_count + skipped_count, total, start_date, end_date, success_count, skipped_count
+        )
+        
+        # Only move the watermark once every changed record is stored, otherwise retry them next run
+        if mode == SYNC_MODE_DELTA and failed_count == 0:
+            self.sync_state.advance_watermark(self.ENTITY, self.sync_state.high_water_mark(events))
+        if mode == SYNC_MODE_DELTA:
+            self.sync_state.record_changes(self.ENTITY, success_count)
         
         # Publish summary event
-        if self.message_broker:
-            self.message_broker.publish_message(
-                'event_sync_events',
-                {
-                    'event': 'events_sync_completed',
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'success_count': success_count,
-                    'failed_count': failed_count,
-                    'total': total
-                }
-            )
+        publisher.summary(
+            {
+                'event': 'events_sync_completed',
+                'mode': mode,
+                'modified_since': modified_since,
+                'start_date': start_date,
+                'end_date': end_date,
+                'success_count': success_count,
+                'failed_count': failed_count,
+                'changed_count': success_count,
+                'skipped_count': skipped_count,
+                'total': total
+            }
+        )
         
         return failed_count == 0
 
+    def event_fingerprint(self, event):
+        """Fingerprint the source fields that determine an Events row, including its coordinator"""
+        return row_fingerprint(event.fingerprint_values())
+
     def handle_event_sync_message(self, ch, method, properties, body):
-        """Handle event sync messages from the message broker"""
+        """Handle event sync messages from the message broker, raising MessageFailed if the sync fails so it is retried"""
         try:
             import json
             message = json.loads(body)
             logger.info("Received event sync message: {}", message)
             
+            # Notifications published by the sync services share this queue; only act on requests
+            if message.get('event'):
+                return
+            
             start_date = message.get('start_date')
             end_date = message.get('end_date')
+            mode = message.get('mode', SYNC_MODE_FULL)
             
-            if not start_date or not end_date:
+            if mode != SYNC_MODE_DELTA and (not start_date or not end_date):
                 logger.error("Missing start_date or end_date in message")
                 return
                 
-            self.sync_events(start_date, end_date)
+            if not self.sync_events(start_date, end_date, mode=mode):
+                raise MessageFailed(f"Event sync ({mode}) from {start_date} to {end_date} failed")
+        except MessageFailed:
+            raise
         except Exception as e:
-            logger.error("Error handling event sync message: {}", e)
\ No newline at end of file
+            logger.error("Error handling event sync message: {}", e)
+            raise MessageFailed(f"Error handling event sync message: {e}") from e
\ No newline at end of file
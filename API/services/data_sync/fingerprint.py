@@ -0,0 +1,48 @@
+import hashlib
+from loguru import logger
+
+# Unit separator, which will not appear in SKY API field values
+FIELD_SEPARATOR = '\x1f'
+
+
+def row_fingerprint(values) -> str:
+    """
+    Compute a stable SHA-256 fingerprint over the column values written for a row
+    None is encoded distinctly from the empty string so NULL <-> '' changes are detected
+    """
+    encoded = FIELD_SEPARATOR.join('\x00' if value is None else str(value) for value in values)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class ChangeDetector:
+    """
+    Compares content fingerprints of incoming records against those stored in a table
+    This lets sync services skip the no-op upserts that would otherwise generate redo log and binlog traffic
+    """
+    def __init__(self, db_service, table, key_column):
+        self.db_service = db_service
+        self.table = table
+        self.key_column = key_column
+
+    def filter_changed(self, items):
+        """
+        Split (key, fingerprint, payload) items into those that need writing and those that are unchanged
+
+        Returns a (changed_items, skipped_count) tuple. Items without a key are always treated as changed,
+        and if the stored hashes cannot be read every item is written so a lookup failure never drops data.
+        """
+        stored = self.db_service.get_row_hashes(self.table, self.key_column, [item[0] for item in items])
+        if stored is None:
+            logger.warning("Could not read fingerprints from {}, writing all {} rows", self.table, len(items))
+            return list(items), 0
+
+        changed = []
+        skipped_count = 0
+        for key, fingerprint, payload in items:
+            if key is not None and stored.get(str(key)) == fingerprint:
+                skipped_count += 1
+            else:
+                changed.append((key, fingerprint, payload))
+
+        logger.debug("{}: {} changed, {} unchanged", self.table, len(changed), skipped_count)
+        return changed, skipped_count
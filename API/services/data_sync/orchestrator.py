@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+from loguru import logger
+from .ranges import split_date_range
+from .sync_state import SYNC_MODE_FULL, SYNC_MODE_DELTA
+
+
+class SyncOrchestrator:
+    """
+    Runs a full sync as a dependency graph instead of one entity after another
+
+    The graph follows the foreign keys in FireworksDB: Customers before Events, and Events
+    before Wristbands and ParkingPasses. Employees are resolved by the event stage itself
+    from each event's coordinator. The date range is split into shards so that wristbands
+    and parking passes for one day start as soon as that day's events are loaded, while
+    events for later days are still being fetched.
+    """
+    def __init__(self, customer_sync_service, event_sync_service, wristband_sync_service,
+                 parking_pass_sync_service, max_workers=None, shard_days=None):
+        self.customer_sync_service = customer_sync_service
+        self.event_sync_service = event_sync_service
+        self.wristband_sync_service = wristband_sync_service
+        self.parking_pass_sync_service = parking_pass_sync_service
+        self.max_workers = int(max_workers or os.getenv('SYNC_ORCHESTRATOR_WORKERS', '4'))
+        self.shard_days = int(shard_days or os.getenv('SYNC_SHARD_DAYS', '1'))
+
+    def build_full_sync_graph(self, start_date, end_date, mode=SYNC_MODE_FULL):
+        """
+        Build the stage graph for a full sync
+        Returns a dict of stage name -> (callable, [dependency stage names])
+        """
+        # Constituents can't be fetched by date range, so every mode syncs those changed since the watermark
+        stages = {'customers': (self.customer_sync_service.sync_customers_delta, [])}
+
+        stages.update(self.build_range_graph(start_date, end_date, mode, dependencies=['customers']))
+        return stages
+
+    def build_range_graph(self, start_date, end_date, mode=SYNC_MODE_FULL, dependencies=None):
+        """
+        Build the event, wristband and parking pass stages for a date range
+        The event stage of every shard waits on the given dependencies
+        """
+        stages = {}
+
+        # Delta syncs ignore the date range, so there is nothing to shard
+        shards = [(start_date, end_date)] if mode == SYNC_MODE_DELTA else \
+            split_date_range(start_date, end_date, self.shard_days)
+
+        for shard_start, shard_end in shards:
+            suffix = f'{shard_start}..{shard_end}'
+            events_stage = f'events:{suffix}'
+
+            stages[events_stage] = (
+                self._bind(self.event_sync_service.sync_events, shard_start, shard_end, mode),
+                list(dependencies or [])
+            )
+            stages[f'wristbands:{suffix}'] = (
+                self._bind(self.wristband_sync_service.sync_wristbands, shard_start, shard_end, mode),
+                [events_stage]
+            )
+            stages[f'parking_passes:{suffix}'] = (
+                self._bind(self.parking_pass_sync_service.sync_parking_passes, shard_start, shard_end, mode),
+                [events_stage]
+            )
+
+        return stages
+
+    def full_sync(self, start_date, end_date, mode=SYNC_MODE_FULL) -> bool:
+        """Run a full sync of every entity, returning True if every stage succeeded"""
+        logger.info("Starting orchestrated full sync from {} to {} ({} mode)", start_date, end_date, mode)
+        results = self.run(self.build_full_sync_graph(start_date, end_date, mode))
+        return all(results.values())
+
+    def range_sync(self, start_date, end_date, mode=SYNC_MODE_FULL) -> bool:
+        """
+        Sync events, wristbands and parking passes for a date range, assuming customers are loaded
+        Returns True if every stage succeeded
+        """
+        logger.info("Starting orchestrated range sync from {} to {} ({} mode)", start_date, end_date, mode)
+        results = self.run(self.build_range_graph(start_date, end_date, mode))
+        return all(results.values())
+
+    def run(self, stages):
+        """
+        Run a stage graph, starting each stage as soon as all of its dependencies have finished
+
+        A stage counts as finished whether or not it succeeded, as the sequential sync did, since
+        a partially failed event sync still leaves most events in place for their tickets.
+        Returns a dict of stage name -> bool success.
+        """
+        started_at = monotonic()
+        results = {}
+        pending = dict(stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sync-stage') as executor:
+            while pending or running:
+                ready = [
+                    name for name, (_, dependencies) in pending.items()
+                    if all(dependency in results for dependency in dependencies)
+                ]
+                for name in ready:
+                    task, _ = pending.pop(name)
+                    logger.debug("Starting sync stage {}", name)
+                    running[executor.submit(task)] = name
+
+                if not running:
+                    # Anything left depends on a stage that is not in the graph
+                    for name in pending:
+                        logger.error("Sync stage {} has unsatisfiable dependencies", name)
+                        results[name] = False
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result() is not False
+                    except Exception as e:
+                        logger.error("Sync stage {} failed: {}", name, e)
+                        results[name] = False
+                    logger.debug("Finished sync stage {} (success: {})", name, results[name])
+
+        failed = [name for name, success in results.items() if not success]
+        logger.info(
+            "Orchestrated sync finished {} stages in {:.1f}s ({} failed{})",
+            len(results), monotonic() - started_at, len(failed), f": {', '.join(failed)}" if failed else ''
+        )
+        return results
+
+    @staticmethod
+    def _bind(sync_method, start_date, end_date, mode):
+        """Bind a range sync method to one shard"""
+        return lambda: sync_method(start_date, end_date, mode=mode)
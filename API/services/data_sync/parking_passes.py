@@ -1,13 +1,28 @@
 from loguru import logger
 from mysql.connector import Error
+from API.services.message_broker.backend import MessageFailed
+from API.services.message_broker.sync_publisher import SyncEventPublisher
+from .sync_state import SyncStateService, SYNC_MODE_FULL, SYNC_MODE_DELTA
+from .fingerprint import ChangeDetector, row_fingerprint
+from .checkpoint import SyncRunService, RUN_STATUS_COMPLETED, RUN_STATUS_PARTIAL_FAILURE
+from .ranges import split_date_range
+from .pipeline import SyncPipeline
+from .records import ParkingPassRecord, decode_all
+from .columnar import parking_pass_batch
+from .availability import PASS_TYPE_LIMITS, PARKING_AVAILABILITY_EXCHANGE
 
 class ParkingPassSyncService:
     """
     Service responsible for syncing parking pass data from the Blackbaud API to the local database
     """
+    ENTITY = 'parking_pass'
+
     def __init__(self, db_service, api_connector):
         self.db_service = db_service
         self.api_connector = api_connector
+        self.sync_state = SyncStateService(db_service)
+        self.change_detector = ChangeDetector(db_service, 'ParkingPasses', 'Pass_id')
+        self.sync_runs = SyncRunService(db_service)
         self.message_broker = None  # Will be set if event-driven
 
     def set_message_broker(self, message_broker):
@@ -17,12 +32,7 @@ class ParkingPassSyncService:
     def get_pass_type_limits(self):
         """Get the limits for each pass type from the database"""
         # This could be stored in a configuration table or hardcoded based on business rules
-        return {
-            'General': 800,
-            'Premium': 60,
-            'Catering': 30,
-            'Buck Road': 40
-        }
+        return dict(PASS_TYPE_LIMITS)
 
     def check_pass_type_availability(self, event_id, pass_type):
         """Check if there is still availability for a specific pass type"""
@@ -49,21 +59,51 @@ class ParkingPassSyncService:
         current_count = result[0][0]
         return current_count < limits[pass_type]
 
-    def sync_parking_passes(self, start_date: str, end_date: str) -> bool:
+    def sync_parking_passes(self, start_date: str = None, end_date: str = None, mode: str = SYNC_MODE_FULL) -> bool:
         """
         Sync parking pass data from Altru to local database
+        Full syncs page through the range one shard at a time and checkpoint after every page,
+        so an interrupted run resumes from its last checkpoint instead of starting over
         """
-        logger.info("Starting parking passes sync from {} to {}", start_date, end_date)
-        
-        # Get parking passes from Blackbaud API
-        passes_data = self.api_connector.get_parking_passes(start_date, end_date)
-        if not passes_data:
-            logger.error("No parking pass data returned from {} to {}", start_date, end_date)
+        publisher = SyncEventPublisher(self.message_broker, 'parking_pass_sync_events')
+        counts = {'success': 0, 'failed': 0, 'limit_reached': 0, 'skipped': 0}
+        run = None
+
+        modified_since = None
+        if mode == SYNC_MODE_DELTA:
+            modified_since = self.sync_state.get_watermark(self.ENTITY)
+            logger.info("Starting parking passes delta sync since {}", modified_since)
+            passes_data = self.sync_state.fetch_changes(self.api_connector.get_parking_passes, modified_since)
+            if passes_data is None:
+                # Not a quiet period, so nothing is recorded for the adaptive cadence
+                logger.error("Failed to fetch parking passes changed since {}", modified_since)
+                return False
+            if not passes_data:
+                logger.info("No parking passes changed since {}", modified_since)
+                self.sync_state.record_changes(self.ENTITY, 0)
+                return True
             
-            # Publish event for empty data if message broker is available
-            if self.message_broker:
-                self.message_broker.publish_message(
-                    'parking_pass_sync_events', 
+            passes_data = decode_all(ParkingPassRecord, passes_data)
+            self.sync_chunk(passes_data, publisher, counts)
+            
+            # Only move the watermark once every changed record is stored, otherwise retry them next run
+            if counts['failed'] == 0:
+                self.sync_state.advance_watermark(self.ENTITY, self.sync_state.high_water_mark(passes_data))
+            self.sync_state.record_changes(self.ENTITY, counts['success'])
+        else:
+            logger.info("Starting parking passes sync from {} to {}", start_date, end_date)
+            run = self.sync_runs.start_or_resume(self.ENTITY, start_date, end_date)
+            fetched_count = self.sync_range(start_date, end_date, run, publisher, counts)
+
+            if run.get('fetch_failed'):
+                # Left running, so a retry (or the interrupted run sweep) resumes it from its checkpoint
+                logger.error("Parking passes sync from {} to {} interrupted by a failed fetch", start_date, end_date)
+            elif not fetched_count and not run['resumed']:
+                logger.info("No parking pass data returned from {} to {}", start_date, end_date)
+                self.sync_runs.finish(run, RUN_STATUS_COMPLETED)
+                
+                # Publish event for empty data
+                publisher.summary(
                     {
                         'event': 'parking_pass_sync_empty',
                         'start_date': start_date,
@@ -71,26 +111,173 @@ class ParkingPassSyncService:
                         'status': 'no_data'
                     }
                 )
-            return False
+                # A range with nothing in it is synced, not failed
+                return True
+            else:
+                self.sync_runs.finish(run, RUN_STATUS_COMPLETED if counts['failed'] == 0 else RUN_STATUS_PARTIAL_FAILURE)
 
-        success_count = 0
-        failed_count = 0
-        limit_reached_count = 0
+        success_count = counts['success']
+        failed_count = counts['failed']
+        limit_reached_count = counts['limit_reached']
+        skipped_count = counts['skipped']
+        interrupted = bool(run and run.get('fetch_failed'))
+        total = success_count + failed_count + limit_reached_count + skipped_count
+        logger.info(
+            "Synced {}/{} parking passes from {} to {} (Failed: {}, Limit reached: {}, Unchanged: {})", 
+            success_count + skipped_count, total, start_date, end_date, failed_count, limit_reached_count,
+            skipped_count
+        )
+        
+        # Publish summary event
+        publisher.summary(
+            {
+                'event': 'parking_pass_sync_completed',
+                'mode': mode,
+                'modified_since': modified_since,
+                'start_date': start_date,
+                'end_date': end_date,
+                'resumed': bool(run and run['resumed']),
+                'pipeline': run.get('pipeline') if run else None,
+                'success_count': success_count,
+                'failed_count': failed_count,
+                'limit_reached_count': limit_reached_count,
+                'changed_count': success_count,
+                'skipped_count': skipped_count,
+                'total': total,
+                'status': 'interrupted' if interrupted else 'success' if failed_count == 0 else 'partial_failure'
+            }
+        )
+        if success_count:
+            self.notify_availability(counts.get('event_ids'))
+        
+        return failed_count == 0 and not interrupted
+
+    def notify_availability(self, event_ids=None):
+        """Tell the API processes which events' parking availability changed (None for any), so they drop their cached counts"""
+        if not self.message_broker:
+            return
+        self.message_broker.publish_broadcast(
+            PARKING_AVAILABILITY_EXCHANGE,
+            {
+                'event': 'parking_pass_sync_completed',
+                'event_ids': list(event_ids) if event_ids is not None else None
+            }
+        )
+
+    def sync_range(self, start_date, end_date, run, publisher, counts):
+        """
+        Page through a date range shard by shard, checkpointing after every page
+        Pages are fetched, fingerprinted and written by a SyncPipeline, so the next page is
+        downloaded while the previous one is being stored. Shards and pages before the run's
+        checkpoint are skipped. Returns the number of passes fetched
+        """
+        fetched = {'count': 0}
+
+        def fetch_pages():
+            for shard_start, shard_end, offset, page in self.iter_pages(start_date, end_date, run):
+                fetched['count'] += len(page)
+                yield shard_start, offset, page
+
+        def transform(item):
+            # Only the decoded records of changed rows travel on to the write stage
+            shard_start, offset, page = item
+            last_id = page[-1].get('id') if page else None
+            return shard_start, offset, last_id, self.filter_chunk(decode_all(ParkingPassRecord, page), counts)
+
+        def write(batch):
+            shard_start, offset, last_id, changed = batch
+            self.write_chunk(changed, publisher, counts)
+            publisher.flush()
+            self.sync_runs.checkpoint(run, shard_start, offset, last_id)
+
+        pipeline = SyncPipeline(self.ENTITY, fetch_pages, transform, write)
+        run['pipeline'] = pipeline.run()
+        return fetched['count']
+
+    def iter_pages(self, start_date, end_date, run):
+        """
+        Yield (shard_start, shard_end, offset after the page, page) for every page in the range
+        from the run's checkpoint on. Each shard ends with a short (possibly empty) page.
+        A failed fetch ends the iteration early and sets the run's fetch_failed flag
+        """
+        page_size = self.sync_runs.page_size
+
+        for shard_start, shard_end in split_date_range(start_date, end_date, self.sync_runs.shard_days):
+            # Shards before the checkpoint were finished by an earlier attempt
+            if run['shard_start'] and shard_start < run['shard_start']:
+                continue
+            offset = run['page_cursor'] if shard_start == run['shard_start'] else 0
+
+            while True:
+                page = self.api_connector.get_parking_passes(shard_start, shard_end, offset=offset, limit=page_size)
+                if page is None:
+                    # Stop at the last checkpoint rather than skipping the rest of the shard
+                    logger.error("Failed to fetch parking passes from {} at offset {}, stopping the run", shard_start, offset)
+                    run['fetch_failed'] = True
+                    return
+                offset += len(page)
+                yield shard_start, shard_end, offset, page
+                if len(page) < page_size:
+                    break
+
+    def sync_chunk(self, passes_data, publisher, counts):
+        """Write one chunk of parking passes, skipping those whose stored fingerprint already matches"""
+        self.write_chunk(self.filter_chunk(passes_data, counts), publisher, counts)
+
+    def filter_chunk(self, passes_data, counts):
+        """
+        Compare a chunk of ParkingPassRecords against stored fingerprints and return only the (pass_id, row_hash, pass) that changed
+        Unchanged passes were already counted against their limits when first written, so they skip the limit check too
+        """
+        items = [(ppass.id, row_fingerprint(ppass.fingerprint_values()), ppass) for ppass in passes_data]
+        changed, skipped_count = self.change_detector.filter_changed(items)
+        counts['skipped'] += skipped_count
+        return changed
+
+    def write_chunk(self, changed, publisher, counts):
+        """
+        Upsert changed parking passes and their pass types as batches
+        Each type's limit is checked against one count of the events' other passes plus the passes
+        admitted earlier in the chunk, so the check still sees the passes before it. Passes are then
+        upserted in one batch, their PP_ids read back in one query, and their PassTypes rows written
+        in another batch. A failed batch is retried row by row so one bad row doesn't fail the rest
+        """
+        if not changed:
+            return
+
+        batch = parking_pass_batch([ppass for _, _, ppass in changed])
+        issued_column = batch.columns['issued']
+        cost_column = batch.columns['cost']
+        limits = self.get_pass_type_limits()
+        issued = self.issued_pass_counts(
+            [ppass.event_id for index, (_, _, ppass) in enumerate(changed) if index not in batch.invalid],
+            [pass_id for index, (pass_id, _, _) in enumerate(changed) if index not in batch.invalid]
+        )
+
+        admitted = []
+        for index, (source_pass_id, row_hash, ppass) in enumerate(changed):
+            event_id = ppass.event_id
+            pass_type = ppass.pass_type
+
+            # Passes without an event or ID can never be stored
+            if index in batch.invalid:
+                counts['failed'] += 1
+                publisher.record(
+                    {
+                        'event': 'parking_pass_sync_failed',
+                        'event_id': event_id,
+                        'status': 'invalid'
+                    }
+                )
+                continue
 
-        # Process each parking pass
-        for ppass in passes_data:
-            event_id = ppass.get('event_id')
-            pass_type = ppass.get('pass_type')
-            
             # Check if we've reached the limit for this pass type
-            if pass_type and not self.check_pass_type_availability(event_id, pass_type):
-                logger.warning("Limit reached for pass type {} for event ID {}", pass_type, event_id)
-                limit_reached_count += 1
-                
-                # Notify about limit reached if message broker is available
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'parking_pass_sync_events', 
+            if pass_type in limits:
+                key = (str(event_id), pass_type)
+                if issued.get(key, 0) >= limits[pass_type]:
+                    logger.warning("Limit reached for pass type {} for event ID {}", pass_type, event_id)
+                    counts['limit_reached'] += 1
+                    publisher.record(
                         {
                             'event': 'parking_pass_limit_reached',
                             'event_id': event_id,
@@ -98,139 +285,149 @@ class ParkingPassSyncService:
                             'status': 'limit_reached'
                         }
                     )
-                continue
-                
-            # First insert the parking pass
-            pass_query = """
-                INSERT INTO ParkingPasses (Event_ID, Issued)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE
-                Issued = VALUES(Issued)
-            """
-
-            parking_data = (
-                event_id,
-                ppass.get('issued_at')
-            )
-            
-            # Execute the parking pass query and get the ID
-            pass_id = self.db_service.execute_query(pass_query, parking_data)
-            
-            if not pass_id:
-                failed_count += 1
-                
-                # Notify that a parking pass sync failed if message broker is available
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'parking_pass_sync_events', 
-                        {
-                            'event': 'parking_pass_sync_failed',
-                            'event_id': event_id,
-                            'status': 'failed'
-                        }
-                    )
-                continue
-                
-            # If this was an ON DUPLICATE KEY UPDATE, we need to get the actual PP_id
-            if isinstance(pass_id, int) and pass_id <= 0:
-                pass_id = self.db_service.get_existing_pass_id(event_id)
-                if not pass_id:
-                    logger.error("Failed to retrieve existing parking pass ID for event ID: {}", event_id)
-                    failed_count += 1
                     continue
-                
-            # If the parking pass has a type, insert it into the PassTypes table
-            if pass_type:
-                pass_type_query = """
-                    INSERT INTO PassTypes (PP_id, PassTypes, Cost)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                    PassTypes = VALUES(PassTypes), Cost = VALUES(Cost)
-                """
-
-                pass_type_data = (
-                    pass_id,
-                    pass_type,
-                    ppass.get('cost', 0.00)
+                issued[key] = issued.get(key, 0) + 1
+            admitted.append(index)
+
+        pass_query = """
+            INSERT INTO ParkingPasses (Event_ID, Issued, Pass_id, RowHash)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            Event_ID = VALUES(Event_ID), Issued = VALUES(Issued), RowHash = VALUES(RowHash)
+        """
+        pass_rows = [
+            (changed[index][2].event_id, issued_column[index], changed[index][0], changed[index][1])
+            for index in admitted
+        ]
+        written = [index for index, ok in zip(admitted, self.write_rows(pass_query, pass_rows, 'parking passes')) if ok]
+
+        for index in admitted:
+            if index not in written:
+                counts['failed'] += 1
+                publisher.record(
+                    {
+                        'event': 'parking_pass_sync_failed',
+                        'event_id': changed[index][2].event_id,
+                        'status': 'failed'
+                    }
                 )
-                
-                # Execute the pass type query
-                type_result = self.db_service.execute_query(pass_type_query, pass_type_data)
-                
-                if not type_result:
-                    # We had a partial failure (pass was inserted but type wasn't)
-                    logger.warning("Parking pass inserted but type failed for pass ID: {}", pass_id)
-                    
-                    # Notify of partial failure if message broker is available
-                    if self.message_broker:
-                        self.message_broker.publish_message(
-                            'parking_pass_sync_events', 
-                            {
-                                'event': 'parking_pass_type_sync_failed',
-                                'parking_pass_id': pass_id,
-                                'event_id': event_id,
-                                'status': 'partial_failure'
-                            }
-                        )
-                    
-                    # Still count it as a success for the pass itself
-                    success_count += 1
-                    continue
-            
-            # If we got here, everything succeeded
-            success_count += 1
-            
-            # Notify that a parking pass was synced if message broker is available
-            if self.message_broker:
-                self.message_broker.publish_message(
-                    'parking_pass_sync_events', 
+
+        # The PP_id of each written pass, new or updated, for its PassTypes row
+        pp_ids = self.stored_pass_ids([changed[index][0] for index in written]) if written else {}
+        if pp_ids is None:
+            logger.error("Failed to read back the IDs of {} parking passes", len(written))
+            pp_ids = {}
+        typed = [index for index in written if changed[index][2].pass_type]
+
+        pass_type_query = """
+            INSERT INTO PassTypes (PP_id, PassTypes, Cost)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            PassTypes = VALUES(PassTypes), Cost = VALUES(Cost)
+        """
+        with_ids = [index for index in typed if str(changed[index][0]) in pp_ids]
+        type_rows = [
+            (pp_ids[str(changed[index][0])], changed[index][2].pass_type, cost_column[index])
+            for index in with_ids
+        ]
+        type_results = dict(zip(with_ids, self.write_rows(pass_type_query, type_rows, 'parking pass types')))
+
+        for index in written:
+            source_pass_id, _, ppass = changed[index]
+            pass_id = pp_ids.get(str(source_pass_id))
+            # The pass itself is stored either way, so it counts as a success
+            counts['success'] += 1
+            counts.setdefault('event_ids', set()).add(ppass.event_id)
+
+            if ppass.pass_type and not type_results.get(index):
+                # We had a partial failure (pass was inserted but type wasn't)
+                logger.warning("Parking pass {} inserted but its type failed", source_pass_id)
+                publisher.record(
                     {
-                        'event': 'parking_pass_synced',
+                        'event': 'parking_pass_type_sync_failed',
                         'parking_pass_id': pass_id,
-                        'event_id': event_id,
-                        'status': 'success',
-                        'pass_type': pass_type
+                        'event_id': ppass.event_id,
+                        'status': 'partial_failure'
                     }
                 )
+                continue
 
-        total = success_count + failed_count + limit_reached_count
-        logger.info(
-            "Synced {}/{} parking passes from {} to {} (Failed: {}, Limit reached: {})", 
-            success_count, total, start_date, end_date, failed_count, limit_reached_count
-        )
-        
-        # Publish summary event if message broker is available
-        if self.message_broker:
-            self.message_broker.publish_message(
-                'parking_pass_sync_events',
+            # Notify that a parking pass was synced
+            publisher.record(
                 {
-                    'event': 'parking_pass_sync_completed',
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'success_count': success_count,
-                    'failed_count': failed_count,
-                    'limit_reached_count': limit_reached_count,
-                    'total': total,
-                    'status': 'success' if failed_count == 0 else 'partial_failure'
+                    'event': 'parking_pass_synced',
+                    'parking_pass_id': pass_id,
+                    'event_id': ppass.event_id,
+                    'status': 'success',
+                    'pass_type': ppass.pass_type
                 }
             )
-        
-        return failed_count == 0
+
+    def write_rows(self, query, rows, label):
+        """Write rows as one batch, falling back to one at a time if the batch fails; returns each row's outcome"""
+        if not rows:
+            return []
+        if self.db_service.execute_many(query, rows):
+            return [True] * len(rows)
+        logger.warning("Batch upsert of {} {} failed, retrying row by row", len(rows), label)
+        return [bool(self.db_service.execute_query(query, row)) for row in rows]
+
+    def issued_pass_counts(self, event_ids, excluded_pass_ids):
+        """
+        Count the passes of each type already issued for the given events, leaving out the given passes
+        Returns a dict of (event ID, pass type) -> count; the passes being written are left out
+        since the caller counts them itself as it admits them
+        """
+        event_ids = list(dict.fromkeys(str(event_id) for event_id in event_ids))
+        if not event_ids:
+            return {}
+        excluded_pass_ids = [str(pass_id) for pass_id in excluded_pass_ids]
+        query = f"""
+            SELECT pp.Event_ID, pt.PassTypes, COUNT(pt.PT_id)
+            FROM PassTypes pt
+            JOIN ParkingPasses pp ON pt.PP_id = pp.PP_id
+            WHERE pp.Event_ID IN ({', '.join(['%s'] * len(event_ids))})
+            {f"AND (pp.Pass_id IS NULL OR pp.Pass_id NOT IN ({', '.join(['%s'] * len(excluded_pass_ids))}))" if excluded_pass_ids else ''}
+            GROUP BY pp.Event_ID, pt.PassTypes
+        """
+        rows = self.db_service.execute_query(query, tuple(event_ids + excluded_pass_ids), fetch=True) or []
+        return {(str(event_id), pass_type): count for event_id, pass_type, count in rows}
+
+    def stored_pass_ids(self, pass_ids):
+        """The PP_id of each stored pass by its SKY API ID, or None if they could not be read"""
+        pass_ids = list(dict.fromkeys(str(pass_id) for pass_id in pass_ids))
+        rows = self.db_service.execute_query(
+            f"SELECT Pass_id, PP_id FROM ParkingPasses WHERE Pass_id IN ({', '.join(['%s'] * len(pass_ids))})",
+            tuple(pass_ids),
+            fetch=True
+        )
+        if rows is None:
+            return None
+        return {str(pass_id): pp_id for pass_id, pp_id in rows}
 
     def handle_parking_pass_sync_message(self, ch, method, properties, body):
-        """Handle parking pass sync messages from the message broker"""
+        """Handle parking pass sync messages from the message broker, raising MessageFailed if the sync fails so it is retried"""
         try:
             import json
             message = json.loads(body)
             logger.info("Received parking pass sync message: {}", message)
             
+            # Notifications published by the sync services share this queue; only act on requests
+            if message.get('event'):
+                return
+            
             start_date = message.get('start_date')
             end_date = message.get('end_date')
+            mode = message.get('mode', SYNC_MODE_FULL)
             
-            if not start_date or not end_date:
+            if mode != SYNC_MODE_DELTA and (not start_date or not end_date):
                 logger.error("Missing start_date or end_date in message")
                 return
                 
-            self.sync_parking_passes(start_date, end_date)
+            if not self.sync_parking_passes(start_date, end_date, mode=mode):
+                raise MessageFailed(f"Parking pass sync ({mode}) from {start_date} to {end_date} failed")
+        except MessageFailed:
+            raise
         except Exception as e:
-            logger.error("Error handling parking pass sync message: {}", e)
\ No newline at end of file
+            logger.error("Error handling parking pass sync message: {}", e)
+            raise MessageFailed(f"Error handling parking pass sync message: {e}") from e
\ No newline at end of file
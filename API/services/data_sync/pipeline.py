@@ -0,0 +1,157 @@
+import os
+from queue import Queue, Full
+from threading import Thread, Event
+from time import monotonic
+from loguru import logger
+
+_END = object()
+
+
+class PipelineStage:
+    """Counters for one stage of a sync pipeline"""
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def stats(self):
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'items_per_second': round(self.items / self.busy_seconds, 1) if self.busy_seconds else None
+        }
+
+
+class SyncPipeline:
+    """
+    Runs a sync as three concurrent stages connected by bounded queues
+
+    - fetch: an iterable of pages, typically paging through the SKY API
+    - transform: turns one page into a write batch (decoding, fingerprinting, filtering)
+    - write: stores one batch in MySQL and checkpoints it
+
+    Each stage runs in its own thread, so the next page is fetched while the previous one is
+    being written. The queues hold at most SYNC_PIPELINE_QUEUE_SIZE items, so a slow database
+    throttles the fetcher instead of letting pages pile up in memory. Stages run in order
+    within themselves, so batches are written (and checkpointed) in the order they were fetched.
+    """
+    def __init__(self, name, fetch, transform, write, queue_size=None):
+        self.name = name
+        self.fetch = fetch
+        self.transform = transform
+        self.write = write
+        self.queue_size = int(queue_size or os.getenv('SYNC_PIPELINE_QUEUE_SIZE', '4'))
+
+        self.stages = {stage: PipelineStage(stage) for stage in ('fetch', 'transform', 'write')}
+        self.queues = {
+            'transform': Queue(maxsize=self.queue_size),
+            'write': Queue(maxsize=self.queue_size)
+        }
+        self.stop_event = Event()
+        self.error = None
+
+    def run(self):
+        """
+        Run the pipeline to completion and return its stats
+        If any stage fails the others are stopped and the first error is re-raised
+        """
+        started_at = monotonic()
+        threads = [
+            Thread(target=self._run_fetch, name=f'{self.name}-fetch', daemon=True),
+            Thread(target=self._run_transform, name=f'{self.name}-transform', daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Writes stay on the calling thread, alongside the rest of the sync's bookkeeping
+        self._run_write()
+        for thread in threads:
+            thread.join()
+
+        stats = self.stats()
+        stats['elapsed_seconds'] = round(monotonic() - started_at, 3)
+        logger.info("Pipeline {} finished in {}s: {}", self.name, stats['elapsed_seconds'], stats['stages'])
+
+        if self.error:
+            raise self.error
+        return stats
+
+    def stats(self):
+        """Per-stage throughput and the current depth of each queue"""
+        return {
+            'stages': {name: stage.stats() for name, stage in self.stages.items()},
+            'queue_depth': {name: queue.qsize() for name, queue in self.queues.items()}
+        }
+
+    def _run_fetch(self):
+        stage = self.stages['fetch']
+        try:
+            pages = iter(self.fetch())
+            while not self.stop_event.is_set():
+                started_at = monotonic()
+                page = next(pages, _END)
+                stage.busy_seconds += monotonic() - started_at
+                if page is _END:
+                    break
+                stage.items += 1
+                self._put('transform', page)
+        except Exception as e:
+            self._fail('fetch', e)
+        finally:
+            self._put('transform', _END)
+
+    def _run_transform(self):
+        stage = self.stages['transform']
+        while True:
+            page = self._get('transform')
+            if page is _END:
+                break
+            # Once stopped, keep draining so the fetcher is never left blocked on a full queue
+            if self.stop_event.is_set():
+                continue
+            try:
+                started_at = monotonic()
+                batch = self.transform(page)
+                stage.busy_seconds += monotonic() - started_at
+                stage.items += 1
+            except Exception as e:
+                self._fail('transform', e)
+                continue
+            self._put('write', batch)
+        self._put('write', _END)
+
+    def _run_write(self):
+        stage = self.stages['write']
+        while True:
+            batch = self._get('write')
+            if batch is _END:
+                break
+            if self.stop_event.is_set():
+                continue
+            try:
+                started_at = monotonic()
+                self.write(batch)
+                stage.busy_seconds += monotonic() - started_at
+                stage.items += 1
+            except Exception as e:
+                self._fail('write', e)
+
+    def _put(self, queue_name, item):
+        """Put with backpressure, dropping data (but never the end marker) once the pipeline has stopped"""
+        queue = self.queues[queue_name]
+        while True:
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                if self.stop_event.is_set() and item is not _END:
+                    return
+
+    def _get(self, queue_name):
+        return self.queues[queue_name].get()
+
+    def _fail(self, stage_name, error):
+        logger.error("Pipeline {} {} stage failed: {}", self.name, stage_name, error)
+        if self.error is None:
+            self.error = error
+        self.stop_event.set()
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD string (or the date part of an ISO timestamp) into a date"""
+    return datetime.strptime(value[:10], DATE_FORMAT).date()
+
+
+def format_date(value):
+    """Format a date as YYYY-MM-DD"""
+    return value.strftime(DATE_FORMAT)
+
+
+def split_date_range(start_date: str, end_date: str, shard_days: int = 1):
+    """
+    Split a start_date..end_date window into consecutive shards of shard_days each
+
+    Shards are half-open [start, end) windows that share their boundaries, matching the
+    today..tomorrow convention used by the scheduler. A window whose end is not after its
+    start (e.g. today..today) is returned as a single shard.
+    """
+    start = parse_date(start_date)
+    end = parse_date(end_date)
+    shard_days = max(1, int(shard_days))
+
+    if end <= start:
+        return [(format_date(start), format_date(end))]
+
+    shards = []
+    shard_start = start
+    while shard_start < end:
+        shard_end = min(shard_start + timedelta(days=shard_days), end)
+        shards.append((format_date(shard_start), format_date(shard_end)))
+        shard_start = shard_end
+    return shards
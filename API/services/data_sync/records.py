@@ -0,0 +1,138 @@
+"""
+Compact record types for the SKY API payloads handled by the sync services
+
+Each record keeps only the fields that end up in FireworksDB, in __slots__ rather than a
+per-instance dict, and is decoded from the API JSON in a single pass by its from_api
+constructor. Field normalization (nested lookups, defaults, boolean flags) lives here so the
+sync services only ever read plain attributes. Column type coercion for the database happens
+batch-wise in columnar.py.
+"""
+
+
+def _first(values, index):
+    """Return values[index] from an optional list, or None"""
+    if values and len(values) > index:
+        return values[index]
+    return None
+
+
+class ConstituentRecord:
+    """A constituent, holding the Customers columns"""
+    __slots__ = (
+        'altru_id', 'member_id', 'membership_level', 'first_name', 'last_name', 'phone', 'email',
+        'address1', 'address2', 'city', 'state', 'postal_code', 'attended', 'paid', 'status',
+        'date_modified'
+    )
+
+    @classmethod
+    def from_api(cls, data, altru_id=None):
+        record = cls.__new__(cls)
+        get = data.get
+        address_lines = get('address_lines')
+        membership = get('membership') or {}
+        payment_status = get('payment_status') or {}
+
+        record.altru_id = altru_id or get('id')
+        record.member_id = get('member_id')
+        record.membership_level = membership.get('level')
+        record.first_name = get('first_name')
+        record.last_name = get('last_name')
+        record.phone = get('phone')
+        record.email = get('email')
+        record.address1 = _first(address_lines, 0)
+        record.address2 = _first(address_lines, 1)
+        record.city = get('city')
+        record.state = get('state')
+        record.postal_code = get('postal_code')
+        record.attended = get('attended')
+        record.paid = payment_status.get('is_paid')
+        record.status = get('status')
+        record.date_modified = get('date_modified')
+        return record
+
+    @property
+    def id(self):
+        return self.altru_id
+
+
+class EventRecord:
+    """An event, holding the Events columns and its coordinator"""
+    __slots__ = (
+        'id', 'constituent_id', 'name', 'start_date', 'coordinator_email',
+        'coordinator_first_name', 'coordinator_last_name', 'coordinator_phone', 'date_modified'
+    )
+
+    @classmethod
+    def from_api(cls, data):
+        record = cls.__new__(cls)
+        get = data.get
+        coordinator = get('coordinator') or {}
+
+        record.id = get('id')
+        record.constituent_id = get('constituent_id')
+        record.name = get('name')
+        record.start_date = get('start_date')
+        record.coordinator_email = coordinator.get('email')
+        record.coordinator_first_name = coordinator.get('first_name')
+        record.coordinator_last_name = coordinator.get('last_name')
+        record.coordinator_phone = coordinator.get('phone')
+        record.date_modified = get('date_modified')
+        return record
+
+    @property
+    def has_coordinator(self):
+        return any((
+            self.coordinator_email, self.coordinator_first_name,
+            self.coordinator_last_name, self.coordinator_phone
+        ))
+
+    def fingerprint_values(self):
+        """The source fields that determine an Events row, including its coordinator"""
+        return (
+            self.constituent_id, self.coordinator_email, self.coordinator_first_name,
+            self.coordinator_last_name, self.coordinator_phone, self.name, self.start_date
+        )
+
+
+class TicketRecord:
+    """A ticket, stored as a Wristbands row"""
+    __slots__ = ('id', 'event_id', 'issued_at', 'date_modified')
+
+    @classmethod
+    def from_api(cls, data):
+        record = cls.__new__(cls)
+        get = data.get
+        record.id = get('id')
+        record.event_id = get('event_id')
+        record.issued_at = get('issued_at')
+        record.date_modified = get('date_modified')
+        return record
+
+    def fingerprint_values(self):
+        return (self.event_id, self.issued_at)
+
+
+class ParkingPassRecord:
+    """A parking pass, stored as a ParkingPasses row and its PassTypes row"""
+    __slots__ = ('id', 'event_id', 'issued_at', 'pass_type', 'cost', 'date_modified')
+
+    @classmethod
+    def from_api(cls, data):
+        record = cls.__new__(cls)
+        get = data.get
+        record.id = get('id')
+        record.event_id = get('event_id')
+        record.issued_at = get('issued_at')
+        record.pass_type = get('pass_type')
+        record.cost = get('cost', 0.00)
+        record.date_modified = get('date_modified')
+        return record
+
+    def fingerprint_values(self):
+        return (self.event_id, self.issued_at, self.pass_type, self.cost)
+
+
+def decode_all(record_type, items):
+    """Decode a list of API JSON objects into records of the given type"""
+    from_api = record_type.from_api
+    return [from_api(item) for item in items]
@@ -1,34 +1,78 @@
 from loguru import logger
 from mysql.connector import Error
+from API.services.message_broker.backend import MessageFailed
+from API.services.message_broker.sync_publisher import SyncEventPublisher
+from .sync_state import SyncStateService, SYNC_MODE_FULL, SYNC_MODE_DELTA
+from .fingerprint import ChangeDetector, row_fingerprint
+from .checkpoint import SyncRunService, RUN_STATUS_COMPLETED, RUN_STATUS_PARTIAL_FAILURE
+from .ranges import split_date_range
+from .pipeline import SyncPipeline
+from .records import TicketRecord, decode_all
+from .columnar import ticket_batch
 
 class WristbandSyncService:
     """
     Service responsible for syncing wristband (ticket) data from the Blackbaud API to the local database
     """
+    ENTITY = 'wristband'
+
     def __init__(self, db_service, api_connector):
         self.db_service = db_service
         self.api_connector = api_connector
+        self.sync_state = SyncStateService(db_service)
+        self.change_detector = ChangeDetector(db_service, 'Wristbands', 'Ticket_id')
+        self.sync_runs = SyncRunService(db_service)
         self.message_broker = None  # Will be set if event-driven
 
     def set_message_broker(self, message_broker):
         """Set a message broker for event-driven sync"""
         self.message_broker = message_broker
 
-    def sync_wristbands(self, start_date: str, end_date: str) -> bool:
+    def sync_wristbands(self, start_date: str = None, end_date: str = None, mode: str = SYNC_MODE_FULL) -> bool:
         """
         Sync wristband (ticket) data from Altru to local database
+        Full syncs page through the range one shard at a time and checkpoint after every page,
+        so an interrupted run resumes from its last checkpoint instead of starting over
         """
-        logger.info("Starting wristbands sync from {} to {}", start_date, end_date)
-        
-        # Get tickets from Blackbaud API
-        tickets_data = self.api_connector.get_tickets(start_date, end_date)
-        if not tickets_data:
-            logger.error("No wristband or ticket data returned from {} to {}", start_date, end_date)
+        publisher = SyncEventPublisher(self.message_broker, 'wristband_sync_events')
+        counts = {'success': 0, 'failed': 0, 'skipped': 0}
+        run = None
+
+        modified_since = None
+        if mode == SYNC_MODE_DELTA:
+            modified_since = self.sync_state.get_watermark(self.ENTITY)
+            logger.info("Starting wristbands delta sync since {}", modified_since)
+            tickets_data = self.sync_state.fetch_changes(self.api_connector.get_tickets, modified_since)
+            if tickets_data is None:
+                # Not a quiet period, so nothing is recorded for the adaptive cadence
+                logger.error("Failed to fetch wristbands changed since {}", modified_since)
+                return False
+            if not tickets_data:
+                logger.info("No wristbands changed since {}", modified_since)
+                self.sync_state.record_changes(self.ENTITY, 0)
+                return True
             
-            # Publish event for empty data if message broker is available
-            if self.message_broker:
-                self.message_broker.publish_message(
-                    'wristband_sync_events', 
+            tickets_data = decode_all(TicketRecord, tickets_data)
+            self.sync_chunk(tickets_data, publisher, counts)
+            
+            # Only move the watermark once every changed record is stored, otherwise retry them next run
+            if counts['failed'] == 0:
+                self.sync_state.advance_watermark(self.ENTITY, self.sync_state.high_water_mark(tickets_data))
+            self.sync_state.record_changes(self.ENTITY, counts['success'])
+        else:
+            logger.info("Starting wristbands sync from {} to {}", start_date, end_date)
+            run = self.sync_runs.start_or_resume(self.ENTITY, start_date, end_date)
+            fetched_count = self.sync_range(start_date, end_date, run, publisher, counts)
+
+            if run.get('fetch_failed'):
+                # Left running, so a retry (or the interrupted run sweep) resumes it from its checkpoint
+                logger.error("Wristbands sync from {} to {} interrupted by a failed fetch", start_date, end_date)
+            elif not fetched_count and not run['resumed']:
+                logger.info("No wristband or ticket data returned from {} to {}", start_date, end_date)
+                self.sync_runs.finish(run, RUN_STATUS_COMPLETED)
+                
+                # Publish event for empty data
+                publisher.summary(
                     {
                         'event': 'wristband_sync_empty',
                         'start_date': start_date,
@@ -36,87 +80,184 @@ class WristbandSyncService:
                         'status': 'no_data'
                     }
                 )
-            return False
-
-        success_count = 0
-        failed_count = 0
-
-        # Process each ticket/wristband
-        for ticket in tickets_data:
-            query = """
-                INSERT INTO Wristbands (Event_ID, Issued)
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE
-                Issued = VALUES(Issued)
-            """
-
-            data = (
-                ticket.get('event_id'),
-                ticket.get('issued_at')
-            )
-            
-            result = self.db_service.execute_query(query, data)
-            
-            if result:
-                success_count += 1
-                # Notify that a wristband was synced if message broker is available
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'wristband_sync_events', 
-                        {
-                            'event': 'wristband_synced',
-                            'wristband_id': result,  # This would be the last inserted ID
-                            'event_id': ticket.get('event_id'),
-                            'status': 'success'
-                        }
-                    )
+                # A range with nothing in it is synced, not failed
+                return True
             else:
-                failed_count += 1
-                # Notify that a wristband sync failed if message broker is available
-                if self.message_broker:
-                    self.message_broker.publish_message(
-                        'wristband_sync_events', 
-                        {
-                            'event': 'wristband_sync_failed',
-                            'event_id': ticket.get('event_id'),
-                            'status': 'failed'
-                        }
-                    )
-
-        total = success_count + failed_count
-        logger.info("Synced {}/{} wristbands from {} to {}", success_count, total, start_date, end_date)
+                self.sync_runs.finish(run, RUN_STATUS_COMPLETED if counts['failed'] == 0 else RUN_STATUS_PARTIAL_FAILURE)
+
+        success_count = counts['success']
+        failed_count = counts['failed']
+        skipped_count = counts['skipped']
+        interrupted = bool(run and run.get('fetch_failed'))
+        total = success_count + failed_count + skipped_count
+        logger.info(
+            "Synced {}/{} wristbands from {} to {} (Changed: {}, Unchanged: {})",
+            success_count + skipped_count, total, start_date, end_date, success_count, skipped_count
+        )
         
-        # Publish summary event if message broker is available
-        if self.message_broker:
-            self.message_broker.publish_message(
-                'wristband_sync_events',
-                {
-                    'event': 'wristbands_sync_completed',
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'success_count': success_count,
-                    'failed_count': failed_count,
-                    'total': total,
-                    'status': 'success' if failed_count == 0 else 'partial_failure'
-                }
-            )
+        # Publish summary event
+        publisher.summary(
+            {
+                'event': 'wristbands_sync_completed',
+                'mode': mode,
+                'modified_since': modified_since,
+                'start_date': start_date,
+                'end_date': end_date,
+                'resumed': bool(run and run['resumed']),
+                'pipeline': run.get('pipeline') if run else None,
+                'success_count': success_count,
+                'failed_count': failed_count,
+                'changed_count': success_count,
+                'skipped_count': skipped_count,
+                'total': total,
+                'status': 'interrupted' if interrupted else 'success' if failed_count == 0 else 'partial_failure'
+            }
+        )
         
-        return failed_count == 0
+        return failed_count == 0 and not interrupted
+
+    def sync_range(self, start_date, end_date, run, publisher, counts):
+        """
+        Page through a date range shard by shard, checkpointing after every page
+        Pages are fetched, fingerprinted and written by a SyncPipeline, so the next page is
+        downloaded while the previous one is being stored. Shards and pages before the run's
+        checkpoint are skipped. Returns the number of tickets fetched
+        """
+        fetched = {'count': 0}
+
+        def fetch_pages():
+            for shard_start, shard_end, offset, page in self.iter_pages(start_date, end_date, run):
+                fetched['count'] += len(page)
+                yield shard_start, offset, page
+
+        def transform(item):
+            # Only the decoded records of changed rows travel on to the write stage
+            shard_start, offset, page = item
+            last_id = page[-1].get('id') if page else None
+            return shard_start, offset, last_id, self.filter_chunk(decode_all(TicketRecord, page), counts)
+
+        def write(batch):
+            shard_start, offset, last_id, changed = batch
+            self.write_chunk(changed, publisher, counts)
+            publisher.flush()
+            self.sync_runs.checkpoint(run, shard_start, offset, last_id)
+
+        pipeline = SyncPipeline(self.ENTITY, fetch_pages, transform, write)
+        run['pipeline'] = pipeline.run()
+        return fetched['count']
+
+    def iter_pages(self, start_date, end_date, run):
+        """
+        Yield (shard_start, shard_end, offset after the page, page) for every page in the range
+        from the run's checkpoint on. Each shard ends with a short (possibly empty) page.
+        A failed fetch ends the iteration early and sets the run's fetch_failed flag
+        """
+        page_size = self.sync_runs.page_size
+
+        for shard_start, shard_end in split_date_range(start_date, end_date, self.sync_runs.shard_days):
+            # Shards before the checkpoint were finished by an earlier attempt
+            if run['shard_start'] and shard_start < run['shard_start']:
+                continue
+            offset = run['page_cursor'] if shard_start == run['shard_start'] else 0
+
+            while True:
+                page = self.api_connector.get_tickets(shard_start, shard_end, offset=offset, limit=page_size)
+                if page is None:
+                    # Stop at the last checkpoint rather than skipping the rest of the shard
+                    logger.error("Failed to fetch wristbands from {} at offset {}, stopping the run", shard_start, offset)
+                    run['fetch_failed'] = True
+                    return
+                offset += len(page)
+                yield shard_start, shard_end, offset, page
+                if len(page) < page_size:
+                    break
+
+    def sync_chunk(self, tickets_data, publisher, counts):
+        """Write one chunk of tickets, skipping those whose stored fingerprint already matches"""
+        self.write_chunk(self.filter_chunk(tickets_data, counts), publisher, counts)
+
+    def filter_chunk(self, tickets_data, counts):
+        """Compare a chunk of TicketRecords against stored fingerprints and return only the (ticket_id, row_hash, ticket) that changed"""
+        items = [(ticket.id, row_fingerprint(ticket.fingerprint_values()), ticket) for ticket in tickets_data]
+        changed, skipped_count = self.change_detector.filter_changed(items)
+        counts['skipped'] += skipped_count
+        return changed
+
+    def write_chunk(self, changed, publisher, counts):
+        """
+        Upsert changed tickets as one batch
+        Columns are normalized batch-wise first; tickets without an event or ID are failed without
+        a round trip. If the batch fails, each ticket is retried on its own so one bad row doesn't
+        fail the rest
+        """
+        if not changed:
+            return
+
+        query = """
+            INSERT INTO Wristbands (Event_ID, Issued, Ticket_id, RowHash)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            Event_ID = VALUES(Event_ID), Issued = VALUES(Issued), RowHash = VALUES(RowHash)
+        """
+        batch = ticket_batch([ticket for _, _, ticket in changed])
+        batch.add('row_hash', [row_hash for _, row_hash, _ in changed])
+        rows = batch.rows('event_id', 'issued', 'ticket_id', 'row_hash')
+        valid_indexes = batch.valid_indexes()
+
+        if self.db_service.execute_many(query, rows):
+            results = [True] * len(rows)
+        else:
+            logger.warning("Batch upsert of {} wristbands failed, retrying row by row", len(rows))
+            results = [self.db_service.execute_query(query, row) for row in rows]
+
+        outcomes = dict(zip(valid_indexes, results))
+        for index, (ticket_id, _, ticket) in enumerate(changed):
+            if outcomes.get(index):
+                counts['success'] += 1
+                # Notify that a wristband was synced
+                publisher.record(
+                    {
+                        'event': 'wristband_synced',
+                        'ticket_id': ticket_id,
+                        'event_id': ticket.event_id,
+                        'status': 'success'
+                    }
+                )
+            else:
+                counts['failed'] += 1
+                # Notify that a wristband sync failed
+                publisher.record(
+                    {
+                        'event': 'wristband_sync_failed',
+                        'ticket_id': ticket_id,
+                        'event_id': ticket.event_id,
+                        'status': 'failed'
+                    }
+                )
 
     def handle_wristband_sync_message(self, ch, method, properties, body):
-        """Handle wristband sync messages from the message broker"""
+        """Handle wristband sync messages from the message broker, raising MessageFailed if the sync fails so it is retried"""
         try:
             import json
             message = json.loads(body)
             logger.info("Received wristband sync message: {}", message)
             
+            # Notifications published by the sync services share this queue; only act on requests
+            if message.get('event'):
+                return
+            
             start_date = message.get('start_date')
             end_date = message.get('end_date')
+            mode = message.get('mode', SYNC_MODE_FULL)
             
-            if not start_date or not end_date:
+            if mode != SYNC_MODE_DELTA and (not start_date or not end_date):
                 logger.error("Missing start_date or end_date in message")
                 return
                 
-            self.sync_wristbands(start_date, end_date)
+            if not self.sync_wristbands(start_date, end_date, mode=mode):
+                raise MessageFailed(f"Wristband sync ({mode}) from {start_date} to {end_date} failed")
+        except MessageFailed:
+            raise
         except Exception as e:
-            logger.error("Error handling wristband sync message: {}", e)
\ No newline at end of file
+            logger.error("Error handling wristband sync message: {}", e)
+            raise MessageFailed(f"Error handling wristband sync message: {e}") from e
\ No newline at end of file
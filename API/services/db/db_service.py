@@ -3,6 +3,7 @@ import mysql.connector
 from mysql.connector import Error
 from loguru import logger
 from dotenv import load_dotenv
+from API.services.resilience.circuit_breaker import get_circuit_breaker, MYSQL_CIRCUIT
 
 class DBService:
     """
@@ -40,10 +41,20 @@ class DBService:
         self.db_config['connection_timeout'] = 30
         self.db_config['buffered'] = True
         
+        # Shared with the worker, which pauses consumption while MySQL is unreachable
+        self.circuit_breaker = get_circuit_breaker(MYSQL_CIRCUIT)
+        
         self.initialized = True
 
     def connect_db(self):
-        """Create database connection with retry logic"""
+        """
+        Create database connection with retry logic
+        While the MySQL circuit breaker is open this fails fast, returning None without trying
+        """
+        if not self.circuit_breaker.allow_request():
+            logger.debug("MySQL circuit is open, not connecting")
+            return None
+        
         max_retries = 3
         retry_count = 0
         
@@ -52,16 +63,18 @@ class DBService:
                 connection = mysql.connector.connect(**self.db_config)
                 if connection.is_connected():
                     logger.debug("Connected to MySQL database")
+                    self.circuit_breaker.record_success()
                     return connection
             except Error as e:
                 retry_count += 1
                 logger.warning(f"Connection attempt {retry_count} failed: {e}")
                 if retry_count >= max_retries:
                     logger.error(f"Failed to connect after {max_retries} attempts: {e}")
-                    return None
+                    break
                 import time
                 time.sleep(1)  # Wait before retrying
         
+        self.circuit_breaker.record_failure()
         return None
 
     def execute_query(self, query, params=None, fetch=False):
@@ -191,6 +204,47 @@ class DBService:
             if conn.is_connected():
                 conn.close()
                 
+    def get_row_hashes(self, table, key_column, keys, chunk_size=1000):
+        """
+        Retrieve the stored content fingerprints for a set of natural keys
+        
+        Returns a dict of key -> RowHash for the keys that already exist, so sync
+        services can compare a whole batch in a few round trips instead of one per row.
+        Table and column names come from the sync services, never from user input.
+        """
+        hashes = {}
+        keys = [key for key in dict.fromkeys(keys) if key is not None]
+        if not keys:
+            return hashes
+        
+        conn = self.connect_db()
+        if not conn:
+            return None
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i:i + chunk_size]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(
+                    f"SELECT {key_column}, RowHash FROM {table} WHERE {key_column} IN ({placeholders})",
+                    tuple(chunk)
+                )
+                for key, row_hash in cursor.fetchall():
+                    hashes[str(key)] = row_hash
+            return hashes
+            
+        except Error as e:
+            logger.error(f"Error getting row hashes from {table}: {e}")
+            return None
+            
+        finally:
+            if cursor:
+                cursor.close()
+            if conn.is_connected():
+                conn.close()
+                
     def get_auto_increment_fields(self):
         """
         Get information about auto-increment fields in the database
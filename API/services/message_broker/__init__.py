@@ -1 +1,7 @@
-from .broker_service import MessageBroker
\ No newline at end of file
+from .backend import (
+    BrokerBackend, MessageFailed, create_message_broker, SYNC_QUEUE, INTERACTIVE_SYNC_QUEUE, PRIORITY_BULK, PRIORITY_INTERACTIVE
+)
+from .broker_service import MessageBroker
+from .memory_broker import InMemoryMessageBroker
+from .sync_publisher import SyncEventPublisher
+from .confirming_publisher import ConfirmingPublisher
\ No newline at end of file
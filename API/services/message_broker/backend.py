@@ -0,0 +1,274 @@
+import os
+from abc import ABC, abstractmethod
+from loguru import logger
+
+# Sync requests travel in two lanes: interactive requests (a user waiting on the result) get their
+# own queue and consumers, so they never wait behind bulk work such as full syncs and backfills
+SYNC_QUEUE = 'sync_queue'
+INTERACTIVE_SYNC_QUEUE = 'sync_queue.interactive'
+PRIORITY_BULK = 'bulk'
+PRIORITY_INTERACTIVE = 'interactive'
+SYNC_QUEUES = {
+    PRIORITY_BULK: SYNC_QUEUE,
+    PRIORITY_INTERACTIVE: INTERACTIVE_SYNC_QUEUE
+}
+
+BACKEND_RABBITMQ = 'rabbitmq'
+BACKEND_MEMORY = 'memory'
+
+# Headers carried by retried and dead-lettered messages
+ATTEMPT_HEADER = 'x-attempt'
+ORIGINAL_QUEUE_HEADER = 'x-original-queue'
+LAST_ERROR_HEADER = 'x-last-error'
+REPLAY_HEADER = 'x-replays'
+
+
+class MessageFailed(Exception):
+    """Raised by a message callback to fail its message; the reason is kept in x-last-error"""
+
+
+def dead_letter_queue(queue_name):
+    return f"{queue_name}.dlq"
+
+
+def retry_queue(queue_name, delay_seconds):
+    return f"{queue_name}.retry.{delay_seconds}s"
+
+
+class BrokerBackend(ABC):
+    """
+    The interface shared by every message broker backend
+
+    A backend implements declare_queue, queue_depth, publish_message, consume_messages,
+    get_message, ack_message, requeue_messages, publish_broadcast, consume_broadcast,
+    stop_consuming and close, and may override flush. Message callbacks take pika's (ch, method, properties, body) arguments; the
+    acknowledgement, retry and dead-letter handling around them lives here, so every backend
+    fails messages the same way.
+
+    A failed message is moved to a delayed retry queue, <queue>.retry.<delay>s, whose message
+    TTL dead-letters it back onto <queue> once the delay has passed. The delay starts at
+    RABBITMQ_RETRY_DELAY seconds (default 5) and doubles with each attempt up to
+    RABBITMQ_MAX_RETRY_DELAY (default 300). The attempt count travels in the x-attempt header,
+    and after RABBITMQ_MAX_ATTEMPTS attempts (default 5) the message is parked in <queue>.dlq,
+    where dead_letters() can inspect it and replay_dead_letters() can send it back.
+    """
+    max_retry_backoff = 30
+    max_attempts = 5
+    retry_delay = 5
+    max_retry_delay = 300
+
+    def init_retries(self):
+        self.max_attempts = max(1, int(os.getenv('RABBITMQ_MAX_ATTEMPTS', '5')))
+        self.retry_delay = max(1, int(os.getenv('RABBITMQ_RETRY_DELAY', '5')))
+        self.max_retry_delay = max(self.retry_delay, int(os.getenv('RABBITMQ_MAX_RETRY_DELAY', '300')))
+
+    @abstractmethod
+    def declare_queue(self, queue_name, arguments=None):
+        """Declare a durable queue, with optional x-arguments such as a message TTL"""
+
+    @abstractmethod
+    def queue_depth(self, queue_name):
+        """Messages ready in a queue, or None if the broker cannot be reached"""
+
+    @abstractmethod
+    def publish_message(self, queue_name, message, headers=None):
+        """Publish a message, serialized to JSON unless already a string; returns True once sent"""
+
+    @abstractmethod
+    def consume_messages(self, queue_name, callback, prefetch_count=None, stop_event=None):
+        """Consume a queue until stopped, settling each message through _acking_callback"""
+
+    @abstractmethod
+    def get_message(self, queue_name):
+        """Take one message without acking it: (body, headers, delivery_tag), or None if the queue is empty"""
+
+    @abstractmethod
+    def ack_message(self, delivery_tag):
+        """Acknowledge a message taken with get_message"""
+
+    @abstractmethod
+    def requeue_messages(self, delivery_tag):
+        """Return every unacknowledged message taken up to delivery_tag to its queue"""
+
+    @abstractmethod
+    def publish_broadcast(self, exchange_name, message):
+        """Publish a message to a fanout exchange, for every consume_broadcast subscriber; returns True once sent"""
+
+    @abstractmethod
+    def consume_broadcast(self, exchange_name, callback, stop_event=None):
+        """
+        Receive every message published to a fanout exchange from now on, through a queue of this
+        consumer's own that goes away when it stops. Messages are not retried; blocks like consume_messages
+        """
+
+    @abstractmethod
+    def stop_consuming(self):
+        """Stop every consumer"""
+
+    @abstractmethod
+    def close(self):
+        """Release the backend's connections"""
+
+    def flush(self, timeout=None):
+        """Block until every message published so far is safely with the broker"""
+        return True
+
+    def publish_sync_request(self, message, priority=PRIORITY_BULK):
+        """Publish a sync request to the queue for its priority lane, tagging it with the priority"""
+        if priority not in SYNC_QUEUES:
+            logger.warning(f"Unknown sync priority {priority}, publishing as {PRIORITY_BULK}")
+            priority = PRIORITY_BULK
+        return self.publish_message(SYNC_QUEUES[priority], dict(message, priority=priority))
+
+    def _acking_callback(self, queue_name, callback):
+        """
+        Wrap a message callback with manual acknowledgement
+        A callback that raises or returns False has failed, and its message is handed to
+        retry_later before the original is acked, so the consumer moves straight on. Raising
+        MessageFailed fails the message with a reason without logging it as unhandled.
+        """
+        def on_message(ch, method, properties, body):
+            if self._process_message(queue_name, callback, ch, method, properties, body):
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            else:
+                # Never drop a message we could not park
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+        return on_message
+
+    def _process_message(self, queue_name, callback, ch, method, properties, body):
+        """
+        Run a message's callback, parking the message for a retry if it fails
+        Returns True if the message can be acked, False if it must be requeued
+        """
+        error = None
+        try:
+            succeeded = callback(ch, method, properties, body) is not False
+        except MessageFailed as e:
+            logger.warning(f"Message from {queue_name} failed: {e}")
+            succeeded = False
+            error = str(e)
+        except Exception as e:
+            logger.error(f"Unhandled error processing message from {queue_name}: {e}")
+            succeeded = False
+            error = str(e)
+
+        # Whatever the handler published must be safe before its request is acked
+        self.flush(timeout=self.max_retry_backoff)
+
+        return succeeded or self.retry_later(queue_name, body, getattr(properties, 'headers', None), error)
+
+    def _broadcast_callback(self, exchange_name, callback):
+        """Wrap a broadcast callback so a failure is logged and the consumer moves on, as nothing is retried"""
+        def on_message(ch, method, properties, body):
+            try:
+                callback(ch, method, properties, body)
+            except Exception as e:
+                logger.error(f"Error processing broadcast from {exchange_name}: {e}")
+
+        return on_message
+
+    def retry_delay_for(self, attempt):
+        """Seconds to wait before retrying after the given (1-based) failed attempt"""
+        return min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+
+    def retry_later(self, queue_name, body, headers=None, error=None):
+        """
+        Send a failed message to its delayed retry queue, or to the dead-letter queue once it has
+        used up RABBITMQ_MAX_ATTEMPTS. Returns True once the message is safely published
+        """
+        headers = dict(headers or {})
+        attempt = int(headers.get(ATTEMPT_HEADER, 0)) + 1
+        headers[ATTEMPT_HEADER] = attempt
+        headers[ORIGINAL_QUEUE_HEADER] = queue_name
+        if error:
+            headers[LAST_ERROR_HEADER] = error[:500]
+        body = body.decode() if isinstance(body, bytes) else body
+
+        if attempt >= self.max_attempts:
+            target = dead_letter_queue(queue_name)
+            self.declare_queue(target)
+        else:
+            delay = self.retry_delay_for(attempt)
+            target = retry_queue(queue_name, delay)
+            # Expired messages are dead-lettered through the default exchange back onto the original queue
+            self.declare_queue(target, arguments={
+                'x-message-ttl': delay * 1000,
+                'x-dead-letter-exchange': '',
+                'x-dead-letter-routing-key': queue_name
+            })
+
+        if not (self.publish_message(target, body, headers) and self.flush(timeout=self.max_retry_backoff)):
+            return False
+        if target.endswith('.dlq'):
+            logger.error(f"Message from {queue_name} failed {attempt} times, moved to {target}")
+        else:
+            logger.warning(f"Message from {queue_name} failed (attempt {attempt}/{self.max_attempts}), retrying via {target}")
+        return True
+
+    def dead_letters(self, queue_name, limit=50):
+        """
+        Look at up to limit messages in a queue's dead-letter queue without removing them
+        Returns a list of {'body', 'headers'} dicts, oldest first
+        """
+        messages = []
+        last_tag = None
+        dlq = dead_letter_queue(queue_name)
+        self.declare_queue(dlq)
+        try:
+            while len(messages) < limit:
+                message = self.get_message(dlq)
+                if message is None:
+                    break
+                body, headers, last_tag = message
+                messages.append({
+                    'body': body.decode() if isinstance(body, bytes) else body,
+                    'headers': headers
+                })
+        finally:
+            if last_tag is not None:
+                self.requeue_messages(last_tag)
+        return messages
+
+    def replay_dead_letters(self, queue_name, limit=None):
+        """
+        Move up to limit (default all) dead-lettered messages back onto their queue with a fresh
+        attempt count. Returns the number of messages replayed
+        """
+        replayed = 0
+        dlq = dead_letter_queue(queue_name)
+        self.declare_queue(dlq)
+        while limit is None or replayed < limit:
+            message = self.get_message(dlq)
+            if message is None:
+                break
+            body, headers, delivery_tag = message
+            replay_headers = {REPLAY_HEADER: int(headers.get(REPLAY_HEADER, 0)) + 1}
+            body = body.decode() if isinstance(body, bytes) else body
+
+            if not (self.publish_message(queue_name, body, replay_headers) and self.flush(timeout=self.max_retry_backoff)):
+                self.requeue_messages(delivery_tag)
+                logger.error(f"Failed to replay a message from {dlq}, stopping after {replayed}")
+                break
+            self.ack_message(delivery_tag)
+            replayed += 1
+
+        logger.info(f"Replayed {replayed} messages from {dlq} onto {queue_name}")
+        return replayed
+
+
+def create_message_broker(backend=None):
+    """
+    Return the message broker for the backend named by MESSAGE_BROKER_BACKEND
+    'rabbitmq' (the default) or 'memory', an in-process stand-in for tests and local benchmarks.
+    The memory backend only connects publishers and consumers within one process
+    """
+    backend = (backend or os.getenv('MESSAGE_BROKER_BACKEND', BACKEND_RABBITMQ)).lower()
+    if backend == BACKEND_MEMORY:
+        from .memory_broker import InMemoryMessageBroker
+        return InMemoryMessageBroker()
+    if backend != BACKEND_RABBITMQ:
+        logger.warning(f"Unknown message broker backend {backend}, using {BACKEND_RABBITMQ}")
+
+    from .broker_service import MessageBroker
+    return MessageBroker()
@@ -1,13 +1,26 @@
 import pika
 import json
+import queue
+import threading
+import time
+import functools
 from loguru import logger
 import os
 from dotenv import load_dotenv
+from .confirming_publisher import ConfirmingPublisher
+from .backend import BrokerBackend
 
-class MessageBroker:
+class MessageBroker(BrokerBackend):
     """
     Message Broker service using RabbitMQ for event-driven communication
     This enables loose coupling between components
+
+    pika's BlockingConnection is not thread-safe, so every thread gets its own connection and
+    channel, created on first use and reused for all later publishes and consumes on that thread.
+    Dropped connections are re-established with exponential backoff.
+
+    With RABBITMQ_PUBLISH_MODE=confirm, publishes go through a ConfirmingPublisher instead:
+    batched, pipelined and confirmed by the broker, with flush() to wait for confirmation.
     """
     _instance = None
 
@@ -26,89 +39,384 @@ class MessageBroker:
         self.port = int(os.getenv('RABBITMQ_PORT', '5672'))
         self.user = os.getenv('RABBITMQ_USER', 'guest')
         self.password = os.getenv('RABBITMQ_PASS', 'guest')
+        self.connect_retries = int(os.getenv('RABBITMQ_CONNECT_RETRIES', '5'))
+        self.retry_backoff = float(os.getenv('RABBITMQ_RETRY_BACKOFF', '1'))
+        self.max_retry_backoff = float(os.getenv('RABBITMQ_MAX_RETRY_BACKOFF', '30'))
+        self.publish_mode = os.getenv('RABBITMQ_PUBLISH_MODE', 'direct').lower()
+        self.prefetch_count = int(os.getenv('RABBITMQ_PREFETCH_COUNT', '10'))
+        self.init_retries()
         
         self.initialized = True
-        self.connection = None
-        self.channel = None
+        self._local = threading.local()
+        self._connections = {}  # thread -> (connection, channel), for stop_consuming and close
+        self._connections_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._confirming_publisher = None
+    
+    @property
+    def connection(self):
+        """The calling thread's connection, if it has one"""
+        return getattr(self._local, 'connection', None)
+    
+    @property
+    def channel(self):
+        """The calling thread's channel, if it has one"""
+        return getattr(self._local, 'channel', None)
     
     def connect(self):
-        """Connect to RabbitMQ and return a channel"""
-        if self.connection and self.connection.is_open:
+        """Connect to RabbitMQ and return a channel for the calling thread"""
+        connection = self.connection
+        if connection and connection.is_open and self.channel and self.channel.is_open:
             return self.channel
-            
-        try:
-            credentials = pika.PlainCredentials(self.user, self.password)
-            parameters = pika.ConnectionParameters(
-                host=self.host,
-                port=self.port,
-                credentials=credentials
-            )
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            return self.channel
-        except Exception as e:
-            logger.error(f"Failed to connect to RabbitMQ: {e}")
-            return None
+        
+        self._discard_connection()
+        parameters = self._connection_parameters()
+        
+        delay = self.retry_backoff
+        for attempt in range(1, self.connect_retries + 1):
+            try:
+                connection = pika.BlockingConnection(parameters)
+                channel = connection.channel()
+                break
+            except Exception as e:
+                logger.error(f"Failed to connect to RabbitMQ (attempt {attempt}/{self.connect_retries}): {e}")
+                if attempt == self.connect_retries:
+                    return None
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_backoff)
+        
+        self._local.connection = connection
+        self._local.channel = channel
+        with self._connections_lock:
+            self._connections[threading.current_thread()] = (connection, channel)
+        return channel
+    
+    def _connection_parameters(self):
+        credentials = pika.PlainCredentials(self.user, self.password)
+        return pika.ConnectionParameters(
+            host=self.host,
+            port=self.port,
+            credentials=credentials
+        )
+    
+    def _get_confirming_publisher(self):
+        with self._connections_lock:
+            if self._confirming_publisher is None:
+                self._confirming_publisher = ConfirmingPublisher(self._connection_parameters())
+            return self._confirming_publisher
+    
+    def _discard_connection(self):
+        """Forget the calling thread's connection, closing it if it is still open"""
+        connection = self.connection
+        self._local.connection = None
+        self._local.channel = None
+        with self._connections_lock:
+            self._connections.pop(threading.current_thread(), None)
+        
+        if connection and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
     
-    def declare_queue(self, queue_name):
-        """Declare a new queue"""
+    def declare_queue(self, queue_name, arguments=None):
+        """Declare a new queue, with optional x-arguments such as a message TTL"""
         channel = self.connect()
         if channel:
-            channel.queue_declare(queue=queue_name, durable=True)
+            channel.queue_declare(queue=queue_name, durable=True, arguments=arguments)
             logger.info(f"Queue {queue_name} declared")
             return True
         return False
     
-    def publish_message(self, queue_name, message):
-        """Publish a message to a queue"""
+    def queue_depth(self, queue_name):
+        """Messages ready in a queue, from a passive declare; None if the broker cannot be reached"""
         channel = self.connect()
         if not channel:
-            return False
-            
+            return None
         try:
-            if not isinstance(message, str):
-                message = json.dumps(message)
+            return channel.queue_declare(queue=queue_name, durable=True, passive=True).method.message_count
+        except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+            # A failed passive declare closes the channel, so start afresh next time
+            logger.warning(f"Failed to read depth of {queue_name}: {e}")
+            self._discard_connection()
+            return None
+    
+    def publish_message(self, queue_name, message, headers=None):
+        """Publish a message to a queue, reconnecting once if the thread's connection has dropped"""
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        
+        if self.publish_mode == 'confirm':
+            return self._get_confirming_publisher().publish(queue_name, message, headers)
+        
+        for attempt in range(2):
+            channel = self.connect()
+            if not channel:
+                return False
                 
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue_name,
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
+            try:
+                channel.basic_publish(
+                    exchange='',
+                    routing_key=queue_name,
+                    body=message,
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        headers=headers
+                    )
                 )
-            )
-            logger.info(f"Published message to {queue_name}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to publish message: {e}")
-            return False
+                logger.info(f"Published message to {queue_name}")
+                return True
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                logger.warning(f"Connection lost while publishing to {queue_name}, reconnecting: {e}")
+                self._discard_connection()
+            except Exception as e:
+                logger.error(f"Failed to publish message: {e}")
+                return False
+        
+        logger.error(f"Failed to publish message to {queue_name} after reconnecting")
+        return False
     
-    def consume_messages(self, queue_name, callback):
-        """Start consuming messages from a queue with a callback function"""
+    def get_message(self, queue_name):
+        """
+        Take one message from a queue without acknowledging it
+        Returns (body, headers, delivery_tag), or None if the queue is empty
+        """
         channel = self.connect()
         if not channel:
-            return False
-            
+            return None
+        method, properties, body = channel.basic_get(queue=queue_name, auto_ack=False)
+        if method is None:
+            return None
+        return body, properties.headers or {}, method.delivery_tag
+    
+    def ack_message(self, delivery_tag):
+        self.channel.basic_ack(delivery_tag=delivery_tag)
+    
+    def requeue_messages(self, delivery_tag):
+        """Return every unacknowledged message taken up to delivery_tag to its queue"""
+        self.channel.basic_nack(delivery_tag=delivery_tag, multiple=True, requeue=True)
+    
+    def flush(self, timeout=None):
+        """
+        Block until every message published so far is confirmed by the broker
+        Direct publishes are synchronous, so there is nothing to wait for outside confirm mode
+        """
+        if self._confirming_publisher is None:
+            return True
+        return self._confirming_publisher.flush(timeout)
+    
+    def consume_messages(self, queue_name, callback, prefetch_count=None, stop_event=None):
+        """
+        Start consuming messages from a queue with a callback function
+        The broker hands this consumer at most prefetch_count unacknowledged messages at a time
+        (RABBITMQ_PREFETCH_COUNT by default), so a backlog is shared out across consumers and
+        replicas. Each message is acked once the callback succeeds; see _acking_callback for failures.
+        Callbacks run one at a time, in delivery order, on a handler thread of this consumer while
+        this thread keeps servicing the connection, so heartbeats go on through syncs of any length.
+        Blocks until stop_consuming is called, or stop_event is set to stop just this consumer,
+        reconnecting with backoff if the connection drops
+        """
+        prefetch_count = prefetch_count or self.prefetch_count
+        deliveries = queue.Queue()
+        stopped = threading.Event()
+        handler = threading.Thread(
+            target=self._handle_deliveries,
+            args=(queue_name, callback, deliveries, stopped),
+            name=f"{threading.current_thread().name}-handler",
+            daemon=True
+        )
+        handler.start()
+        
+        def on_message(ch, method, properties, body):
+            deliveries.put((ch, method, properties, body))
+        
         try:
-            self.declare_queue(queue_name)
-            channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
-            logger.info(f"Started consuming messages from {queue_name}")
-            channel.start_consuming()
-        except Exception as e:
-            logger.error(f"Failed to consume messages: {e}")
-            return False
+            delay = self.retry_backoff
+            while not self._stopping.is_set() and not (stop_event and stop_event.is_set()):
+                channel = self.connect()
+                if not channel:
+                    return False
+                    
+                try:
+                    self.declare_queue(queue_name)
+                    channel.basic_qos(prefetch_count=prefetch_count)
+                    channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=False)
+                    logger.info(f"Started consuming messages from {queue_name} (prefetch {prefetch_count})")
+                    if stop_event is None:
+                        channel.start_consuming()
+                    else:
+                        # Poll so the consumer can be stopped on its own; closing the channel requeues anything unacked
+                        while not self._stopping.is_set() and not stop_event.is_set():
+                            self.connection.process_data_events(time_limit=1)
+                    break
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                    logger.warning(f"Lost connection while consuming from {queue_name}, reconnecting in {delay}s: {e}")
+                    self._discard_connection()
+                    self._stopping.wait(delay)
+                    delay = min(delay * 2, self.max_retry_backoff)
+                except Exception as e:
+                    logger.error(f"Failed to consume messages: {e}")
+                    return False
+            return True
+        finally:
+            # Let the message in hand finish and be acked; the broker redelivers any still queued
+            stopped.set()
+            deliveries.put(None)
+            self._wait_for_handler(handler)
+            self._discard_connection()
+    
+    def _handle_deliveries(self, queue_name, callback, deliveries, stopped):
+        """Run a consumer's callbacks in delivery order, handing each ack back to the consuming thread"""
+        while True:
+            delivery = deliveries.get()
+            if delivery is None:
+                break
+            ch, method, properties, body = delivery
+            # Deliveries from a dropped channel, or still queued at shutdown, are redelivered by the broker
+            if stopped.is_set() or not ch.is_open:
+                continue
+            
+            try:
+                acked = self._process_message(queue_name, callback, ch, method, properties, body)
+            except Exception as e:
+                logger.error(f"Failed to handle a message from {queue_name}: {e}")
+                acked = False
+            if acked:
+                settle = functools.partial(ch.basic_ack, delivery_tag=method.delivery_tag)
+            else:
+                # Never drop a message we could not park
+                settle = functools.partial(ch.basic_nack, delivery_tag=method.delivery_tag, requeue=True)
+            try:
+                ch.connection.add_callback_threadsafe(settle)
+            except Exception as e:
+                logger.warning(f"Could not settle a message from {queue_name}, it will be redelivered: {e}")
+        
+        # Callbacks publish on this thread's own connection
+        self._discard_connection()
+    
+    def _wait_for_handler(self, handler):
+        """Service the calling thread's connection until a consumer's handler thread exits, so its last ack goes out"""
+        while handler.is_alive():
+            connection = self.connection
+            if connection and connection.is_open:
+                try:
+                    connection.process_data_events(time_limit=1)
+                    continue
+                except Exception as e:
+                    logger.warning(f"Lost connection while waiting for a message handler: {e}")
+            handler.join(timeout=1)
+    
+    def publish_broadcast(self, exchange_name, message):
+        """
+        Publish a message to a fanout exchange, reconnecting once if the thread's connection has dropped
+        Broadcasts are direct even in confirm mode: subscribers that miss one are expected to cope
+        """
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        
+        for attempt in range(2):
+            channel = self.connect()
+            if not channel:
+                return False
+            
+            try:
+                channel.exchange_declare(exchange=exchange_name, exchange_type='fanout', durable=True)
+                channel.basic_publish(exchange=exchange_name, routing_key='', body=message)
+                logger.info(f"Broadcast message to {exchange_name}")
+                return True
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                logger.warning(f"Connection lost while broadcasting to {exchange_name}, reconnecting: {e}")
+                self._discard_connection()
+            except Exception as e:
+                logger.error(f"Failed to broadcast message: {e}")
+                return False
+        
+        logger.error(f"Failed to broadcast message to {exchange_name} after reconnecting")
+        return False
+    
+    def consume_broadcast(self, exchange_name, callback, stop_event=None):
+        """
+        Receive every message published to a fanout exchange from now on
+        Each call binds an exclusive, auto-delete queue of its own, so every process subscribed gets
+        every message, and the broker deletes the queue when this consumer disconnects. Messages are
+        auto-acked and handled on this thread, so callbacks must be quick. Blocks like consume_messages,
+        resubscribing with backoff if the connection drops
+        """
+        on_message = self._broadcast_callback(exchange_name, callback)
+        
+        delay = self.retry_backoff
+        while not self._stopping.is_set() and not (stop_event and stop_event.is_set()):
+            channel = self.connect()
+            if not channel:
+                return False
+            
+            try:
+                channel.exchange_declare(exchange=exchange_name, exchange_type='fanout', durable=True)
+                queue_name = channel.queue_declare(queue='', exclusive=True, auto_delete=True).method.queue
+                channel.queue_bind(queue=queue_name, exchange=exchange_name)
+                channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=True)
+                logger.info(f"Subscribed to {exchange_name} through {queue_name}")
+                if stop_event is None:
+                    channel.start_consuming()
+                else:
+                    while not self._stopping.is_set() and not stop_event.is_set():
+                        self.connection.process_data_events(time_limit=1)
+                break
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                logger.warning(f"Lost connection while subscribed to {exchange_name}, resubscribing in {delay}s: {e}")
+                self._discard_connection()
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_retry_backoff)
+            except Exception as e:
+                logger.error(f"Failed to subscribe to {exchange_name}: {e}")
+                self._discard_connection()
+                return False
+        
+        self._discard_connection()
+        return True
     
     def stop_consuming(self):
-        """Stop consuming messages"""
-        if self.channel:
+        """
+        Stop consuming on every thread
+        Each channel is stopped from its own thread's I/O loop, since pika connections are not thread-safe
+        """
+        self._stopping.set()
+        with self._connections_lock:
+            connections = list(self._connections.items())
+        
+        for thread, (connection, channel) in connections:
+            if not connection.is_open:
+                continue
             try:
-                self.channel.stop_consuming()
-                logger.info("Stopped consuming messages")
+                if thread is threading.current_thread():
+                    channel.stop_consuming()
+                else:
+                    connection.add_callback_threadsafe(channel.stop_consuming)
             except Exception as e:
                 logger.error(f"Failed to stop consuming: {e}")
+        logger.info("Stopped consuming messages")
     
     def close(self):
-        """Close the connection"""
-        if self.connection and self.connection.is_open:
-            self.connection.close()
-            logger.info("Connection closed")
\ No newline at end of file
+        """Flush confirmed publishes, then close every thread's connection"""
+        if self._confirming_publisher is not None:
+            self._confirming_publisher.close(timeout=self.max_retry_backoff)
+            self._confirming_publisher = None
+        
+        with self._connections_lock:
+            connections = list(self._connections.items())
+            self._connections.clear()
+        
+        for thread, (connection, _) in connections:
+            if not connection.is_open:
+                continue
+            try:
+                if thread is threading.current_thread() or not thread.is_alive():
+                    connection.close()
+                else:
+                    connection.add_callback_threadsafe(connection.close)
+            except Exception as e:
+                logger.error(f"Failed to close connection: {e}")
+        
+        self._local.connection = None
+        self._local.channel = None
+        logger.info("Connection closed")
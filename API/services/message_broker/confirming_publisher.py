@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import deque
+import pika
+from loguru import logger
+
+
+class ConfirmingPublisher:
+    """
+    Pipelined RabbitMQ publisher with publisher confirms
+
+    Messages are handed to a dedicated I/O thread running a pika SelectConnection with
+    confirm-select enabled. They are published in batches, flushed whenever
+    RABBITMQ_PUBLISH_BATCH_SIZE messages are waiting or every RABBITMQ_PUBLISH_BATCH_MS
+    milliseconds, without waiting for each one to be confirmed. At most RABBITMQ_CONFIRM_WINDOW
+    messages may be unconfirmed at once; publish() blocks beyond that.
+
+    A nacked message, or one left unconfirmed when the connection drops, is published again,
+    so delivery is at-least-once. flush() blocks until everything published so far is confirmed.
+    """
+    def __init__(self, parameters, window=None, batch_size=None, batch_interval_ms=None):
+        self.parameters = parameters
+        self.window = int(window or os.getenv('RABBITMQ_CONFIRM_WINDOW', '1000'))
+        self.batch_size = int(batch_size or os.getenv('RABBITMQ_PUBLISH_BATCH_SIZE', '100'))
+        self.batch_interval = int(batch_interval_ms or os.getenv('RABBITMQ_PUBLISH_BATCH_MS', '50')) / 1000
+        self.retry_backoff = float(os.getenv('RABBITMQ_RETRY_BACKOFF', '1'))
+        self.max_retry_backoff = float(os.getenv('RABBITMQ_MAX_RETRY_BACKOFF', '30'))
+
+        self._condition = threading.Condition()
+        self._pending = deque()  # (queue_name, body, headers) waiting to be published
+        self._unconfirmed = {}  # delivery tag -> (queue_name, body, headers)
+        self._next_tag = 0
+        self._drain_scheduled = False
+
+        self._connection = None
+        self._channel = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rabbitmq-publisher', daemon=True)
+        self._thread.start()
+
+    @property
+    def outstanding(self):
+        """Messages accepted but not yet confirmed by the broker"""
+        with self._condition:
+            return len(self._pending) + len(self._unconfirmed)
+
+    def publish(self, queue_name, body, headers=None):
+        """Queue a message for publishing, blocking while the in-flight window is full"""
+        with self._condition:
+            while len(self._pending) + len(self._unconfirmed) >= self.window and not self._stopping.is_set():
+                self._condition.wait()
+            if self._stopping.is_set():
+                logger.error(f"Publisher is closed, dropping message for {queue_name}")
+                return False
+
+            self._pending.append((queue_name, body, headers))
+            if len(self._pending) >= self.batch_size:
+                self._schedule_drain()
+        return True
+
+    def flush(self, timeout=None):
+        """Publish everything pending and wait until the broker has confirmed it all"""
+        with self._condition:
+            self._schedule_drain()
+            flushed = self._condition.wait_for(
+                lambda: not self._pending and not self._unconfirmed, timeout
+            )
+        if not flushed:
+            logger.warning(f"Publisher flush timed out with {self.outstanding} messages unconfirmed")
+        return flushed
+
+    def close(self, timeout=None):
+        """Flush, then stop the I/O thread"""
+        self.flush(timeout)
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()
+
+        connection = self._connection
+        if connection:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_connection)
+            except Exception:
+                pass
+        self._thread.join(timeout)
+
+    def _schedule_drain(self):
+        """Ask the I/O thread to publish the pending batch; call with the condition held"""
+        connection = self._connection
+        if self._drain_scheduled or not connection or not self._channel:
+            return
+        self._drain_scheduled = True
+        try:
+            connection.ioloop.add_callback_threadsafe(self._drain)
+        except Exception:
+            self._drain_scheduled = False
+
+    # Everything below runs on the I/O thread
+
+    def _run(self):
+        self._reconnect_delay = self.retry_backoff
+        while not self._stopping.is_set():
+            self._connection = pika.SelectConnection(
+                self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed
+            )
+            self._connection.ioloop.start()
+
+            if self._stopping.is_set():
+                break
+            logger.info(f"Reconnecting publisher in {self._reconnect_delay}s")
+            self._stopping.wait(self._reconnect_delay)
+            self._reconnect_delay = min(self._reconnect_delay * 2, self.max_retry_backoff)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error(f"Publisher failed to connect to RabbitMQ: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        with self._condition:
+            self._channel = None
+            self._drain_scheduled = False
+            # Anything unconfirmed may not have arrived, so publish it again on the next connection
+            requeue = [self._unconfirmed[tag] for tag in sorted(self._unconfirmed)]
+            self._unconfirmed.clear()
+            self._pending.extendleft(reversed(requeue))
+            self._condition.notify_all()
+        if not self._stopping.is_set():
+            logger.warning(f"Publisher connection closed ({reason}), {len(requeue)} unconfirmed messages will be republished")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        with self._condition:
+            self._channel = channel
+            self._next_tag = 0
+        self._reconnect_delay = self.retry_backoff
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation)
+        logger.info("Publisher channel opened with confirms enabled")
+        self._tick()
+
+    def _on_channel_closed(self, channel, reason):
+        logger.warning(f"Publisher channel closed: {reason}")
+        self._close_connection()
+
+    def _close_connection(self):
+        connection = self._connection
+        if connection and not (connection.is_closing or connection.is_closed):
+            connection.close()
+
+    def _tick(self):
+        """Publish whatever is pending every batch interval"""
+        if not self._channel:
+            return
+        self._drain()
+        self._connection.ioloop.call_later(self.batch_interval, self._tick)
+
+    def _drain(self):
+        with self._condition:
+            self._drain_scheduled = False
+            channel = self._channel
+            if not channel or not self._pending:
+                return
+            batch = []
+            while self._pending:
+                self._next_tag += 1
+                item = self._pending.popleft()
+                self._unconfirmed[self._next_tag] = item
+                batch.append(item)
+
+        try:
+            for queue_name, body, headers in batch:
+                channel.basic_publish(
+                    exchange='',
+                    routing_key=queue_name,
+                    body=body,
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        headers=headers
+                    )
+                )
+        except Exception as e:
+            # The batch is still tracked as unconfirmed and is republished once the channel reopens
+            logger.error(f"Failed to publish batch: {e}")
+
+    def _on_delivery_confirmation(self, frame):
+        method = frame.method
+        with self._condition:
+            if method.multiple:
+                tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+
+            confirmed = [self._unconfirmed.pop(tag) for tag in sorted(tags)]
+            if isinstance(method, pika.spec.Basic.Nack):
+                # The broker could not take these; publish them again rather than losing them
+                logger.warning(f"Broker nacked {len(confirmed)} messages, republishing")
+                self._pending.extend(confirmed)
+                self._schedule_drain()
+            self._condition.notify_all()
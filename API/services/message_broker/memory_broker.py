@@ -0,0 +1,345 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import count
+from types import SimpleNamespace
+from loguru import logger
+from .backend import BrokerBackend
+
+
+class _MemoryQueue:
+    """A queue's ready messages; each entry is [body, redelivered, headers, expires_at]"""
+    def __init__(self, name, arguments=None):
+        arguments = arguments or {}
+        self.name = name
+        self.ready = deque()
+        self.published = 0
+        self.acked = 0
+        ttl = arguments.get('x-message-ttl')
+        self.ttl = ttl / 1000 if ttl is not None else None
+        self.dead_letter_routing_key = arguments.get('x-dead-letter-routing-key')
+
+
+class _MemoryChannel:
+    """The ack/nack half of a pika channel, bound to one consumer"""
+    def __init__(self, broker, consumer):
+        self.broker = broker
+        self.consumer = consumer
+        self.is_open = True
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.broker._settle(self.consumer, delivery_tag, requeue=False)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.broker._settle(self.consumer, delivery_tag, requeue=requeue)
+
+
+class _Consumer:
+    def __init__(self, queue, prefetch_count, stop_event=None):
+        self.queue = queue
+        self.prefetch_count = prefetch_count
+        self.stop_event = stop_event
+        self.buffer = deque()  # delivered to this consumer but not yet handed to its callback
+        self.unacked = {}  # delivery tag -> message handed to the callback
+        self.stopped = False
+
+    @property
+    def stopping(self):
+        return self.stopped or (self.stop_event is not None and self.stop_event.is_set())
+
+
+class InMemoryMessageBroker(BrokerBackend):
+    """
+    In-process stand-in for RabbitMQ, selected with MESSAGE_BROKER_BACKEND=memory
+
+    Queues live in this process only. Whatever publishes and whatever consumes must share the
+    process, e.g. a test, or a benchmark that drives a Worker and the sync services in-process;
+    a separate API process, supervised worker processes or another replica each get an empty
+    broker of their own and never see each other's messages. It keeps the semantics the code
+    relies on:
+
+    - messages are stored as serialized bodies and delivered as bytes, like AMQP
+    - each consumer reserves at most prefetch_count messages, which other consumers cannot take
+    - acked messages are removed; nacked ones are requeued at the front, marked redelivered
+    - messages a consumer still holds when it stops are requeued, as on a dropped connection
+    - a queue declared with x-message-ttl dead-letters expired messages to its
+      x-dead-letter-routing-key, which is how delayed retries work
+    - a broadcast is copied to the private queue of every consume_broadcast subscriber
+
+    Unlike RabbitMQ, publishing to an undeclared queue declares it rather than dropping the message.
+    wait_until_idle() blocks until every queue is drained, which makes end-to-end tests deterministic.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(InMemoryMessageBroker, cls).__new__(cls)
+            cls._instance.initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self.initialized:
+            return
+
+        self.prefetch_count = int(os.getenv('RABBITMQ_PREFETCH_COUNT', '10'))
+        self.max_retry_backoff = float(os.getenv('RABBITMQ_MAX_RETRY_BACKOFF', '30'))
+
+        self.initialized = True
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._exchanges = {}  # fanout exchange -> names of the queues bound to it
+        self._consumers = []
+        self._delivery_tags = count(1)
+        self._gotten = {}  # delivery tag -> (queue name, message) taken by get_message
+        self._stopping = threading.Event()
+        self._expirer = None
+        self.init_retries()
+
+    def declare_queue(self, queue_name, arguments=None):
+        """Declare a new queue, with optional x-arguments such as a message TTL"""
+        with self._condition:
+            self._declare(queue_name, arguments)
+        return True
+
+    def _declare(self, queue_name, arguments=None):
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            queue = self._queues[queue_name] = _MemoryQueue(queue_name, arguments)
+            logger.info(f"Queue {queue_name} declared")
+            if queue.ttl is not None and self._expirer is None:
+                self._expirer = threading.Thread(target=self._expire_messages, name='memory-broker-expirer', daemon=True)
+                self._expirer.start()
+        return queue
+
+    def publish_message(self, queue_name, message, headers=None):
+        """Publish a message to a queue"""
+        if not isinstance(message, str):
+            message = json.dumps(message)
+
+        with self._condition:
+            queue = self._declare(queue_name)
+            expires_at = time.monotonic() + queue.ttl if queue.ttl is not None else None
+            queue.ready.append([message.encode(), False, headers, expires_at])
+            queue.published += 1
+            self._condition.notify_all()
+        return True
+
+    def publish_broadcast(self, exchange_name, message):
+        """Publish a message to every queue bound to a fanout exchange"""
+        if not isinstance(message, str):
+            message = json.dumps(message)
+
+        with self._condition:
+            for queue_name in self._exchanges.get(exchange_name, ()):
+                queue = self._declare(queue_name)
+                queue.ready.append([message.encode(), False, None, None])
+                queue.published += 1
+            self._condition.notify_all()
+        return True
+
+    def consume_broadcast(self, exchange_name, callback, stop_event=None):
+        """
+        Receive every message published to a fanout exchange from now on, through a queue of this
+        consumer's own that is deleted when it stops
+        """
+        queue_name = f"{exchange_name}.{uuid.uuid4().hex[:12]}"
+        with self._condition:
+            self._declare(queue_name)
+            self._exchanges.setdefault(exchange_name, set()).add(queue_name)
+        try:
+            return self.consume_messages(queue_name, self._broadcast_callback(exchange_name, callback), stop_event=stop_event)
+        finally:
+            with self._condition:
+                self._exchanges.get(exchange_name, set()).discard(queue_name)
+                self._queues.pop(queue_name, None)
+                self._condition.notify_all()
+
+    def _expire_messages(self):
+        """Dead-letter messages whose TTL has passed, waking for the next one due"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                next_expiry = None
+                for queue in list(self._queues.values()):
+                    if queue.ttl is None:
+                        continue
+                    # Like RabbitMQ, only messages at the head of the queue expire
+                    while queue.ready and queue.ready[0][3] is not None and queue.ready[0][3] <= now:
+                        body, _, headers, _ = queue.ready.popleft()
+                        queue.acked += 1
+                        if queue.dead_letter_routing_key:
+                            target = self._declare(queue.dead_letter_routing_key)
+                            target.ready.append([body, False, headers, None])
+                            target.published += 1
+                        self._condition.notify_all()
+                    if queue.ready and queue.ready[0][3] is not None:
+                        head_expiry = queue.ready[0][3]
+                        next_expiry = head_expiry if next_expiry is None else min(next_expiry, head_expiry)
+                self._condition.wait(None if next_expiry is None else max(0, next_expiry - now))
+
+    def consume_messages(self, queue_name, callback, prefetch_count=None, stop_event=None):
+        """
+        Consume messages from a queue with a callback function, acking as MessageBroker does
+        Blocks until stop_consuming is called, or stop_event is set to stop just this consumer
+        """
+        consumer = _Consumer(queue_name, prefetch_count or self.prefetch_count, stop_event)
+        channel = _MemoryChannel(self, consumer)
+        on_message = self._acking_callback(queue_name, callback)
+
+        with self._condition:
+            queue = self._declare(queue_name)
+            self._consumers.append(consumer)
+        logger.info(f"Started consuming messages from {queue_name} (prefetch {consumer.prefetch_count})")
+
+        try:
+            while True:
+                with self._condition:
+                    while not self._stopping.is_set() and not consumer.stopping:
+                        self._reserve(queue, consumer)
+                        if consumer.buffer:
+                            break
+                        # A stop_event is not tied to the condition, so check it every so often
+                        self._condition.wait(None if consumer.stop_event is None else 0.5)
+                    if self._stopping.is_set() or consumer.stopping:
+                        break
+
+                    message = consumer.buffer.popleft()
+                    body, redelivered, headers = message[:3]
+                    delivery_tag = next(self._delivery_tags)
+                    consumer.unacked[delivery_tag] = message
+
+                method = SimpleNamespace(delivery_tag=delivery_tag, redelivered=redelivered, routing_key=queue_name)
+                properties = SimpleNamespace(delivery_mode=2, headers=headers)
+                on_message(channel, method, properties, body)
+        finally:
+            with self._condition:
+                # Anything this consumer still holds goes back on the queue, as when a connection drops
+                held = [message for _, message in sorted(consumer.unacked.items())] + list(consumer.buffer)
+                consumer.unacked.clear()
+                consumer.buffer.clear()
+                for message in reversed(held):
+                    message[1] = True
+                    queue.ready.appendleft(message)
+                self._consumers.remove(consumer)
+                channel.is_open = False
+                self._condition.notify_all()
+        return True
+
+    def _reserve(self, queue, consumer):
+        """Move ready messages into a consumer's buffer up to its prefetch count; call with the condition held"""
+        while queue.ready and len(consumer.buffer) + len(consumer.unacked) < consumer.prefetch_count:
+            consumer.buffer.append(queue.ready.popleft())
+
+    def _settle(self, consumer, delivery_tag, requeue):
+        with self._condition:
+            message = consumer.unacked.pop(delivery_tag, None)
+            if message is None:
+                logger.warning(f"Unknown delivery tag {delivery_tag} on {consumer.queue}")
+                return
+            queue = self._declare(consumer.queue)
+            if requeue:
+                message[1] = True
+                queue.ready.appendleft(message)
+            else:
+                queue.acked += 1
+            self._condition.notify_all()
+
+    def get_message(self, queue_name):
+        """
+        Take one message from a queue without acknowledging it
+        Returns (body, headers, delivery_tag), or None if the queue is empty
+        """
+        with self._condition:
+            queue = self._declare(queue_name)
+            if not queue.ready:
+                return None
+            message = queue.ready.popleft()
+            delivery_tag = next(self._delivery_tags)
+            self._gotten[delivery_tag] = (queue_name, message)
+            return message[0], message[2] or {}, delivery_tag
+
+    def ack_message(self, delivery_tag):
+        with self._condition:
+            queue_name, _ = self._gotten.pop(delivery_tag)
+            self._queues[queue_name].acked += 1
+
+    def requeue_messages(self, delivery_tag):
+        """Return every unacknowledged message taken up to delivery_tag to its queue"""
+        with self._condition:
+            for tag in sorted((tag for tag in self._gotten if tag <= delivery_tag), reverse=True):
+                queue_name, message = self._gotten.pop(tag)
+                message[1] = True
+                self._declare(queue_name).ready.appendleft(message)
+            self._condition.notify_all()
+
+    def queue_depth(self, queue_name):
+        """Messages waiting in a queue, not counting those held by consumers"""
+        with self._condition:
+            queue = self._queues.get(queue_name)
+            return len(queue.ready) if queue else 0
+
+    def stats(self):
+        """Per-queue counts of ready, held (reserved or unacked), published and acked messages"""
+        with self._condition:
+            held = {}
+            for consumer in self._consumers:
+                held[consumer.queue] = held.get(consumer.queue, 0) + len(consumer.buffer) + len(consumer.unacked)
+            return {
+                name: {
+                    'ready': len(queue.ready),
+                    'held': held.get(name, 0),
+                    'published': queue.published,
+                    'acked': queue.acked
+                }
+                for name, queue in self._queues.items()
+            }
+
+    def wait_until_idle(self, timeout=None, queues=None):
+        """
+        Block until the given queues are empty and no consumer holds a message
+        Defaults to every queue except dead-letter queues, which are only drained by hand.
+        Returns False if the timeout expires first
+        """
+        def idle():
+            names = queues or [name for name in self._queues if not name.endswith('.dlq')]
+            if any(self._queues[name].ready for name in names if name in self._queues):
+                return False
+            return not any(
+                consumer.buffer or consumer.unacked
+                for consumer in self._consumers if consumer.queue in names
+            )
+
+        with self._condition:
+            return self._condition.wait_for(idle, timeout)
+
+    def reset(self, timeout=5):
+        """
+        Drop every queue and allow consuming again, e.g. between benchmark runs
+        Running consumers are stopped first and must exit within the timeout, since one still blocked
+        on a dropped queue would never see messages published after the reset
+        """
+        self.stop_consuming()
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._consumers, timeout):
+                raise RuntimeError(f"Cannot reset the broker: {len(self._consumers)} consumers did not stop")
+            self._queues.clear()
+            self._exchanges.clear()
+            self._stopping.clear()
+            self._condition.notify_all()
+
+    def stop_consuming(self):
+        """Stop every consumer once it finishes the message it is handling"""
+        self._stopping.set()
+        with self._condition:
+            for consumer in self._consumers:
+                consumer.stopped = True
+            self._condition.notify_all()
+        logger.info("Stopped consuming messages")
+
+    def close(self):
+        """Stop consuming; queued messages are kept, as a durable broker would"""
+        self.stop_consuming()
+        logger.info("Connection closed")
@@ -0,0 +1,78 @@
+import os
+from loguru import logger
+
+GRANULARITY_NONE = 'none'
+GRANULARITY_SUMMARY = 'summary'
+GRANULARITY_CHUNK = 'chunk'
+GRANULARITY_RECORD = 'record'
+
+GRANULARITIES = (GRANULARITY_NONE, GRANULARITY_SUMMARY, GRANULARITY_CHUNK, GRANULARITY_RECORD)
+
+
+class SyncEventPublisher:
+    """
+    Buffers per-record sync notifications and publishes them at a configurable granularity
+
+    - none: publish nothing
+    - summary: publish only run-level messages such as completion summaries
+    - chunk: publish one batch message per chunk of records, plus summaries
+    - record: publish every record notification individually, plus summaries
+
+    Granularity and chunk size default to the SYNC_EVENT_GRANULARITY and SYNC_EVENT_CHUNK_SIZE
+    environment variables. A publisher without a message broker silently drops everything.
+    """
+    def __init__(self, message_broker, queue_name, granularity=None, chunk_size=None):
+        self.message_broker = message_broker
+        self.queue_name = queue_name
+
+        self.granularity = (granularity or os.getenv('SYNC_EVENT_GRANULARITY', GRANULARITY_CHUNK)).lower()
+        if self.granularity not in GRANULARITIES:
+            logger.warning("Unknown sync event granularity {}, using {}", self.granularity, GRANULARITY_CHUNK)
+            self.granularity = GRANULARITY_CHUNK
+
+        self.chunk_size = max(1, int(chunk_size or os.getenv('SYNC_EVENT_CHUNK_SIZE', '500')))
+        self.buffer = []
+        self.chunk_index = 0
+
+    def record(self, message):
+        """Report a per-record notification such as wristband_synced or event_sync_failed"""
+        if not self.message_broker:
+            return
+
+        if self.granularity == GRANULARITY_RECORD:
+            self.message_broker.publish_message(self.queue_name, message)
+        elif self.granularity == GRANULARITY_CHUNK:
+            self.buffer.append(message)
+            if len(self.buffer) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Publish the buffered record notifications as a single batch message"""
+        if not self.buffer:
+            return
+
+        counts = {}
+        for message in self.buffer:
+            counts[message.get('event')] = counts.get(message.get('event'), 0) + 1
+
+        self.message_broker.publish_message(
+            self.queue_name,
+            {
+                'event': 'sync_batch',
+                'chunk': self.chunk_index,
+                'count': len(self.buffer),
+                'counts': counts,
+                'records': self.buffer
+            }
+        )
+        self.chunk_index += 1
+        self.buffer = []
+
+    def summary(self, message):
+        """Flush any pending records, then publish a run-level message"""
+        if not self.message_broker:
+            return
+
+        self.flush()
+        if self.granularity != GRANULARITY_NONE:
+            self.message_broker.publish_message(self.queue_name, message)
@@ -0,0 +1,3 @@
+from .circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, get_circuit_breaker, MYSQL_CIRCUIT, SKY_API_CIRCUIT
+)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from loguru import logger
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Shared breakers for the external dependencies every sync relies on
+MYSQL_CIRCUIT = 'mysql'
+SKY_API_CIRCUIT = 'sky_api'
+
+
+class CircuitOpenError(Exception):
+    """Raised by CircuitBreaker.call while the circuit is open"""
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit {name} is open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an unavailable dependency fast instead of letting each one time out
+
+    - closed: calls go through; failure_threshold consecutive failures open the circuit
+    - open: calls are refused until reset_timeout seconds have passed
+    - half_open: a single probe call goes through; success closes the circuit, failure reopens it
+
+    Thresholds default to CIRCUIT_FAILURE_THRESHOLD (5) and CIRCUIT_RESET_TIMEOUT (30 seconds),
+    overridable per breaker with CIRCUIT_<NAME>_FAILURE_THRESHOLD and CIRCUIT_<NAME>_RESET_TIMEOUT.
+    Callers either use call(), or check allow_request() and report the outcome with
+    record_success(), record_failure() or, for an outcome unrelated to the dependency, release().
+    """
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        prefix = f"CIRCUIT_{name.upper()}_"
+        self.name = name
+        self.failure_threshold = int(
+            failure_threshold or os.getenv(prefix + 'FAILURE_THRESHOLD', os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+        )
+        self.reset_timeout = float(
+            reset_timeout or os.getenv(prefix + 'RESET_TIMEOUT', os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+        )
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    @property
+    def is_open(self):
+        """True while calls are being refused, i.e. open and not yet due for a probe"""
+        with self._lock:
+            return self._state == STATE_OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed, 0 if calls may go through now"""
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 0
+            return max(0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow_request(self):
+        """Whether a call may go through now; in half-open state only one probe is let through at a time"""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = STATE_HALF_OPEN
+                self._probing = False
+                logger.info("Circuit {} half-open, probing", self.name)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != STATE_CLOSED:
+                logger.info("Circuit {} closed, {} has recovered", self.name, self.name)
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """Give up a call that says nothing about the dependency's health, freeing the probe slot"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    logger.warning(
+                        "Circuit {} opened after {} failures, failing fast for {}s",
+                        self.name, self._failures, self.reset_timeout
+                    )
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def call(self, func, *args, **kwargs):
+        """Call func through the breaker, raising CircuitOpenError while the circuit is open"""
+        if not self.allow_request():
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """The process-wide breaker for a dependency, created on first use"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
@@ -0,0 +1,279 @@
+import os
+import random
+from datetime import datetime, timedelta
+from loguru import logger
+
+# The sync message type for each scheduled entity
+ENTITY_SYNC_TYPES = {
+    'customer': 'customer_sync',
+    'event': 'event_sync',
+    'wristband': 'wristband_sync',
+    'parking_pass': 'parking_pass_sync',
+}
+
+# (interval, interval during the event window) for each entity, overridable through
+# SYNC_CADENCE_<ENTITY> and SYNC_CADENCE_<ENTITY>_EVENT_WINDOW
+DEFAULT_CADENCES = {
+    'customer': ('1h', None),
+    'event': ('24h', None),
+    'wristband': ('15m', '5m'),
+    'parking_pass': ('15m', '5m'),
+}
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_interval(value):
+    """
+    Parse an interval such as 30s, 15m, 1h or 1d into seconds; a bare number is minutes
+    Returns None for an empty value, and 0 (disabled) for 0
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    value = str(value).strip().lower()
+    if value[-1] in _UNITS:
+        return int(float(value[:-1]) * _UNITS[value[-1]])
+    return int(float(value) * 60)
+
+
+def parse_window(value):
+    """Parse an HH:MM-HH:MM time-of-day window, which may run past midnight; None if unset"""
+    if not value:
+        return None
+    try:
+        start, end = (datetime.strptime(part.strip(), '%H:%M').time() for part in value.split('-'))
+    except ValueError:
+        logger.warning("Invalid SYNC_EVENT_WINDOW {}, expected HH:MM-HH:MM", value)
+        return None
+    return start, end
+
+
+def in_window(window, now):
+    if not window:
+        return False
+    start, end = window
+    current = now.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class SyncCadence:
+    """
+    How often one entity is synced, with a faster interval during the event window
+    The interval adapts between min_interval and max_interval to the entity's change rate; see observe
+    """
+    def __init__(self, entity, interval, event_window_interval=None, jitter=0.1, min_interval=None, max_interval=None):
+        self.entity = entity
+        self.sync_type = ENTITY_SYNC_TYPES[entity]
+        self.interval = interval
+        self.event_window_interval = event_window_interval
+        self.jitter = jitter
+        self.min_interval = min_interval or interval
+        self.max_interval = max_interval or interval
+        self.change_rate = None
+        self.last_run = None
+        self.next_due = None
+
+    def interval_at(self, event_window):
+        if event_window and self.event_window_interval:
+            # A busy entity may already be polled faster than its event window interval
+            return min(self.event_window_interval, self.interval)
+        return self.interval
+
+    def observe(self, changed_count, smoothing, busy_changes, quiet_changes):
+        """
+        Fold one sync's changed record count into the smoothed change rate and adapt the interval
+        The interval halves while the rate is at least busy_changes per sync, and grows by half
+        while it is below quiet_changes, staying within its bounds. Returns True if it changed
+        """
+        if self.change_rate is None:
+            self.change_rate = float(changed_count)
+        else:
+            self.change_rate = smoothing * changed_count + (1 - smoothing) * self.change_rate
+
+        interval = self.interval
+        if self.change_rate >= busy_changes:
+            interval = max(self.min_interval, int(interval / 2))
+        elif self.change_rate < quiet_changes:
+            interval = min(self.max_interval, int(interval * 1.5))
+
+        if interval == self.interval:
+            return False
+        self.interval = interval
+        return True
+
+    def schedule_next(self, now, event_window):
+        """
+        Work out when the next run is due from the last one, spread by up to +/- jitter of the interval
+        A cadence that has never run, or missed runs while the scheduler was down, is due at once;
+        a single catch-up run covers the whole gap because scheduled syncs run in delta mode
+        """
+        if self.last_run is None:
+            self.next_due = now
+            return
+        interval = self.interval_at(event_window)
+        spread = random.uniform(-self.jitter, self.jitter) * interval
+        self.next_due = self.last_run + timedelta(seconds=interval + spread)
+
+    def __repr__(self):
+        return (
+            f"SyncCadence({self.entity}, every {self.interval}s in {self.min_interval}..{self.max_interval}s, "
+            f"event window {self.event_window_interval}s)"
+        )
+
+
+class CadenceSchedule:
+    """
+    Per-entity sync cadences with jitter and missed-run catch-up
+
+    Each entity has its own interval (SYNC_CADENCE_<ENTITY>, e.g. SYNC_CADENCE_WRISTBAND=15m),
+    and optionally a faster one used during the daily event window SYNC_EVENT_WINDOW
+    (e.g. 15:00-23:30), set with SYNC_CADENCE_<ENTITY>_EVENT_WINDOW. An interval of 0 disables
+    the entity. Runs are spread by up to SYNC_CADENCE_JITTER (default 0.1) of the interval so
+    entities drift apart instead of firing together. The last run of each entity is stored in
+    the SyncSchedule table, so a restarted scheduler picks up where it left off and runs any
+    overdue entity straight away.
+
+    Unless SYNC_ADAPTIVE is false, each interval then follows the entity's change rate: delta
+    syncs log how many records they changed in SyncChanges, and adapt() folds each count into an
+    exponentially smoothed rate (weight SYNC_ADAPTIVE_SMOOTHING, default 0.3). The interval halves
+    while the rate is at least SYNC_ADAPTIVE_BUSY_CHANGES per sync (default 20), and grows by half
+    while it is under SYNC_ADAPTIVE_QUIET_CHANGES (default 1), within SYNC_CADENCE_<ENTITY>_MIN and
+    SYNC_CADENCE_<ENTITY>_MAX (default a quarter of and four times the configured interval). The
+    adapted interval and rate are kept in SyncSchedule too, so they survive restarts, and the
+    SyncChanges rows folded into them are then deleted so the table stays small.
+    """
+    def __init__(self, db_service, entities=None):
+        self.db_service = db_service
+        self.event_window = parse_window(os.getenv('SYNC_EVENT_WINDOW'))
+        jitter = min(0.5, max(0.0, float(os.getenv('SYNC_CADENCE_JITTER', '0.1'))))
+        self.adaptive = os.getenv('SYNC_ADAPTIVE', 'true').lower() == 'true'
+        self.smoothing = min(1.0, max(0.01, float(os.getenv('SYNC_ADAPTIVE_SMOOTHING', '0.3'))))
+        self.busy_changes = float(os.getenv('SYNC_ADAPTIVE_BUSY_CHANGES', '20'))
+        self.quiet_changes = float(os.getenv('SYNC_ADAPTIVE_QUIET_CHANGES', '1'))
+        self.last_change_id = 0
+
+        self.cadences = []
+        for entity in (ENTITY_SYNC_TYPES if entities is None else entities):
+            default_interval, default_window_interval = DEFAULT_CADENCES[entity]
+            interval = parse_interval(os.getenv(f'SYNC_CADENCE_{entity.upper()}', default_interval))
+            window_interval = parse_interval(
+                os.getenv(f'SYNC_CADENCE_{entity.upper()}_EVENT_WINDOW', default_window_interval)
+            )
+            if not interval:
+                logger.info("Scheduled {} syncs are disabled", entity)
+                continue
+            min_interval = max_interval = interval
+            if self.adaptive:
+                min_interval = parse_interval(os.getenv(f'SYNC_CADENCE_{entity.upper()}_MIN')) or max(60, interval // 4)
+                max_interval = parse_interval(os.getenv(f'SYNC_CADENCE_{entity.upper()}_MAX')) or interval * 4
+                min_interval = min(min_interval, interval)
+                max_interval = max(max_interval, interval)
+            self.cadences.append(
+                SyncCadence(entity, interval, window_interval or None, jitter, min_interval, max_interval)
+            )
+
+        self.load_last_runs()
+
+    def in_event_window(self, now=None):
+        return in_window(self.event_window, now or datetime.now())
+
+    def load_last_runs(self):
+        """Read each entity's last scheduled run and adapted interval, and work out its next run"""
+        rows = self.db_service.execute_query(
+            "SELECT Entity, LastRunAt, IntervalSeconds, ChangeRate, LastChangeId FROM SyncSchedule", fetch=True
+        ) or []
+        stored = {row[0]: row[1:] for row in rows}
+        now = datetime.now()
+        event_window = self.in_event_window(now)
+        for cadence in self.cadences:
+            last_run, interval, change_rate, last_change_id = stored.get(cadence.entity, (None, None, None, None))
+            cadence.last_run = last_run
+            if self.adaptive and interval:
+                # The bounds may have been reconfigured since the interval was stored
+                cadence.interval = min(cadence.max_interval, max(cadence.min_interval, int(interval)))
+                cadence.change_rate = change_rate
+            if last_change_id:
+                self.last_change_id = max(self.last_change_id, last_change_id)
+            cadence.schedule_next(now, event_window)
+            if cadence.next_due <= now and cadence.last_run is not None:
+                logger.info("Scheduled {} sync is overdue since {}, catching up", cadence.entity, cadence.next_due)
+
+    def adapt(self, now=None):
+        """Fold the changed record counts logged by delta syncs since the last call into each interval"""
+        if not self.adaptive:
+            return
+        rows = self.db_service.execute_query(
+            "SELECT Change_id, Entity, ChangedCount FROM SyncChanges WHERE Change_id > %s ORDER BY Change_id",
+            (self.last_change_id,),
+            fetch=True
+        )
+        if not rows:
+            return
+
+        now = now or datetime.now()
+        cadences = {cadence.entity: cadence for cadence in self.cadences}
+        observed = set()
+        for change_id, entity, changed_count in rows:
+            self.last_change_id = change_id
+            cadence = cadences.get(entity)
+            if cadence is None:
+                continue
+            observed.add(cadence)
+            previous = cadence.interval
+            if cadence.observe(changed_count, self.smoothing, self.busy_changes, self.quiet_changes):
+                logger.info(
+                    "{} sync interval {}s -> {}s ({:.1f} changes per sync)",
+                    entity, previous, cadence.interval, cadence.change_rate
+                )
+                if cadence.last_run is not None:
+                    cadence.schedule_next(now, self.in_event_window(now))
+
+        saved = [self.save_policy(cadence) for cadence in observed]
+        # The folded rows are only needed again if a policy wasn't stored, to fold them in after a restart
+        if all(result is not None for result in saved):
+            self.db_service.execute_query("DELETE FROM SyncChanges WHERE Change_id <= %s", (self.last_change_id,))
+
+    def save_policy(self, cadence):
+        """Store an entity's adapted interval and change rate, and how far through SyncChanges it is"""
+        return self.db_service.execute_query(
+            """
+                INSERT INTO SyncSchedule (Entity, IntervalSeconds, ChangeRate, LastChangeId) VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                IntervalSeconds = VALUES(IntervalSeconds), ChangeRate = VALUES(ChangeRate),
+                LastChangeId = VALUES(LastChangeId)
+            """,
+            (cadence.entity, cadence.interval, cadence.change_rate, self.last_change_id)
+        )
+
+    def due(self, now=None):
+        """The cadences whose next run is due"""
+        now = now or datetime.now()
+        event_window = self.in_event_window(now)
+        due = []
+        for cadence in self.cadences:
+            # The event window may have opened since the next run was planned
+            if event_window and cadence.event_window_interval and cadence.last_run is not None:
+                window_due = cadence.last_run + timedelta(seconds=cadence.interval_at(event_window))
+                cadence.next_due = min(cadence.next_due, window_due)
+            if cadence.next_due <= now:
+                due.append(cadence)
+        return due
+
+    def record_run(self, cadence, now=None):
+        """Store a dispatched run and plan the next one"""
+        now = now or datetime.now()
+        cadence.last_run = now
+        cadence.schedule_next(now, self.in_event_window(now))
+        self.db_service.execute_query(
+            """
+                INSERT INTO SyncSchedule (Entity, LastRunAt) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE LastRunAt = VALUES(LastRunAt)
+            """,
+            (cadence.entity, now.strftime('%Y-%m-%d %H:%M:%S'))
+        )
+
+    def postpone(self, cadence, seconds, now=None):
+        """Check a cadence again after a short delay, e.g. while its previous run is still going"""
+        cadence.next_due = (now or datetime.now()) + timedelta(seconds=seconds)
@@ -0,0 +1,96 @@
+import os
+import socket
+import time
+import uuid
+from loguru import logger
+
+
+class LeaderElection:
+    """
+    Elects one scheduler among every API process and replica through a lease row in SchedulerLeases
+
+    The leader renews its lease every SCHEDULER_HEARTBEAT_SECONDS (default 5); it expires
+    SCHEDULER_LEASE_SECONDS (default 15) after the last renewal, at which point the first follower
+    to try takes over. Acquiring and renewing are a single upsert that only changes the holder once
+    the lease has expired, judged by the database clock so replicas' clocks don't matter. A leader
+    that cannot reach the database steps down once its own lease would have run out, and one that
+    shuts down cleanly releases its lease so a follower takes over on its next heartbeat.
+    """
+    def __init__(self, db_service, name='scheduler'):
+        self.db_service = db_service
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = max(2, int(os.getenv('SCHEDULER_LEASE_SECONDS', '15')))
+        self.heartbeat_seconds = min(
+            float(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', '5')), self.lease_seconds / 2
+        )
+        self.last_heartbeat = None
+        self.lease_expires_at = None
+        self.leader = False
+
+    @property
+    def is_leader(self):
+        """Whether this process holds an unexpired lease, as of its last heartbeat"""
+        return self.leader and self.lease_expires_at is not None and time.monotonic() < self.lease_expires_at
+
+    def heartbeat(self):
+        """
+        Acquire or renew the lease if a heartbeat is due
+        Returns True if this process is the leader, logging every change of leadership
+        """
+        now = time.monotonic()
+        if self.last_heartbeat is not None and now - self.last_heartbeat < self.heartbeat_seconds:
+            return self.is_leader
+        self.last_heartbeat = now
+
+        was_leader = self.is_leader
+        holder = self.try_acquire()
+        if holder == self.holder:
+            self.leader = True
+            self.lease_expires_at = now + self.lease_seconds
+        elif holder is not None:
+            self.leader = False
+
+        if self.is_leader and not was_leader:
+            logger.info("{} is now the {} leader", self.holder, self.name)
+        elif was_leader and not self.is_leader:
+            logger.warning("{} is no longer the {} leader (lease held by {})", self.holder, self.name, holder)
+        return self.is_leader
+
+    def try_acquire(self):
+        """
+        Take the lease if it is free or expired, or renew it if already ours
+        Returns the lease's holder afterwards, or None if the database could not be reached
+        """
+        # Holder is assigned first, so ExpiresAt's condition sees the updated holder
+        result = self.db_service.execute_query(
+            """
+                INSERT INTO SchedulerLeases (Name, Holder, ExpiresAt)
+                VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE
+                Holder = IF(Holder = VALUES(Holder) OR ExpiresAt < NOW(), VALUES(Holder), Holder),
+                ExpiresAt = IF(Holder = VALUES(Holder), VALUES(ExpiresAt), ExpiresAt)
+            """,
+            (self.name, self.holder, self.lease_seconds)
+        )
+        if result is None:
+            logger.error("Failed to renew the {} lease", self.name)
+            return None
+
+        rows = self.db_service.execute_query(
+            "SELECT Holder FROM SchedulerLeases WHERE Name = %s", (self.name,), fetch=True
+        )
+        if not rows:
+            return None
+        return rows[0][0]
+
+    def release(self):
+        """Give up the lease, if held, so another process can take over straight away"""
+        if not self.leader:
+            return
+        self.db_service.execute_query(
+            "UPDATE SchedulerLeases SET ExpiresAt = NOW() - INTERVAL 1 SECOND WHERE Name = %s AND Holder = %s",
+            (self.name, self.holder)
+        )
+        self.leader = False
+        logger.info("{} released the {} lease", self.holder, self.name)
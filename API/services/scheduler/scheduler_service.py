@@ -1,8 +1,15 @@
+import os
 import schedule
 import time
 import threading
 from datetime import datetime, timedelta
 from loguru import logger
+from API.services.data_sync.sync_state import SYNC_MODE_DELTA
+from API.services.data_sync.dedup import SyncRequestRegistry
+from API.services.data_sync.event_day import EventDaySyncService, EVENT_DAY_SYNC_TYPE
+from API.services.message_broker.backend import PRIORITY_BULK, PRIORITY_INTERACTIVE
+from .cadences import CadenceSchedule, ENTITY_SYNC_TYPES
+from .leader import LeaderElection
 
 class SchedulerService:
     """
@@ -15,7 +22,16 @@ class SchedulerService:
         self.sync_services = {}
         self.running = False
         self.scheduler_thread = None
-        self.consumer_threads = {}
+        self.sync_requests = SyncRequestRegistry(db_service)
+        self.cadences = None
+        self.cadence_threads = {}  # entity -> thread running it directly, without a message broker
+        self.event_day = None
+        self.event_day_events = []
+        self.event_day_checked_at = None
+        self.next_event_day_poll = None
+        self.event_day_thread = None
+        # Every API process runs a scheduler, but only the elected leader fires jobs
+        self.leader = LeaderElection(db_service)
         
     def register_sync_service(self, name, service):
         """Register a sync service to be used by the scheduler"""
@@ -25,117 +41,129 @@ class SchedulerService:
             service.set_message_broker(self.message_broker)
         return self
             
-    def daily_sync(self):
-        """Perform a daily sync of all registered services"""
+    def run_due_cadences(self):
+        """
+        Start the scheduled syncs that are due
+        A sync whose previous run is still going is checked again shortly rather than started twice
+        """
+        overlap_retry = int(os.getenv('SYNC_CADENCE_OVERLAP_RETRY_SECONDS', '60'))
+        try:
+            self.cadences.adapt()
+        except Exception as e:
+            logger.error("Error adapting sync cadences: {}", e)
+        
+        for cadence in self.cadences.due():
+            try:
+                if self.cadence_running(cadence):
+                    logger.info("Previous {} sync still running, postponing", cadence.entity)
+                    self.cadences.postpone(cadence, overlap_retry)
+                    continue
+                
+                self.cadences.record_run(cadence)
+                self.run_cadence(cadence)
+            except Exception as e:
+                logger.error("Error running scheduled {} sync: {}", cadence.entity, e)
+                self.cadences.postpone(cadence, overlap_retry)
+    
+    def cadence_running(self, cadence):
+        if self.message_broker:
+            return self.sync_requests.in_flight(cadence.sync_type)
+        thread = self.cadence_threads.get(cadence.entity)
+        return thread is not None and thread.is_alive()
+    
+    def run_cadence(self, cadence):
+        """Delta sync one entity, through the sync queue or directly in its own thread"""
         today = datetime.now().strftime('%Y-%m-%d')
         tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        logger.info("Starting scheduled {} delta sync", cadence.entity)
+        
+        if self.message_broker:
+            # Workers run every entity, so publish even for services not registered in this process
+            self.message_broker.publish_sync_request(
+                {
+                    'type': cadence.sync_type,
+                    'mode': SYNC_MODE_DELTA,
+                    'start_date': today,
+                    'end_date': tomorrow
+                },
+                PRIORITY_BULK
+            )
+        else:
+            thread = threading.Thread(
+                target=self.run_syncs,
+                args=(today, tomorrow, SYNC_MODE_DELTA, (cadence.entity,)),
+                name=f"{cadence.entity}-scheduled-sync",
+                daemon=True
+            )
+            thread.start()
+            self.cadence_threads[cadence.entity] = thread
+
+    def run_event_day_polls(self):
+        """
+        Poll today's events when they are due, if today is an event day
+        Today's events are re-read every EVENT_DAY_REFRESH_SECONDS (default 300), so event-day mode
+        switches itself on and off. Polls go to the workers on the interactive lane, or run here
+        without a message broker; a poll is never started while the previous one is still running.
+        """
+        now = time.monotonic()
+        refresh_seconds = int(os.getenv('EVENT_DAY_REFRESH_SECONDS', '300'))
+        if self.event_day_checked_at is None or now - self.event_day_checked_at >= refresh_seconds:
+            events = self.event_day.todays_events()
+            if events != self.event_day_events:
+                if events:
+                    logger.info(
+                        "Event-day mode on for events {}, polling every {:.0f}s",
+                        events, self.event_day.poll_interval(len(events))
+                    )
+                else:
+                    logger.info("Event-day mode off")
+            self.event_day_events = events
+            self.event_day_checked_at = now
         
-        logger.info("Starting daily sync for {}", today)
+        if not self.event_day_events:
+            return
+        if self.next_event_day_poll is not None and now < self.next_event_day_poll:
+            return
         
-        # If we have a message broker, publish sync events instead of calling directly
         if self.message_broker:
-            self.message_broker.publish_message('sync_queue', {'event': 'daily_sync_started', 'date': today})
-            
-            # Customer sync
-            if 'customer' in self.sync_services:
-                self.message_broker.publish_message(
-                    'sync_queue', 
-                    {
-                        'type': 'customer_sync',
-                        'altru_id': "example_altru_id"
-                    }
-                )
-            
-            # Events sync
-            if 'event' in self.sync_services:
-                self.message_broker.publish_message(
-                    'sync_queue',
-                    {
-                        'type': 'event_sync',
-                        'start_date': today,
-                        'end_date': tomorrow
-                    }
-                )
-            
-            # Wristbands sync
-            if 'wristband' in self.sync_services:
-                self.message_broker.publish_message(
-                    'sync_queue',
-                    {
-                        'type': 'wristband_sync',
-                        'start_date': today,
-                        'end_date': tomorrow
-                    }
-                )
-            
-            # Parking passes sync
-            if 'parking_pass' in self.sync_services:
-                self.message_broker.publish_message(
-                    'sync_queue',
-                    {
-                        'type': 'parking_pass_sync',
-                        'start_date': today,
-                        'end_date': tomorrow
-                    }
-                )
-                
-            self.message_broker.publish_message('sync_queue', {'event': 'daily_sync_scheduled', 'date': today})
+            # A poll whose worker died stops blocking new ones after EVENT_DAY_STALE_MINUTES
+            stale_minutes = int(os.getenv('EVENT_DAY_STALE_MINUTES', '5'))
+            if self.sync_requests.in_flight(EVENT_DAY_SYNC_TYPE, stale_minutes):
+                logger.debug("Previous event-day poll still running")
+                return
+            self.message_broker.publish_sync_request(
+                {'type': EVENT_DAY_SYNC_TYPE, 'event_ids': self.event_day_events},
+                PRIORITY_INTERACTIVE
+            )
+        elif self.event_day.can_poll:
+            if self.event_day_thread is not None and self.event_day_thread.is_alive():
+                return
+            self.event_day_thread = threading.Thread(
+                target=self.event_day.poll_events,
+                args=(self.event_day_events,),
+                name="event-day-poll",
+                daemon=True
+            )
+            self.event_day_thread.start()
         else:
-            # Direct sync without message broker
-            if 'customer' in self.sync_services:
-                self.sync_services['customer'].sync_customer("example_altru_id")
-            
-            if 'event' in self.sync_services:
-                self.sync_services['event'].sync_events(today, tomorrow)
-            
-            if 'wristband' in self.sync_services:
-                self.sync_services['wristband'].sync_wristbands(today, tomorrow)
-            
-            if 'parking_pass' in self.sync_services:
-                self.sync_services['parking_pass'].sync_parking_passes(today, tomorrow)
-                
-            logger.info("Daily sync completed for {}", today)
-    
-    def handle_sync_message(self, ch, method, properties, body):
-        """Handle sync messages from the message broker"""
-        import json
-        try:
-            message = json.loads(body)
-            logger.info("Received sync message: {}", message)
-            
-            message_type = message.get('type')
-            
-            if message_type == 'customer_sync':
-                if 'customer' in self.sync_services:
-                    altru_id = message.get('altru_id', "example_altru_id")
-                    self.sync_services['customer'].sync_customer(altru_id)
-            
-            elif message_type == 'event_sync':
-                if 'event' in self.sync_services:
-                    start_date = message.get('start_date')
-                    end_date = message.get('end_date')
-                    if start_date and end_date:
-                        self.sync_services['event'].sync_events(start_date, end_date)
-            
-            elif message_type == 'wristband_sync':
-                if 'wristband' in self.sync_services:
-                    start_date = message.get('start_date')
-                    end_date = message.get('end_date')
-                    if start_date and end_date:
-                        self.sync_services['wristband'].sync_wristbands(start_date, end_date)
-            
-            elif message_type == 'parking_pass_sync':
-                if 'parking_pass' in self.sync_services:
-                    start_date = message.get('start_date')
-                    end_date = message.get('end_date')
-                    if start_date and end_date:
-                        self.sync_services['parking_pass'].sync_parking_passes(start_date, end_date)
-            
-            elif message_type == 'full_sync':
-                self.daily_sync()
-                
-        except Exception as e:
-            logger.error("Error handling sync message: {}", e)
+            return
+        
+        self.next_event_day_poll = now + self.event_day.poll_interval(len(self.event_day_events))
+
+    def run_syncs(self, start_date, end_date, mode, entities):
+        """Run the registered sync services directly, without a message broker"""
+        if 'customer' in entities and 'customer' in self.sync_services:
+            # Constituents can't be fetched by date range, so customers are always delta synced
+            self.sync_services['customer'].sync_customers_delta()
+        
+        if 'event' in entities and 'event' in self.sync_services:
+            self.sync_services['event'].sync_events(start_date, end_date, mode=mode)
+        
+        if 'wristband' in entities and 'wristband' in self.sync_services:
+            self.sync_services['wristband'].sync_wristbands(start_date, end_date, mode=mode)
+        
+        if 'parking_pass' in entities and 'parking_pass' in self.sync_services:
+            self.sync_services['parking_pass'].sync_parking_passes(start_date, end_date, mode=mode)
     
     def start_scheduler(self):
         """Start the scheduler in its own thread"""
@@ -145,48 +173,61 @@ class SchedulerService:
             
         self.running = True
         
-        # Set up the schedule
-        schedule.every().day.at("00:00").do(self.daily_sync)
+        # Each entity is synced on its own cadence; see CadenceSchedule. Without a message broker
+        # only the registered services can run, while workers can run every entity
+        entities = list(ENTITY_SYNC_TYPES) if self.message_broker else [
+            entity for entity in ENTITY_SYNC_TYPES if entity in self.sync_services
+        ]
+        self.cadences = CadenceSchedule(self.db_service, entities)
+        logger.info("Sync cadences: {}", self.cadences.cadences)
+        
+        tick = int(os.getenv('SYNC_CADENCE_TICK_SECONDS', '15'))
+        schedule.every(tick).seconds.do(self.run_due_cadences)
+        
+        # On days with an event, today's events are polled far more often; see EventDaySyncService
+        self.event_day = EventDaySyncService(
+            self.db_service,
+            self.api_connector,
+            self.sync_services.get('wristband'),
+            self.sync_services.get('parking_pass')
+        )
+        self.event_day.set_message_broker(self.message_broker)
+        if self.message_broker or self.event_day.can_poll:
+            schedule.every(int(os.getenv('EVENT_DAY_TICK_SECONDS', '5'))).seconds.do(self.run_event_day_polls)
         
         # Run the scheduler in a separate thread
         def run_scheduler():
             logger.info("Starting scheduler thread")
+            was_leader = False
             while self.running:
-                schedule.run_pending()
+                is_leader = self.leader.heartbeat()
+                if is_leader and not was_leader:
+                    # The previous leader may have run syncs meanwhile, so start from the stored
+                    # runs, then catch up on anything that fell due while no scheduler was leading
+                    self.cadences.load_last_runs()
+                    self.event_day_checked_at = None
+                    self.next_event_day_poll = None
+                    self.run_due_cadences()
+                was_leader = is_leader
+                
+                if is_leader:
+                    schedule.run_pending()
                 time.sleep(1)
                 
         self.scheduler_thread = threading.Thread(target=run_scheduler)
         self.scheduler_thread.daemon = True
         self.scheduler_thread.start()
         
-        # If we have a message broker, start the consumer threads
-        if self.message_broker:
-            self.start_consumers()
-            
+        # Sync requests are consumed by the workers, which run every sync service
         logger.info("Scheduler started")
     
-    def start_consumers(self):
-        """Start the message broker consumers"""
-        if not self.message_broker:
-            logger.warning("No message broker available, can't start consumers")
-            return
-            
-        # Start consumer for sync queue
-        def run_sync_consumer():
-            logger.info("Starting sync queue consumer")
-            self.message_broker.declare_queue('sync_queue')
-            self.message_broker.consume_messages('sync_queue', self.handle_sync_message)
-            
-        sync_thread = threading.Thread(target=run_sync_consumer)
-        sync_thread.daemon = True
-        sync_thread.start()
-        self.consumer_threads['sync'] = sync_thread
-        
-        logger.info("Consumers started")
-    
     def stop(self):
-        """Stop the scheduler and consumers"""
+        """Stop the scheduler and close its broker connections"""
         self.running = False
+        # Release only once the scheduler thread is done, so a heartbeat in progress can't take the lease back
+        if self.scheduler_thread is not None and self.scheduler_thread is not threading.current_thread():
+            self.scheduler_thread.join(timeout=self.leader.lease_seconds)
+        self.leader.release()
         
         if self.message_broker:
             self.message_broker.stop_consuming()
@@ -0,0 +1,163 @@
+"""
+Push-based ingestion of SKY API change notifications.
+
+The API's /webhooks/sky endpoint verifies each notification and turns it into a sync request:
+one constituent, one event's tickets and parking passes, or a delta sync of events. Run this
+module to post signed test notifications to a local API in place of SKY API:
+
+    python -m API.services.webhooks constituent 280
+    python -m API.services.webhooks ticket 12 --url http://localhost:8000/webhooks/sky
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import threading
+from loguru import logger
+from API.services.message_broker.backend import PRIORITY_INTERACTIVE
+from API.services.data_sync.event_day import EVENT_DAY_SYNC_TYPE
+from API.services.data_sync.sync_state import SYNC_MODE_DELTA
+
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+
+
+def sign(secret, body):
+    """The signature header value for a raw request body"""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class WebhookReceiver:
+    """
+    Verifies SKY API change notifications and enqueues a targeted sync for each
+
+    Notifications are CloudEvents, posted one at a time or as a batch. Each must carry an
+    X-Webhook-Signature of sha256=<HMAC-SHA256 of the body keyed with WEBHOOK_SECRET>, or, for
+    senders that cannot sign, the secret itself as the token query parameter of the subscribed URL.
+
+    - constituent changes become a customer_sync of that one constituent
+    - ticket, registrant and parking pass changes become an event_day_sync of their event, which
+      pulls only that event's records changed since its last poll
+    - event changes become a delta event_sync
+
+    Identical requests within WEBHOOK_DEBOUNCE_SECONDS (default 5) are published once, so a burst
+    of notifications about one event costs a single poll.
+    """
+    def __init__(self, message_broker, secret=None):
+        self.message_broker = message_broker
+        self.secret = secret if secret is not None else os.getenv('WEBHOOK_SECRET', '')
+        self.debounce_seconds = float(os.getenv('WEBHOOK_DEBOUNCE_SECONDS', '5'))
+        self._recent = {}  # request key -> when it was last published
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.secret)
+
+    def verify(self, body, signature=None, token=None):
+        """Whether a request is signed with, or carries, the shared secret"""
+        if not self.configured:
+            return False
+        # Compared as bytes: compare_digest refuses str with non-ASCII characters
+        if signature:
+            return hmac.compare_digest(signature.encode(), sign(self.secret, body).encode())
+        if token:
+            return hmac.compare_digest(token.encode(), self.secret.encode())
+        return False
+
+    def sync_request_for(self, notification):
+        """The sync message for one notification, or None if it is not one we act on"""
+        event_type = (notification.get('type') or '').lower()
+        data = notification.get('data') or {}
+        if not isinstance(data, dict):
+            return None
+
+        if 'constituent' in event_type:
+            altru_id = data.get('constituent_id') or data.get('id')
+            if altru_id:
+                return {'type': 'customer_sync', 'altru_id': str(altru_id)}
+        elif any(kind in event_type for kind in ('ticket', 'registrant', 'parkingpass', 'parking_pass')):
+            event_id = data.get('event_id')
+            if event_id:
+                return {'type': EVENT_DAY_SYNC_TYPE, 'event_ids': [event_id]}
+        elif 'event' in event_type:
+            return {'type': 'event_sync', 'mode': SYNC_MODE_DELTA}
+        return None
+
+    def enqueue(self, notifications):
+        """
+        Publish a sync request for each notification we act on
+        Returns the number of requests published, after debouncing
+        """
+        if isinstance(notifications, dict):
+            notifications = [notifications]
+
+        published = 0
+        for notification in notifications:
+            if not isinstance(notification, dict):
+                continue
+            message = self.sync_request_for(notification)
+            if message is None:
+                logger.debug("Ignoring webhook notification of type {}", notification.get('type'))
+                continue
+            if self.debounced(message):
+                continue
+            if self.message_broker.publish_sync_request(message, PRIORITY_INTERACTIVE):
+                published += 1
+        logger.info("Webhook notifications enqueued {} sync requests", published)
+        return published
+
+    def debounced(self, message):
+        """Whether an identical request was published within the debounce window; records this one if not"""
+        key = json.dumps(message, sort_keys=True)
+        now = time.monotonic()
+        with self._lock:
+            last = self._recent.get(key)
+            if last is not None and now - last < self.debounce_seconds:
+                return True
+            self._recent[key] = now
+            # Forget requests older than the window so the map stays small
+            if len(self._recent) > 1000:
+                self._recent = {
+                    recent_key: at for recent_key, at in self._recent.items()
+                    if now - at < self.debounce_seconds
+                }
+        return False
+
+
+def send_test_notification(url, secret, kind, record_id):
+    """Post one signed CloudEvent like SKY API would; returns the response"""
+    import requests
+
+    data = {'constituent': {'constituent_id': record_id}, 'event': {'event_id': record_id}}.get(
+        kind, {'event_id': record_id}
+    )
+    body = json.dumps([{
+        'id': str(uuid.uuid4()),
+        'specversion': '1.0',
+        'source': 'local-webhook-sender',
+        'type': f'com.blackbaud.{kind}.change.v1',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'data': data
+    }]).encode()
+    return requests.post(
+        url, data=body, headers={'Content-Type': 'application/json', SIGNATURE_HEADER: sign(secret, body)}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a signed SKY API change notification to a local API")
+    parser.add_argument('kind', choices=('constituent', 'event', 'ticket', 'parkingpass'))
+    parser.add_argument('record_id', help="Constituent ID, or the event ID for event, ticket and parking pass changes")
+    parser.add_argument('--url', default='http://localhost:8000/webhooks/sky')
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'))
+    args = parser.parse_args()
+
+    if not args.secret:
+        sys.exit("Set WEBHOOK_SECRET or pass --secret")
+    response = send_test_notification(args.url, args.secret, args.kind, args.record_id)
+    print(response.status_code, response.text)
@@ -7,30 +7,56 @@ import os
 import json
 import signal
 import sys
-from threading import Thread, Event
+import time
+import multiprocessing
+from threading import Thread, Event, Lock, get_ident
 from loguru import logger
 from dotenv import load_dotenv
 
 # Import our services
 from API.services.db.db_service import DBService
-from API.services.message_broker.broker_service import MessageBroker
+from API.services.message_broker.backend import (
+    create_message_broker, MessageFailed, SYNC_QUEUE, INTERACTIVE_SYNC_QUEUE, BACKEND_RABBITMQ, BACKEND_MEMORY,
+    ATTEMPT_HEADER
+)
 from API.services.data_sync.customers import CustomerSyncService
 from API.services.data_sync.events import EventSyncService
 from API.services.data_sync.wristbands import WristbandSyncService
 from API.services.data_sync.parking_passes import ParkingPassSyncService
-from API.BbApiConnector.BbApiConnector import BbApiConnector
+from API.services.data_sync.sync_state import SYNC_MODE_FULL, SYNC_MODE_DELTA
+from API.services.data_sync.orchestrator import SyncOrchestrator
+from API.services.data_sync.checkpoint import SyncRunService
+from API.services.data_sync.backfill import BackfillCoordinator, BACKFILL_QUEUE
+from API.services.data_sync.dedup import SyncRequestRegistry
+from API.services.data_sync.event_day import EventDaySyncService, EVENT_DAY_SYNC_TYPE, SYNC_MODE_EVENT_DAY
+from API.services.autoscaler import ConsumerAutoscaler
+from API.services.resilience.circuit_breaker import get_circuit_breaker, MYSQL_CIRCUIT, SKY_API_CIRCUIT
+from API.services.auth.bb_api_connector import BbApiConnector
+
+# Every queue a worker consumes, in the order its consumers are started
+WORKER_QUEUES = (
+    INTERACTIVE_SYNC_QUEUE,
+    SYNC_QUEUE,
+    BACKFILL_QUEUE,
+    'customer_sync_events',
+    'event_sync_events',
+    'wristband_sync_events',
+    'parking_pass_sync_events'
+)
 
 class Worker:
     """
     Worker service that consumes messages from the queue and processes them.
     This enables scaling the processing of sync tasks independently from the API.
+    A worker consumes every queue in WORKER_QUEUES unless given a subset in queue_names.
     """
-    def __init__(self):
+    def __init__(self, queue_names=None):
         load_dotenv()
         
         # Initialize services
         self.db_service = DBService()
-        self.message_broker = MessageBroker()
+        # RabbitMQ, or the in-process broker with MESSAGE_BROKER_BACKEND=memory
+        self.message_broker = create_message_broker()
         
         # Initialize the API connector
         config_path = os.getenv("BB_CONFIG_PATH", "API/resources/app_secrets.json")
@@ -48,101 +74,371 @@ class Worker:
         self.wristband_sync_service.set_message_broker(self.message_broker)
         self.parking_pass_sync_service.set_message_broker(self.message_broker)
         
+        # Event-day polls of today's events, dispatched by the scheduler
+        self.event_day_sync_service = EventDaySyncService(
+            self.db_service,
+            self.api_connector,
+            self.wristband_sync_service,
+            self.parking_pass_sync_service
+        )
+        self.event_day_sync_service.set_message_broker(self.message_broker)
+        
+        # Full syncs run as a dependency graph across these services
+        self.sync_orchestrator = SyncOrchestrator(
+            self.customer_sync_service,
+            self.event_sync_service,
+            self.wristband_sync_service,
+            self.parking_pass_sync_service
+        )
+        
+        # Long ranges are split into shard jobs shared out across every worker replica
+        self.backfill_coordinator = BackfillCoordinator(
+            self.db_service,
+            self.message_broker,
+            self.sync_orchestrator
+        )
+        
+        # Identical or overlapping sync requests are coalesced so each range runs once
+        self.sync_requests = SyncRequestRegistry(self.db_service)
+        
         # Threading controls
         self.stop_event = Event()
         self.threads = []
         
-        # Queues to consume from
+        # Per-queue consumer stop events, and time spent handling messages, for the autoscaler
+        self.consumers = {}
+        self._busy_seconds = {}
+        self._handling = {}  # queue -> {thread id: start of the message being handled}
+        self._consumers_lock = Lock()
+        self.autoscaler = None
+        
+        # Consumption pauses while either dependency's circuit is open; see check_dependencies
+        self.circuit_breakers = [get_circuit_breaker(MYSQL_CIRCUIT), get_circuit_breaker(SKY_API_CIRCUIT)]
+        self.paused_consumers = None
+        
+        # Queues to consume from, with their prefetch count (None for RABBITMQ_PREFETCH_COUNT)
+        # Backfill shards are long-running, so each consumer takes only one at a time.
+        # Interactive consumers also take one at a time, so a queued request is never held
+        # behind another on a busy consumer while an idle one could run it
+        handlers = {
+            INTERACTIVE_SYNC_QUEUE: (self.handle_sync_message, 1),
+            SYNC_QUEUE: (self.handle_sync_message, None),
+            BACKFILL_QUEUE: (self.handle_backfill_message, 1),
+            'customer_sync_events': (self.customer_sync_service.handle_customer_sync_message, None),
+            'event_sync_events': (self.event_sync_service.handle_event_sync_message, None),
+            'wristband_sync_events': (self.wristband_sync_service.handle_wristband_sync_message, None),
+            'parking_pass_sync_events': (self.parking_pass_sync_service.handle_parking_pass_sync_message, None)
+        }
         self.queues = [
-            ('sync_queue', self.handle_sync_message),
-            ('customer_sync_events', self.customer_sync_service.handle_customer_sync_message),
-            ('event_sync_events', self.event_sync_service.handle_event_sync_message),
-            ('wristband_sync_events', self.wristband_sync_service.handle_wristband_sync_message),
-            ('parking_pass_sync_events', self.parking_pass_sync_service.handle_parking_pass_sync_message)
+            (queue_name, *handlers[queue_name])
+            for queue_name in WORKER_QUEUES
+            if queue_names is None or queue_name in queue_names
         ]
     
     def handle_sync_message(self, ch, method, properties, body):
         """
         Handle messages from the sync queue.
         This is the main entry point for synchronization tasks.
+        Raises MessageFailed when the sync fails, so the message is retried later with the reason.
         """
         try:
             message = json.loads(body)
             logger.info(f"Worker received sync message: {message}")
             
             message_type = message.get('type')
+            mode = message.get('mode', SYNC_MODE_FULL)
+            start_date = message.get('start_date')
+            end_date = message.get('end_date')
+            
+            # Delta syncs pull everything changed since the watermark, so they need no range
+            has_range = mode == SYNC_MODE_DELTA or (start_date and end_date)
+            success = True
             
             if message_type == 'customer_sync':
-                altru_id = message.get('altru_id', "example_altru_id")
-                self.customer_sync_service.sync_customer(altru_id)
+                altru_id = message.get('altru_id')
+                if altru_id:
+                    success = self.customer_sync_service.sync_customer(altru_id)
+                else:
+                    # Constituents can't be fetched by date range, so any other request is a delta sync
+                    success = self.sync_requests.run_once(
+                        message_type, SYNC_MODE_DELTA, None, None,
+                        lambda s, e: self.customer_sync_service.sync_customers_delta()
+                    )
             
             elif message_type == 'event_sync':
-                start_date = message.get('start_date')
-                end_date = message.get('end_date')
-                if start_date and end_date:
-                    self.event_sync_service.sync_events(start_date, end_date)
+                if has_range:
+                    success = self.sync_requests.run_once(
+                        message_type, mode, start_date, end_date,
+                        lambda s, e: self.event_sync_service.sync_events(s, e, mode=mode)
+                    )
             
             elif message_type == 'wristband_sync':
-                start_date = message.get('start_date')
-                end_date = message.get('end_date')
-                if start_date and end_date:
-                    self.wristband_sync_service.sync_wristbands(start_date, end_date)
+                if has_range:
+                    success = self.sync_requests.run_once(
+                        message_type, mode, start_date, end_date,
+                        lambda s, e: self.wristband_sync_service.sync_wristbands(s, e, mode=mode)
+                    )
             
             elif message_type == 'parking_pass_sync':
-                start_date = message.get('start_date')
-                end_date = message.get('end_date')
-                if start_date and end_date:
-                    self.parking_pass_sync_service.sync_parking_passes(start_date, end_date)
+                if has_range:
+                    success = self.sync_requests.run_once(
+                        message_type, mode, start_date, end_date,
+                        lambda s, e: self.parking_pass_sync_service.sync_parking_passes(s, e, mode=mode)
+                    )
             
             elif message_type == 'full_sync':
                 from datetime import datetime
                 today = datetime.now().strftime('%Y-%m-%d')
-                start_date = message.get('start_date', today)
-                end_date = message.get('end_date', today)
-                
-                self.customer_sync_service.sync_customer("example_altru_id")
-                self.event_sync_service.sync_events(start_date, end_date)
-                self.wristband_sync_service.sync_wristbands(start_date, end_date)
-                self.parking_pass_sync_service.sync_parking_passes(start_date, end_date)
+                start_date = start_date or today
+                end_date = end_date or today
                 
+                success = self.sync_requests.run_once(
+                    message_type, mode, start_date, end_date,
+                    lambda s, e: self.run_full_sync(s, e, mode)
+                )
+            
+            elif message_type == EVENT_DAY_SYNC_TYPE:
+                event_ids = message.get('event_ids', [])
+                success = self.sync_requests.track(
+                    message_type, SYNC_MODE_EVENT_DAY,
+                    lambda: self.event_day_sync_service.poll_events(event_ids)
+                )
+            
+            elif message_type == 'backfill':
+                if start_date and end_date:
+                    success = self.plan_backfill(start_date, end_date)
+            
+            if not success:
+                raise MessageFailed(f"{message_type} ({mode}) from {start_date} to {end_date} failed")
+            return True
+        
+        except MessageFailed:
+            raise
         except Exception as e:
             logger.error(f"Error handling sync message: {e}")
+            raise MessageFailed(f"Error handling sync message: {e}") from e
     
-    def start_consumer(self, queue_name, callback):
-        """Start a consumer for a specific queue in a separate thread"""
+    def run_full_sync(self, start_date, end_date, mode=SYNC_MODE_FULL):
+        """Run a full sync here, or fan it out as a backfill if the range is long"""
+        if mode == SYNC_MODE_FULL and self.backfill_coordinator.should_backfill(start_date, end_date):
+            return self.plan_backfill(start_date, end_date)
+        return self.sync_orchestrator.full_sync(start_date, end_date, mode=mode)
+    
+    def plan_backfill(self, start_date, end_date):
+        """
+        Sync customers, then fan the range out as backfill shards
+        Customers go first so every shard's events can reference them; if they fail nothing is
+        planned, and the message is retried as a whole
+        """
+        if not self.customer_sync_service.sync_customers_delta():
+            logger.error(f"Customer sync before the backfill from {start_date} to {end_date} failed")
+            return False
+        return self.backfill_coordinator.plan(start_date, end_date) is not None
+    
+    def handle_backfill_message(self, ch, method, properties, body):
+        """Handle one shard job from the backfill queue, raising MessageFailed if the shard fails so it is retried"""
+        try:
+            message = json.loads(body)
+            logger.info(f"Worker received backfill shard: {message}")
+            
+            if message.get('type') != 'backfill_shard':
+                return True
+            
+            # A shard that will be retried stays pending, so its backfill does not finish without it
+            attempt = int((getattr(properties, 'headers', None) or {}).get(ATTEMPT_HEADER, 0)) + 1
+            final_attempt = attempt >= self.message_broker.max_attempts
+            if not self.backfill_coordinator.run_shard(message, final_attempt=final_attempt):
+                raise MessageFailed(
+                    f"Backfill {message.get('backfill_id')} shard {message.get('shard_id')} "
+                    f"from {message.get('start_date')} to {message.get('end_date')} failed"
+                )
+            return True
+        
+        except MessageFailed:
+            raise
+        except Exception as e:
+            logger.error(f"Error handling backfill message: {e}")
+            raise MessageFailed(f"Error handling backfill message: {e}") from e
+    
+    def resume_interrupted_runs(self):
+        """
+        Re-request range syncs whose worker died before finishing them
+        The re-requested sync resumes from the run's last checkpoint
+        """
+        for entity, start_date, end_date in SyncRunService(self.db_service).claim_interrupted_runs():
+            logger.info(f"Resuming interrupted {entity} sync from {start_date} to {end_date}")
+            self.message_broker.publish_message(
+                SYNC_QUEUE,
+                {
+                    'type': f'{entity}_sync',
+                    'start_date': start_date,
+                    'end_date': end_date
+                }
+            )
+    
+    def consumer_count(self, queue_name):
+        """
+        Number of consumer threads for a queue
+        WORKER_CONSUMERS_<QUEUE> (e.g. WORKER_CONSUMERS_SYNC_QUEUE) overrides WORKER_CONSUMERS, which defaults to 1.
+        The interactive lane defaults to WORKER_INTERACTIVE_CONSUMERS (2), so it always has spare capacity
+        """
+        if queue_name == INTERACTIVE_SYNC_QUEUE:
+            default = os.getenv('WORKER_INTERACTIVE_CONSUMERS', '2')
+        else:
+            default = os.getenv('WORKER_CONSUMERS', '1')
+        return max(1, int(os.getenv(f"WORKER_CONSUMERS_{queue_name.upper().replace('.', '_')}", default)))
+    
+    def start_consumer(self, queue_name, callback, prefetch_count=None):
+        """
+        Start a consumer for a specific queue in a separate thread
+        A consumer that fails, or returns without being told to stop (e.g. it could not connect or
+        its connection dropped), is restarted in the same thread, after a delay that doubles from
+        WORKER_RESTART_BACKOFF seconds up to WORKER_MAX_RESTART_BACKOFF
+        """
+        consumer_stop = Event()
+        with self._consumers_lock:
+            self.consumers.setdefault(queue_name, []).append(consumer_stop)
+        
+        restart_backoff = float(os.getenv('WORKER_RESTART_BACKOFF', '1'))
+        max_restart_backoff = float(os.getenv('WORKER_MAX_RESTART_BACKOFF', '60'))
+        
         def consumer_thread():
+            delay = restart_backoff
             try:
-                logger.info(f"Starting consumer for queue: {queue_name}")
-                self.message_broker.declare_queue(queue_name)
-                self.message_broker.consume_messages(queue_name, callback)
-            except Exception as e:
-                logger.error(f"Error in consumer for queue {queue_name}: {e}")
-                if not self.stop_event.is_set():
-                    logger.info(f"Restarting consumer for queue: {queue_name}")
-                    self.start_consumer(queue_name, callback)
+                while not self.stop_event.is_set() and not consumer_stop.is_set():
+                    try:
+                        logger.info(f"Starting consumer for queue: {queue_name}")
+                        self.message_broker.declare_queue(queue_name)
+                        self.message_broker.consume_messages(
+                            queue_name,
+                            self.timed_callback(queue_name, callback),
+                            prefetch_count=prefetch_count,
+                            stop_event=consumer_stop
+                        )
+                        if self.stop_event.is_set() or consumer_stop.is_set():
+                            break
+                        logger.error(f"Consumer for queue {queue_name} stopped unexpectedly")
+                    except Exception as e:
+                        logger.error(f"Error in consumer for queue {queue_name}: {e}")
+                    if self.stop_event.is_set() or consumer_stop.is_set():
+                        break
+                    logger.info(f"Restarting consumer for queue {queue_name} in {delay}s")
+                    self.stop_event.wait(delay)
+                    delay = min(delay * 2, max_restart_backoff)
+            finally:
+                with self._consumers_lock:
+                    self.consumers[queue_name].remove(consumer_stop)
         
-        thread = Thread(target=consumer_thread)
+        thread = Thread(target=consumer_thread, name=f"{queue_name}-consumer")
         thread.daemon = True
         thread.start()
         self.threads.append(thread)
         return thread
     
-    def start(self):
-        """Start all consumers"""
-        logger.info("Starting worker service")
+    def timed_callback(self, queue_name, callback):
+        """Wrap a message callback to record how long the queue's consumers spend handling messages"""
+        def on_message(ch, method, properties, body):
+            thread_id = get_ident()
+            started_at = time.monotonic()
+            with self._consumers_lock:
+                self._handling.setdefault(queue_name, {})[thread_id] = started_at
+            try:
+                return callback(ch, method, properties, body)
+            finally:
+                with self._consumers_lock:
+                    self._handling[queue_name].pop(thread_id, None)
+                    self._busy_seconds[queue_name] = self._busy_seconds.get(queue_name, 0.0) + time.monotonic() - started_at
+        
+        return on_message
+    
+    def busy_seconds(self, queue_name):
+        """Total time the queue's consumers have spent handling messages, including ones still in progress"""
+        now = time.monotonic()
+        with self._consumers_lock:
+            in_progress = sum(now - started_at for started_at in self._handling.get(queue_name, {}).values())
+            return self._busy_seconds.get(queue_name, 0.0) + in_progress
+    
+    def active_consumers(self, queue_name):
+        """Consumers running for a queue, not counting ones already told to stop"""
+        with self._consumers_lock:
+            return sum(1 for consumer_stop in self.consumers.get(queue_name, []) if not consumer_stop.is_set())
+    
+    def add_consumer(self, queue_name):
+        """Start one more consumer for a queue"""
+        for name, callback, prefetch_count in self.queues:
+            if name == queue_name:
+                return self.start_consumer(queue_name, callback, prefetch_count)
+    
+    def remove_consumer(self, queue_name):
+        """Stop the most recently started consumer for a queue once it finishes its current message"""
+        with self._consumers_lock:
+            consumers = self.consumers.get(queue_name, [])
+            for consumer_stop in reversed(consumers):
+                if not consumer_stop.is_set():
+                    consumer_stop.set()
+                    return True
+        return False
+    
+    def check_dependencies(self):
+        """
+        Pause consumption while a circuit breaker is open, and resume once it is due for a probe
+        Paused consumers finish their current message and leave the rest queued, so an outage
+        costs no retries. On resume the same number of consumers start again, and the first
+        message handled probes the dependency; if it is still down the circuit reopens and
+        consumption pauses again.
+        """
+        open_circuits = [breaker.name for breaker in self.circuit_breakers if breaker.is_open]
+        
+        if open_circuits and self.paused_consumers is None:
+            self.paused_consumers = {name: self.active_consumers(name) for name, _, _ in self.queues}
+            logger.warning(f"Pausing consumers while circuits are open: {', '.join(open_circuits)}")
+            for name, count in self.paused_consumers.items():
+                for _ in range(count):
+                    self.remove_consumer(name)
+        
+        elif not open_circuits and self.paused_consumers is not None:
+            logger.info("Circuits no longer open, resuming consumers")
+            for name, count in self.paused_consumers.items():
+                for _ in range(count):
+                    self.add_consumer(name)
+            self.paused_consumers = None
+    
+    def start(self, resume=True):
+        """
+        Start all consumers
+        Under a supervisor only one worker process resumes interrupted runs, so they are requested once
+        """
+        logger.info(f"Starting worker service for {', '.join(name for name, _, _ in self.queues)}")
         
         # Register signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
+        # Pick up any checkpointed syncs left behind by a previous worker
+        if resume:
+            try:
+                self.resume_interrupted_runs()
+            except Exception as e:
+                logger.error(f"Error resuming interrupted sync runs: {e}")
+        
         # Start consumers for all queues
-        for queue_name, callback in self.queues:
-            self.start_consumer(queue_name, callback)
+        for queue_name, callback, prefetch_count in self.queues:
+            for _ in range(self.consumer_count(queue_name)):
+                self.start_consumer(queue_name, callback, prefetch_count)
+        
+        # Scale consumer threads with queue depth if enabled
+        if os.getenv('WORKER_AUTOSCALE', 'false').lower() == 'true':
+            self.autoscaler = ConsumerAutoscaler(self)
         
         # Keep the main thread alive
         try:
             while not self.stop_event.is_set():
                 self.stop_event.wait(1)
+                if self.stop_event.is_set():
+                    break
+                self.check_dependencies()
+                if self.autoscaler and self.paused_consumers is None:
+                    self.autoscaler.poll()
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received")
             self.stop()
@@ -164,7 +460,147 @@ class Worker:
         logger.info("Worker service stopped")
         sys.exit(0)
 
+def run_worker_process(queue_names, resume):
+    """Entry point of a supervised worker process"""
+    # A forked child inherits the supervisor's handlers; until the worker installs its own, a signal should just end it
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logger.info(f"Initializing worker process {os.getpid()}")
+    worker = Worker(queue_names)
+    worker.start(resume=resume)
+
+
+class WorkerSupervisor:
+    """
+    Runs several worker processes so sync work is not bound to one process's GIL
+
+    WORKER_PROCESSES general processes (default: one per CPU) consume every queue. A queue can be
+    given WORKER_PROCESSES_<QUEUE> dedicated processes instead (e.g. WORKER_PROCESSES_BACKFILL_QUEUE=4),
+    in which case the general processes leave it alone. RabbitMQ shares each queue's messages
+    across all processes consuming it.
+
+    A child that exits while the supervisor is running is restarted after a delay that doubles
+    from WORKER_RESTART_BACKOFF seconds (default 1) up to WORKER_MAX_RESTART_BACKOFF (default 60),
+    and resets once a child stays up that long. On SIGTERM or SIGINT every child is sent SIGTERM
+    and given WORKER_SHUTDOWN_TIMEOUT seconds (default 30) to finish before it is killed.
+    """
+    def __init__(self):
+        load_dotenv()
+        self.restart_backoff = float(os.getenv('WORKER_RESTART_BACKOFF', '1'))
+        self.max_restart_backoff = float(os.getenv('WORKER_MAX_RESTART_BACKOFF', '60'))
+        self.shutdown_timeout = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', '30'))
+        
+        self.stop_event = Event()
+        self.slots = [
+            {
+                'queue_names': queue_names,
+                'process': None,
+                'started_at': None,
+                'restart_at': 0,
+                'backoff': self.restart_backoff
+            }
+            for queue_names in self.process_queues()
+        ]
+    
+    @staticmethod
+    def process_queues():
+        """The queues each worker process consumes, one entry per process"""
+        dedicated = []
+        shared = []
+        for queue_name in WORKER_QUEUES:
+            count = int(os.getenv(f"WORKER_PROCESSES_{queue_name.upper().replace('.', '_')}", '0'))
+            if count > 0:
+                dedicated += [(queue_name,)] * count
+            else:
+                shared.append(queue_name)
+        
+        general = int(os.getenv('WORKER_PROCESSES', str(multiprocessing.cpu_count())))
+        if shared:
+            # Every queue needs at least one consumer process
+            dedicated += [tuple(shared)] * max(1, general)
+        return dedicated
+    
+    def start(self):
+        """Start every worker process and supervise them until told to stop"""
+        logger.info(f"Starting worker supervisor with {len(self.slots)} processes")
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        
+        for index, slot in enumerate(self.slots):
+            self.start_process(slot, resume=index == 0)
+        
+        while not self.stop_event.is_set():
+            self.check_processes()
+            self.stop_event.wait(1)
+        
+        self.stop_processes()
+    
+    def start_process(self, slot, resume=False):
+        process = multiprocessing.Process(
+            target=run_worker_process,
+            args=(slot['queue_names'], resume),
+            name=f"worker-{'+'.join(slot['queue_names'])}"
+        )
+        process.start()
+        slot['process'] = process
+        slot['started_at'] = time.monotonic()
+        logger.info(f"Started worker process {process.pid} for {', '.join(slot['queue_names'])}")
+    
+    def check_processes(self):
+        """Restart, with backoff, any worker process that has exited"""
+        now = time.monotonic()
+        for slot in self.slots:
+            process = slot['process']
+            if process is not None and process.is_alive():
+                continue
+            
+            if process is not None:
+                # Schedule the restart; a child that stayed up for a while starts over at the shortest delay
+                if now - slot['started_at'] >= self.max_restart_backoff:
+                    slot['backoff'] = self.restart_backoff
+                logger.error(
+                    f"Worker process {process.pid} exited with code {process.exitcode}, "
+                    f"restarting in {slot['backoff']}s"
+                )
+                slot['restart_at'] = now + slot['backoff']
+                slot['backoff'] = min(slot['backoff'] * 2, self.max_restart_backoff)
+                slot['process'] = None
+            
+            if now >= slot['restart_at']:
+                self.start_process(slot)
+    
+    def stop_processes(self):
+        """Ask every worker process to shut down, killing any that outlast the shutdown timeout"""
+        processes = [slot['process'] for slot in self.slots if slot['process'] is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        
+        deadline = time.monotonic() + self.shutdown_timeout
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker process {process.pid} did not stop in time, killing it")
+                process.kill()
+                process.join()
+        logger.info("Worker supervisor stopped")
+    
+    def signal_handler(self, sig, frame):
+        """Handle termination signals"""
+        logger.info(f"Signal {sig} received, stopping worker processes...")
+        self.stop_event.set()
+
 if __name__ == "__main__":
-    logger.info("Initializing worker service")
-    worker = Worker()
-    worker.start()
\ No newline at end of file
+    # Supervisor mode runs several worker processes; otherwise one process runs every consumer
+    supervised = '--supervisor' in sys.argv or os.getenv('WORKER_PROCESSES')
+    if supervised and os.getenv('MESSAGE_BROKER_BACKEND', BACKEND_RABBITMQ).lower() == BACKEND_MEMORY:
+        # Child processes would each get an empty broker of their own
+        logger.warning("The in-memory message broker is per process, running a single worker process instead")
+        supervised = False
+    if supervised:
+        logger.info("Initializing worker supervisor")
+        WorkerSupervisor().start()
+    else:
+        logger.info("Initializing worker service")
+        worker = Worker()
+        worker.start()
\ No newline at end of file
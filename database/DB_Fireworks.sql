@@ -33,9 +33,12 @@ CREATE TABLE IF NOT EXISTS `FireworksDB`.`Customers` (
   `Attended` TINYINT NULL,
   `Paid` TINYINT NULL,
   `Cancelled` TINYINT NULL,
+  `Altru_id` VARCHAR(45) NULL,
+  `RowHash` CHAR(64) NULL,
   PRIMARY KEY (`C_id`),
   UNIQUE INDEX `ID_UNIQUE` (`C_id` ASC) VISIBLE,
-  UNIQUE INDEX `Member_id_UNIQUE` (`Member_id` ASC) VISIBLE)
+  UNIQUE INDEX `Member_id_UNIQUE` (`Member_id` ASC) VISIBLE,
+  UNIQUE INDEX `Altru_id_UNIQUE` (`Altru_id` ASC) VISIBLE)
 ENGINE = InnoDB;
 
 
@@ -57,6 +60,7 @@ CREATE TABLE IF NOT EXISTS `FireworksDB`.`Events` (
   `E_id` INT NULL,
   `Name` VARCHAR(45) NOT NULL,
   `EventDate` DATE NOT NULL,
+  `RowHash` CHAR(64) NULL,
   PRIMARY KEY (`Event_ID`, `C_id`, `E_id`),
   UNIQUE INDEX `EventName_UNIQUE` (`Name` ASC) VISIBLE,
   UNIQUE INDEX `Event_ID_UNIQUE` (`Event_ID` ASC) VISIBLE,
@@ -80,8 +84,11 @@ CREATE TABLE IF NOT EXISTS `FireworksDB`.`Wristbands` (
   `W_id` INT NOT NULL auto_increment,
   `Event_ID` INT NOT NULL,
   `Issued` DATETIME NULL,
+  `Ticket_id` VARCHAR(45) NULL,
+  `RowHash` CHAR(64) NULL,
   PRIMARY KEY (`W_id`, `Event_ID`),
   UNIQUE INDEX `W_ID_UNIQUE` (`W_id` ASC) VISIBLE,
+  UNIQUE INDEX `Ticket_id_UNIQUE` (`Ticket_id` ASC) VISIBLE,
   INDEX `fk_Wristbands_EventSales1_idx` (`Event_ID` ASC) VISIBLE,
   CONSTRAINT `fk_Wristbands_EventSales1`
     FOREIGN KEY (`Event_ID`)
@@ -96,7 +103,10 @@ CREATE TABLE IF NOT EXISTS `FireworksDB`.`ParkingPasses` (
   `PP_id` INT NOT NULL auto_increment,
   `Event_ID` INT NOT NULL,
   `Issued` DATETIME NULL,
+  `Pass_id` VARCHAR(45) NULL,
+  `RowHash` CHAR(64) NULL,
   PRIMARY KEY (`PP_id`),
+  UNIQUE INDEX `Pass_id_UNIQUE` (`Pass_id` ASC) VISIBLE,
   INDEX `fk_ParkingPasses_EventSales1_idx` (`Event_ID` ASC) VISIBLE,
   CONSTRAINT `fk_ParkingPasses_EventSales1`
     FOREIGN KEY (`Event_ID`)
@@ -135,6 +145,171 @@ CREATE TABLE IF NOT EXISTS `FireworksDB`.`Departments` (
     ON UPDATE NO ACTION)
 ENGINE = InnoDB;
 
+
+-- High-water marks for delta syncs, one row per synced entity
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SyncState` (
+  `Entity` VARCHAR(64) NOT NULL,
+  `LastModified` VARCHAR(40) NULL,
+  `UpdatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Entity`))
+ENGINE = InnoDB;
+
+
+-- Progress checkpoints for long-running range syncs so an interrupted run can resume
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SyncRuns` (
+  `Run_id` INT NOT NULL auto_increment,
+  `Run_key` VARCHAR(191) NOT NULL,
+  `Entity` VARCHAR(64) NOT NULL,
+  `StartDate` DATE NOT NULL,
+  `EndDate` DATE NOT NULL,
+  `Status` VARCHAR(16) NOT NULL DEFAULT 'running',
+  `ShardStart` DATE NULL,
+  `PageCursor` INT NOT NULL DEFAULT 0,
+  `LastRecordId` VARCHAR(64) NULL,
+  `StartedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `UpdatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Run_id`),
+  INDEX `Run_key_Status_idx` (`Run_key` ASC, `Status` ASC) VISIBLE)
+ENGINE = InnoDB;
+
+
+-- Last scheduled run and adapted interval of each entity, so a restarted scheduler keeps its cadence and catches up
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SyncSchedule` (
+  `Entity` VARCHAR(64) NOT NULL,
+  `LastRunAt` DATETIME NULL,
+  `IntervalSeconds` INT NULL,
+  `ChangeRate` DOUBLE NULL,
+  `LastChangeId` INT NULL,
+  PRIMARY KEY (`Entity`))
+ENGINE = InnoDB;
+
+
+-- Records changed by each delta sync, which the scheduler adapts sync intervals to
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SyncChanges` (
+  `Change_id` INT NOT NULL auto_increment,
+  `Entity` VARCHAR(64) NOT NULL,
+  `ChangedCount` INT NOT NULL,
+  `SyncedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Change_id`))
+ENGINE = InnoDB;
+
+
+-- Leases electing the one scheduler, among every API process, that fires scheduled jobs
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SchedulerLeases` (
+  `Name` VARCHAR(64) NOT NULL,
+  `Holder` VARCHAR(191) NOT NULL,
+  `ExpiresAt` DATETIME NOT NULL,
+  PRIMARY KEY (`Name`))
+ENGINE = InnoDB;
+
+
+-- Sync requests, so identical or overlapping requests are coalesced into one run
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`SyncRequests` (
+  `Request_id` INT NOT NULL auto_increment,
+  `SyncType` VARCHAR(32) NOT NULL,
+  `Mode` VARCHAR(16) NOT NULL,
+  `StartDate` DATE NULL,
+  `EndDate` DATE NULL,
+  `Status` VARCHAR(16) NOT NULL DEFAULT 'in_flight',
+  `CreatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `CompletedAt` DATETIME NULL,
+  PRIMARY KEY (`Request_id`),
+  INDEX `SyncType_Status_idx` (`SyncType` ASC, `Status` ASC) VISIBLE)
+ENGINE = InnoDB;
+
+
+-- Backfills fanned out across workers, with one job row per date shard
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`Backfills` (
+  `Backfill_id` INT NOT NULL auto_increment,
+  `StartDate` DATE NOT NULL,
+  `EndDate` DATE NOT NULL,
+  `ShardCount` INT NOT NULL,
+  `Status` VARCHAR(16) NOT NULL DEFAULT 'running',
+  `CreatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `CompletedAt` DATETIME NULL,
+  PRIMARY KEY (`Backfill_id`))
+ENGINE = InnoDB;
+
+
+CREATE TABLE IF NOT EXISTS `FireworksDB`.`BackfillShards` (
+  `Shard_id` INT NOT NULL auto_increment,
+  `Backfill_id` INT NOT NULL,
+  `StartDate` DATE NOT NULL,
+  `EndDate` DATE NOT NULL,
+  `Status` VARCHAR(16) NOT NULL DEFAULT 'pending',
+  `Attempts` INT NOT NULL DEFAULT 0,
+  `UpdatedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Shard_id`),
+  INDEX `fk_BackfillShards_Backfills1_idx` (`Backfill_id` ASC, `Status` ASC) VISIBLE,
+  CONSTRAINT `fk_BackfillShards_Backfills1`
+    FOREIGN KEY (`Backfill_id`)
+    REFERENCES `FireworksDB`.`Backfills` (`Backfill_id`)
+    ON DELETE NO ACTION
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB;
+
+--------------------------------------------------------------------
+-- Migrations for databases created before these columns were added
+-- CREATE TABLE IF NOT EXISTS leaves existing tables as they were
+--------------------------------------------------------------------
+DELIMITER $$
+
+CREATE PROCEDURE AddColumnIfMissing(
+    IN p_Table VARCHAR(64),
+    IN p_Column VARCHAR(64),
+    IN p_Definition VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = 'FireworksDB' AND TABLE_NAME = p_Table AND COLUMN_NAME = p_Column
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE `FireworksDB`.`', p_Table, '` ADD COLUMN `', p_Column, '` ', p_Definition);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+
+CREATE PROCEDURE AddUniqueIndexIfMissing(
+    IN p_Table VARCHAR(64),
+    IN p_Index VARCHAR(64),
+    IN p_Column VARCHAR(64)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = 'FireworksDB' AND TABLE_NAME = p_Table AND INDEX_NAME = p_Index
+    ) THEN
+        SET @ddl = CONCAT('ALTER TABLE `FireworksDB`.`', p_Table, '` ADD UNIQUE INDEX `', p_Index, '` (`', p_Column, '` ASC) VISIBLE');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- SKY API record IDs that the sync upserts and fingerprint lookups key on
+CALL AddColumnIfMissing('Customers', 'Altru_id', 'VARCHAR(45) NULL');
+CALL AddUniqueIndexIfMissing('Customers', 'Altru_id_UNIQUE', 'Altru_id');
+CALL AddColumnIfMissing('Wristbands', 'Ticket_id', 'VARCHAR(45) NULL');
+CALL AddUniqueIndexIfMissing('Wristbands', 'Ticket_id_UNIQUE', 'Ticket_id');
+CALL AddColumnIfMissing('ParkingPasses', 'Pass_id', 'VARCHAR(45) NULL');
+CALL AddUniqueIndexIfMissing('ParkingPasses', 'Pass_id_UNIQUE', 'Pass_id');
+
+-- Watermarks are kept as the API's date_modified string, offset and fractional seconds included
+ALTER TABLE `FireworksDB`.`SyncState` MODIFY COLUMN `LastModified` VARCHAR(40) NULL;
+
+-- Row fingerprints that let syncs skip unchanged records
+CALL AddColumnIfMissing('Customers', 'RowHash', 'CHAR(64) NULL');
+CALL AddColumnIfMissing('Events', 'RowHash', 'CHAR(64) NULL');
+CALL AddColumnIfMissing('Wristbands', 'RowHash', 'CHAR(64) NULL');
+CALL AddColumnIfMissing('ParkingPasses', 'RowHash', 'CHAR(64) NULL');
+
+DROP PROCEDURE AddColumnIfMissing;
+DROP PROCEDURE AddUniqueIndexIfMissing;
+
 --------------------------------------------------------------------
 -- Insert Statements
 --------------------------------------------------------------------
@@ -0,0 +1,184 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+from API.services.scheduler.cadences import CadenceSchedule, SyncCadence, parse_interval
+
+NOW = datetime(2026, 5, 4, 12, 0, 0)
+
+
+class FakeScheduleDB:
+    """SyncSchedule rows to load and SyncChanges rows to adapt to; records every write"""
+    def __init__(self, schedule=None, changes=None):
+        self.schedule = schedule or []
+        self.changes = changes or []
+        self.writes = []
+
+    def execute_query(self, query, params=None, fetch=False):
+        if 'FROM SyncSchedule' in query:
+            return self.schedule
+        if query.startswith('SELECT Change_id'):
+            return [row for row in self.changes if row[0] > params[0]]
+        if query.startswith('DELETE FROM SyncChanges'):
+            self.changes = [row for row in self.changes if row[0] > params[0]]
+            return len(self.changes)
+        self.writes.append(params)
+        return True
+
+
+@pytest.fixture(autouse=True)
+def cadence_settings(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith('SYNC_CADENCE') or name.startswith('SYNC_ADAPTIVE') or name == 'SYNC_EVENT_WINDOW':
+            monkeypatch.delenv(name)
+    monkeypatch.setenv('SYNC_CADENCE_JITTER', '0')
+
+
+def cadence(interval=600, min_interval=150, max_interval=2400):
+    return SyncCadence('wristband', interval, None, 0, min_interval, max_interval)
+
+
+def test_parse_interval():
+    assert parse_interval('30s') == 30
+    assert parse_interval('15m') == 900
+    assert parse_interval('1h') == 3600
+    assert parse_interval('1d') == 86400
+    assert parse_interval('5') == 300
+    assert parse_interval('0') == 0
+    assert parse_interval('') is None
+
+
+def test_observe_seeds_the_rate_with_the_first_count():
+    sync_cadence = cadence()
+    sync_cadence.observe(10, 0.3, 20, 1)
+    assert sync_cadence.change_rate == 10
+    assert sync_cadence.interval == 600
+
+
+def test_observe_smooths_the_rate():
+    sync_cadence = cadence()
+    sync_cadence.observe(10, 0.3, 20, 1)
+    sync_cadence.observe(0, 0.3, 20, 1)
+    assert sync_cadence.change_rate == pytest.approx(7)
+
+
+def test_busy_entity_interval_halves_down_to_its_minimum():
+    sync_cadence = cadence()
+    assert sync_cadence.observe(50, 0.3, 20, 1)
+    assert sync_cadence.interval == 300
+    assert sync_cadence.observe(50, 0.3, 20, 1)
+    assert sync_cadence.interval == 150
+    assert not sync_cadence.observe(50, 0.3, 20, 1)
+    assert sync_cadence.interval == 150
+
+
+def test_quiet_entity_interval_grows_up_to_its_maximum():
+    sync_cadence = cadence()
+    intervals = []
+    for _ in range(6):
+        sync_cadence.observe(0, 0.3, 20, 1)
+        intervals.append(sync_cadence.interval)
+    assert intervals == [900, 1350, 2025, 2400, 2400, 2400]
+
+
+def test_steady_entity_keeps_its_interval():
+    sync_cadence = cadence()
+    assert not sync_cadence.observe(5, 0.3, 20, 1)
+    assert sync_cadence.interval == 600
+
+
+def test_never_run_entities_are_due_at_once():
+    schedule = CadenceSchedule(FakeScheduleDB(), entities=['wristband', 'customer'])
+    assert {due.entity for due in schedule.due()} == {'wristband', 'customer'}
+
+
+def test_entity_is_due_one_interval_after_its_last_run():
+    db = FakeScheduleDB(schedule=[('wristband', NOW, None, None, None)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+
+    assert schedule.due(NOW + timedelta(minutes=14)) == []
+    assert [due.entity for due in schedule.due(NOW + timedelta(minutes=15))] == ['wristband']
+
+
+def test_missed_runs_are_caught_up_once():
+    db = FakeScheduleDB(schedule=[('wristband', NOW - timedelta(hours=3), None, None, None)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+    [overdue] = schedule.due(NOW)
+
+    schedule.record_run(overdue, NOW)
+    assert schedule.due(NOW + timedelta(minutes=1)) == []
+    assert overdue.next_due == NOW + timedelta(minutes=15)
+    assert db.writes[-1] == ('wristband', NOW.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def test_event_window_brings_the_next_run_forward(monkeypatch):
+    monkeypatch.setenv('SYNC_EVENT_WINDOW', '12:05-23:30')
+    db = FakeScheduleDB(schedule=[('wristband', NOW, None, None, None)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+
+    # Planned outside the window at the 15 minute cadence, due at the 5 minute one once it opens
+    assert schedule.due(NOW + timedelta(minutes=4)) == []
+    assert [due.entity for due in schedule.due(NOW + timedelta(minutes=6))] == ['wristband']
+
+
+def test_disabled_entity_is_not_scheduled(monkeypatch):
+    monkeypatch.setenv('SYNC_CADENCE_CUSTOMER', '0')
+    schedule = CadenceSchedule(FakeScheduleDB(), entities=['customer', 'event'])
+    assert [sync_cadence.entity for sync_cadence in schedule.cadences] == ['event']
+
+
+def test_adapt_folds_logged_changes_and_reschedules():
+    db = FakeScheduleDB(
+        schedule=[('wristband', NOW, None, None, None)],
+        changes=[(1, 'wristband', 40), (2, 'customer', 3), (3, 'wristband', 40)]
+    )
+    schedule = CadenceSchedule(db, entities=['wristband'])
+
+    schedule.adapt(NOW)
+    [wristband] = schedule.cadences
+    assert wristband.interval == 225
+    assert wristband.next_due == NOW + timedelta(seconds=225)
+    assert schedule.last_change_id == 3
+    assert db.writes == [('wristband', 225, 40.0, 3)]
+    assert db.changes == []
+
+    # Already folded in, so a second call changes nothing
+    schedule.adapt(NOW)
+    assert wristband.interval == 225
+    assert len(db.writes) == 1
+
+
+def test_stored_interval_is_clamped_to_the_configured_bounds():
+    db = FakeScheduleDB(schedule=[('wristband', NOW, 60, 30.0, 7)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+    [wristband] = schedule.cadences
+
+    assert wristband.min_interval == 225
+    assert wristband.interval == 225
+    assert wristband.change_rate == 30.0
+    assert schedule.last_change_id == 7
+
+
+def test_adaptive_off_keeps_the_configured_interval(monkeypatch):
+    monkeypatch.setenv('SYNC_ADAPTIVE', 'false')
+    db = FakeScheduleDB(schedule=[('wristband', NOW, 60, 30.0, 7)], changes=[(8, 'wristband', 100)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+
+    schedule.adapt(NOW)
+    assert schedule.cadences[0].interval == 900
+    assert db.writes == []
+    assert db.changes == [(8, 'wristband', 100)]
+
+
+def test_folded_changes_are_kept_if_the_policy_is_not_stored():
+    class FailingScheduleDB(FakeScheduleDB):
+        def execute_query(self, query, params=None, fetch=False):
+            if query.strip().startswith('INSERT INTO SyncSchedule'):
+                return None
+            return super().execute_query(query, params, fetch)
+
+    db = FailingScheduleDB(schedule=[('wristband', NOW, None, None, None)], changes=[(1, 'wristband', 40)])
+    schedule = CadenceSchedule(db, entities=['wristband'])
+
+    schedule.adapt(NOW)
+    assert schedule.last_change_id == 1
+    assert db.changes == [(1, 'wristband', 40)]
@@ -0,0 +1,132 @@
+import pytest
+from API.services.resilience import circuit_breaker
+from API.services.resilience.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+
+
+def open_circuit(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.is_open
+    assert not breaker.allow_request()
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 29
+    assert not breaker.allow_request()
+    assert breaker.retry_in() == pytest.approx(1)
+
+    clock.now += 1
+    assert breaker.allow_request()
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_successful_probe_closes_the_circuit(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_the_circuit(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_in() == pytest.approx(30)
+
+    clock.now += 30
+    assert breaker.allow_request()
+
+
+def test_release_frees_the_probe_slot(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.release()
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_call_fails_fast_while_open(breaker, clock):
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise ConnectionError('down')
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.call(failing)
+
+    assert len(calls) == 3
+    assert excinfo.value.name == 'test'
+    assert excinfo.value.retry_in == pytest.approx(30)
+
+    clock.now += 30
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.stats()['state'] == STATE_CLOSED
+    assert breaker.stats()['failures'] == 0
+
+
+def test_thresholds_from_the_environment(monkeypatch):
+    monkeypatch.setenv('CIRCUIT_FAILURE_THRESHOLD', '7')
+    monkeypatch.setenv('CIRCUIT_MYSQL_RESET_TIMEOUT', '12')
+
+    breaker = CircuitBreaker('mysql')
+    assert breaker.failure_threshold == 7
+    assert breaker.reset_timeout == 12
@@ -0,0 +1,131 @@
+from zoneinfo import ZoneInfo
+import pytest
+from API.services.data_sync.columnar import (
+    ColumnBatch, customer_batch, date_column, datetime_column, decimal_column, event_batch, parking_pass_batch,
+    ticket_batch, tinyint_column
+)
+from API.services.data_sync.records import (
+    ConstituentRecord, EventRecord, ParkingPassRecord, TicketRecord, decode_all
+)
+
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+def test_tinyint_column():
+    assert tinyint_column([True, False, None, 1, 0]) == [1, 0, None, 1, None]
+
+
+def test_date_column():
+    assert date_column(['2026-05-04', '2026-05-04T19:30:00Z', None, '', 'May 4']) == [
+        '2026-05-04', '2026-05-04', None, None, None
+    ]
+
+
+def test_datetime_column_without_offset_is_kept_as_is():
+    assert datetime_column(
+        ['2026-05-04T19:30:00', '2026-05-04 19:30:00.123', None, 'tomorrow'], NEW_YORK
+    ) == ['2026-05-04 19:30:00', '2026-05-04 19:30:00', None, None]
+
+
+def test_datetime_column_converts_offsets_to_the_sync_timezone():
+    assert datetime_column(
+        ['2026-05-04T23:30:00Z', '2026-05-04T23:30:00.5z', '2026-05-04T20:30:00-03:00', '2026-01-15T12:00:00+00:00'],
+        NEW_YORK
+    ) == ['2026-05-04 19:30:00', '2026-05-04 19:30:00', '2026-05-04 19:30:00', '2026-01-15 07:00:00']
+
+
+def test_datetime_column_reads_sync_timezone(monkeypatch):
+    monkeypatch.setenv('SYNC_TIMEZONE', 'UTC')
+    assert datetime_column(['2026-05-04T19:30:00-04:00']) == ['2026-05-04 23:30:00']
+
+
+def test_datetime_column_leaves_malformed_offsets_empty():
+    assert datetime_column(['2026-05-04T19:30:00+25:00', '2026-05-04T19:30:00-4'], NEW_YORK) == [None, None]
+
+
+def test_decimal_column():
+    assert list(decimal_column(['12.50', 3, None, ''])) == [12.5, 3.0, 0.0, 0.0]
+    assert list(decimal_column(['free', '7', {}], default=-1.0)) == [-1.0, 7.0, -1.0]
+
+
+def test_column_batch_drops_rows_missing_required_columns():
+    batch = ColumnBatch([object()] * 4)
+    batch.add('id', [1, None, 3, 4], required=True)
+    batch.add('name', ['a', 'b', None, 'd'])
+    batch.add('date', ['x', 'y', 'z', None], required=True)
+
+    assert batch.rows('id', 'name') == [(1, 'a'), (3, None)]
+    assert batch.valid_indexes() == [0, 2]
+    assert batch.invalid_indexes() == [1, 3]
+
+
+def test_column_batch_without_invalid_rows():
+    batch = ColumnBatch([object()] * 2)
+    batch.add('id', [1, 2], required=True)
+    batch.add('name', ['a', 'b'])
+    assert batch.rows('name', 'id') == [('a', 1), ('b', 2)]
+    assert batch.invalid_indexes() == []
+
+
+def test_customer_batch_rows_in_upsert_order():
+    records = decode_all(ConstituentRecord, [
+        {
+            'id': '280', 'member_id': 'M1', 'membership': {'level': 'Gold'}, 'first_name': 'Ada',
+            'last_name': 'Byron', 'phone': '555', 'email': 'ada@example.com', 'address_lines': ['1 Main St'],
+            'city': 'Wilmington', 'state': 'DE', 'postal_code': '19807', 'attended': True,
+            'payment_status': {'is_paid': False}, 'status': 'Cancelled'
+        },
+        {'first_name': 'No ID'}
+    ])
+
+    batch = customer_batch(records)
+    assert batch.rows('member_id', 'membership_level', 'address1', 'address2', 'attended', 'paid', 'cancelled', 'altru_id') == [
+        ('M1', 'Gold', '1 Main St', None, 1, 0, 1, '280')
+    ]
+    assert batch.invalid_indexes() == [1]
+
+
+def test_ticket_batch():
+    records = decode_all(TicketRecord, [
+        {'id': 't1', 'event_id': 12, 'issued_at': '2026-05-04T19:30:00'},
+        {'id': 't2', 'event_id': None, 'issued_at': '2026-05-04T19:31:00'},
+        {'id': 't3', 'event_id': 12, 'issued_at': None},
+    ])
+
+    batch = ticket_batch(records)
+    assert batch.rows('event_id', 'issued', 'ticket_id') == [
+        (12, '2026-05-04 19:30:00', 't1'), (12, None, 't3')
+    ]
+
+
+def test_parking_pass_batch():
+    records = decode_all(ParkingPassRecord, [
+        {'id': 'p1', 'event_id': 12, 'issued_at': '2026-05-04T19:30:00', 'pass_type': 'Premium', 'cost': '25.00'},
+        {'id': 'p2', 'event_id': 12, 'pass_type': 'General'},
+        {'id': None, 'event_id': 12, 'pass_type': 'General'},
+    ])
+
+    batch = parking_pass_batch(records)
+    assert batch.rows('event_id', 'issued', 'pass_id', 'pass_type', 'cost') == [
+        (12, '2026-05-04 19:30:00', 'p1', 'Premium', 25.0), (12, None, 'p2', 'General', 0.0)
+    ]
+    assert batch.valid_indexes() == [0, 1]
+
+
+def test_event_batch_requires_a_name_and_date():
+    records = decode_all(EventRecord, [
+        {'id': 1, 'constituent_id': '280', 'name': 'Fireworks', 'start_date': '2026-07-04T21:00:00'},
+        {'id': 2, 'name': 'No date'},
+        {'id': 3, 'start_date': '2026-07-05'},
+    ])
+
+    batch = event_batch(records)
+    assert batch.rows('constituent_id', 'name', 'event_date') == [('280', 'Fireworks', '2026-07-04')]
+    assert batch.invalid_indexes() == [1, 2]
+
+
+@pytest.mark.parametrize('builder', [customer_batch, ticket_batch, parking_pass_batch, event_batch])
+def test_empty_batches(builder):
+    batch = builder([])
+    assert batch.size == 0
+    assert batch.valid_indexes() == []
@@ -0,0 +1,40 @@
+from API.services.data_sync.customers import CustomerSyncService
+
+
+class FakeCustomersDB:
+    """Records the customer upserts; fail_batches makes every execute_many fail"""
+    def __init__(self, fail_batches=False, bad_ids=()):
+        self.fail_batches = fail_batches
+        self.bad_ids = set(bad_ids)
+        self.batches = []
+        self.rows = []
+
+    def execute_many(self, query, rows):
+        self.batches.append(len(rows))
+        if self.fail_batches:
+            return False
+        self.rows.extend(rows)
+        return True
+
+    def execute_query(self, query, params=None, fetch=False):
+        if params[0] in self.bad_ids:
+            return None
+        self.rows.append(params)
+        return True
+
+
+def test_customers_are_upserted_as_one_batch():
+    db = FakeCustomersDB()
+    results = CustomerSyncService(db, api_connector=None).upsert_customers([('a1', 'h1'), ('a2', 'h2')])
+
+    assert results == [True, True]
+    assert db.batches == [2]
+    assert db.rows == [('a1', 'h1'), ('a2', 'h2')]
+
+
+def test_failed_customer_batch_is_retried_row_by_row():
+    db = FakeCustomersDB(fail_batches=True, bad_ids={'a2'})
+    results = CustomerSyncService(db, api_connector=None).upsert_customers([('a1', 'h1'), ('a2', 'h2'), ('a3', 'h3')])
+
+    assert results == [True, False, True]
+    assert db.rows == [('a1', 'h1'), ('a3', 'h3')]
@@ -0,0 +1,185 @@
+from datetime import date
+from API.services.data_sync.dedup import (
+    REQUEST_STATUS_COALESCED, REQUEST_STATUS_COMPLETED, REQUEST_STATUS_FAILED, REQUEST_STATUS_IN_FLIGHT,
+    SyncRequestRegistry, subtract_ranges
+)
+from API.services.data_sync.sync_state import SYNC_MODE_DELTA
+
+STATUSES = (REQUEST_STATUS_IN_FLIGHT, REQUEST_STATUS_COMPLETED, REQUEST_STATUS_FAILED, REQUEST_STATUS_COALESCED)
+
+
+def d(day):
+    return date(2026, 5, day)
+
+
+class FakeRequestsDB:
+    """Hands out Request_ids, returns the given earlier requests and records status updates"""
+    def __init__(self, earlier=None, request_id=10):
+        self.earlier = earlier or []
+        self.request_id = request_id
+        self.statuses = {}
+
+    def execute_query(self, query, params=None, fetch=False):
+        if query.startswith('INSERT'):
+            return self.request_id
+        if query.strip().startswith('SELECT'):
+            return self.earlier
+        if query.startswith('UPDATE'):
+            status, request_id = params
+            self.statuses[request_id] = status
+            return 1
+        raise AssertionError(f"Unexpected query: {query}")
+
+
+class FakeRequestsTable:
+    """
+    A recent SyncRequests table: claim's lookup returns the earlier rows of the covering types,
+    mode and range kind whose status is one of those the query asks for
+    """
+    def __init__(self):
+        self.rows = []  # [request_id, sync_type, mode, start_date, end_date, status]
+
+    def execute_query(self, query, params=None, fetch=False):
+        if query.startswith('INSERT'):
+            sync_type, mode, start_date, end_date, status = params
+            self.rows.append([len(self.rows) + 1, sync_type, mode, start_date, end_date, status])
+            return len(self.rows)
+        if query.startswith('UPDATE'):
+            status, request_id = params
+            self.rows[request_id - 1][5] = status
+            return 1
+        request_id, mode, *rest = params
+        statuses = {param for param in rest if param in STATUSES}
+        types = [param for param in rest if param not in STATUSES and isinstance(param, str) and param.endswith('_sync')]
+        return [
+            (row[3], row[4]) for row in self.rows
+            if row[0] < request_id and row[2] == mode and row[1] in types and row[5] in statuses
+            and (row[3] is None) == ('StartDate IS NULL' in query)
+        ]
+
+
+def test_subtract_nothing():
+    assert subtract_ranges(d(1), d(10), []) == [(d(1), d(10))]
+
+
+def test_subtract_covering_range():
+    assert subtract_ranges(d(3), d(5), [(d(1), d(10))]) == []
+
+
+def test_subtract_from_the_middle():
+    assert subtract_ranges(d(1), d(10), [(d(4), d(6))]) == [(d(1), d(4)), (d(6), d(10))]
+
+
+def test_subtract_overlapping_ends():
+    assert subtract_ranges(d(3), d(8), [(d(1), d(4)), (d(7), d(12))]) == [(d(4), d(7))]
+
+
+def test_subtract_unsorted_overlapping_ranges():
+    covered = [(d(6), d(8)), (d(2), d(4)), (d(3), d(5))]
+    assert subtract_ranges(d(1), d(10), covered) == [(d(1), d(2)), (d(5), d(6)), (d(8), d(10))]
+
+
+def test_subtract_ranges_outside_the_window():
+    # Half-open ranges: one ending where the window starts, or starting where it ends, covers none of it
+    covered = [(d(1), d(3)), (d(8), d(9))]
+    assert subtract_ranges(d(3), d(8), covered) == [(d(3), d(8))]
+
+
+def test_remaining_keeps_the_request_unchanged_when_nothing_overlaps():
+    earlier = [(d(20), d(25))]
+    assert SyncRequestRegistry._remaining('2026-05-01', '2026-05-10', earlier) == [('2026-05-01', '2026-05-10')]
+
+
+def test_remaining_formats_the_uncovered_ranges():
+    earlier = [(d(3), d(5))]
+    assert SyncRequestRegistry._remaining('2026-05-01', '2026-05-10', earlier) == [
+        ('2026-05-01', '2026-05-03'), ('2026-05-05', '2026-05-10')
+    ]
+
+
+def test_remaining_treats_a_same_day_request_as_that_day():
+    # today..today covers the day itself, both for this request and for earlier ones
+    assert SyncRequestRegistry._remaining('2026-05-04', '2026-05-04', [(d(4), d(4))]) == []
+    assert SyncRequestRegistry._remaining('2026-05-01', '2026-05-10', [(d(4), d(4))]) == [
+        ('2026-05-01', '2026-05-04'), ('2026-05-05', '2026-05-10')
+    ]
+
+
+def test_remaining_accepts_timestamps():
+    earlier = [(d(1), d(5))]
+    assert SyncRequestRegistry._remaining('2026-05-01T00:00:00', '2026-05-06T00:00:00', earlier) == [
+        ('2026-05-05', '2026-05-06')
+    ]
+
+
+def test_run_once_syncs_only_the_uncovered_ranges():
+    db = FakeRequestsDB(earlier=[(d(3), d(5))])
+    runs = []
+
+    assert SyncRequestRegistry(db).run_once(
+        'wristband_sync', 'full', '2026-05-01', '2026-05-10', lambda start, end: runs.append((start, end)) or True
+    )
+    assert runs == [('2026-05-01', '2026-05-03'), ('2026-05-05', '2026-05-10')]
+    assert db.statuses == {10: REQUEST_STATUS_COMPLETED}
+
+
+def test_run_once_coalesces_a_covered_request():
+    db = FakeRequestsDB(earlier=[(d(1), d(30))])
+    runs = []
+
+    assert SyncRequestRegistry(db).run_once(
+        'wristband_sync', 'full', '2026-05-01', '2026-05-10', lambda start, end: runs.append((start, end))
+    )
+    assert runs == []
+    assert db.statuses == {10: REQUEST_STATUS_COALESCED}
+
+
+def test_run_once_without_the_registry_syncs_everything():
+    db = FakeRequestsDB(request_id=None)
+    runs = []
+
+    assert SyncRequestRegistry(db).run_once(
+        'wristband_sync', 'full', '2026-05-01', '2026-05-10', lambda start, end: runs.append((start, end))
+    )
+    assert runs == [('2026-05-01', '2026-05-10')]
+
+
+def test_delta_request_after_a_completed_delta_still_runs():
+    db = FakeRequestsTable()
+    registry = SyncRequestRegistry(db)
+    runs = []
+
+    def run(start, end):
+        runs.append((start, end))
+        return True
+
+    assert registry.run_once('wristband_sync', SYNC_MODE_DELTA, None, None, run)
+    assert registry.run_once('wristband_sync', SYNC_MODE_DELTA, None, None, run)
+    assert runs == [(None, None), (None, None)]
+    assert [row[5] for row in db.rows] == [REQUEST_STATUS_COMPLETED, REQUEST_STATUS_COMPLETED]
+
+
+def test_delta_request_is_coalesced_into_one_in_flight():
+    db = FakeRequestsTable()
+    registry = SyncRequestRegistry(db)
+    nested = []
+
+    def run(start, end):
+        # A second delta request arrives while this one is still running
+        nested.append(registry.claim('wristband_sync', SYNC_MODE_DELTA, None, None))
+        return True
+
+    assert registry.run_once('wristband_sync', SYNC_MODE_DELTA, None, None, run)
+    assert nested == [(2, [])]
+    assert db.rows[1][5] == REQUEST_STATUS_COALESCED
+
+
+def test_range_request_is_coalesced_into_a_recently_completed_one():
+    db = FakeRequestsTable()
+    registry = SyncRequestRegistry(db)
+    runs = []
+
+    registry.run_once('event_sync', 'full', '2026-05-01', '2026-05-10', lambda start, end: runs.append(start) or True)
+    db.rows[0][3:5] = [d(1), d(10)]  # as read back from the DATE columns
+    registry.run_once('event_sync', 'full', '2026-05-02', '2026-05-04', lambda start, end: runs.append(start) or True)
+    assert runs == ['2026-05-01']
@@ -0,0 +1,199 @@
+import threading
+import time
+import pytest
+import schedule
+from API.services.scheduler import leader as leader_module
+from API.services.scheduler.leader import LeaderElection
+from API.services.scheduler.scheduler_service import SchedulerService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeLeaseDB:
+    """The SchedulerLeases upsert, on the shared fake clock; available=False makes every query fail"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.leases = {}  # name -> (holder, expires at)
+        self.available = True
+
+    def execute_query(self, query, params=None, fetch=False):
+        if not self.available:
+            return None
+        query = ' '.join(query.split())
+        if query.startswith('INSERT INTO SchedulerLeases'):
+            name, holder, lease_seconds = params
+            current = self.leases.get(name)
+            if current is None or current[0] == holder or current[1] < self.clock.now:
+                self.leases[name] = (holder, self.clock.now + lease_seconds)
+            return 1
+        if query.startswith('SELECT Holder'):
+            current = self.leases.get(params[0])
+            return [(current[0],)] if current else []
+        if query.startswith('UPDATE SchedulerLeases'):
+            name, holder = params
+            if self.leases.get(name, (None,))[0] == holder:
+                self.leases[name] = (holder, self.clock.now - 1)
+            return 1
+        raise AssertionError(f"Unexpected query: {query}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(leader_module, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db(clock):
+    return FakeLeaseDB(clock)
+
+
+@pytest.fixture(autouse=True)
+def lease_settings(monkeypatch):
+    monkeypatch.setenv('SCHEDULER_LEASE_SECONDS', '15')
+    monkeypatch.setenv('SCHEDULER_HEARTBEAT_SECONDS', '5')
+
+
+def test_first_heartbeat_acquires_a_free_lease(db):
+    election = LeaderElection(db)
+    assert election.heartbeat()
+    assert election.is_leader
+    assert db.leases['scheduler'][0] == election.holder
+
+
+def test_second_process_follows(db):
+    first, second = LeaderElection(db), LeaderElection(db)
+    assert first.heartbeat()
+    assert not second.heartbeat()
+    assert not second.is_leader
+
+
+def test_heartbeats_are_throttled(db, clock):
+    election = LeaderElection(db)
+    election.heartbeat()
+    queries = []
+    original = db.execute_query
+    db.execute_query = lambda *args, **kwargs: queries.append(args) or original(*args, **kwargs)
+
+    clock.now += 4
+    assert election.heartbeat()
+    assert queries == []
+
+    clock.now += 1
+    assert election.heartbeat()
+    assert len(queries) == 2
+
+
+def test_renewals_keep_the_lease(db, clock):
+    first, second = LeaderElection(db), LeaderElection(db)
+    first.heartbeat()
+    for _ in range(10):
+        clock.now += 5
+        assert first.heartbeat()
+        assert not second.heartbeat()
+
+
+def test_follower_takes_over_an_expired_lease(db, clock):
+    first, second = LeaderElection(db), LeaderElection(db)
+    first.heartbeat()
+
+    # The leader stops heartbeating; the lease runs out after 15s
+    clock.now += 10
+    assert not second.heartbeat()
+    clock.now += 6
+    assert second.heartbeat()
+    assert not first.is_leader
+
+    # The old leader finds out on its next heartbeat and stays a follower
+    assert not first.heartbeat()
+    assert db.leases['scheduler'][0] == second.holder
+
+
+def test_leader_steps_down_when_the_database_is_unreachable(db, clock):
+    election = LeaderElection(db)
+    election.heartbeat()
+    db.available = False
+
+    # Still the leader while its last lease lasts
+    clock.now += 5
+    assert election.heartbeat()
+    clock.now += 5
+    assert election.heartbeat()
+    clock.now += 5
+    assert not election.heartbeat()
+    assert not election.is_leader
+
+    db.available = True
+    clock.now += 5
+    assert election.heartbeat()
+
+
+def test_release_hands_over_on_the_next_heartbeat(db, clock):
+    first, second = LeaderElection(db), LeaderElection(db)
+    first.heartbeat()
+    assert not second.heartbeat()
+
+    first.release()
+    assert not first.is_leader
+    clock.now += 5
+    assert second.heartbeat()
+
+
+def test_release_by_a_follower_does_nothing(db):
+    first, second = LeaderElection(db), LeaderElection(db)
+    first.heartbeat()
+    second.heartbeat()
+
+    second.release()
+    assert db.leases['scheduler'][0] == first.holder
+    assert first.heartbeat()
+
+
+def test_heartbeat_is_at_most_half_the_lease(monkeypatch, db):
+    monkeypatch.setenv('SCHEDULER_LEASE_SECONDS', '6')
+    monkeypatch.setenv('SCHEDULER_HEARTBEAT_SECONDS', '10')
+    assert LeaderElection(db).heartbeat_seconds == 3
+
+
+class EmptyDB:
+    def execute_query(self, query, params=None, fetch=False):
+        return [] if fetch else 1
+
+
+class SlowLeader:
+    """Records heartbeats, which take a while as over a slow database, and releases"""
+    lease_seconds = 15
+
+    def __init__(self):
+        self.calls = []
+        self.in_heartbeat = threading.Event()
+
+    def heartbeat(self):
+        self.in_heartbeat.set()
+        time.sleep(0.3)
+        self.calls.append('heartbeat')
+        return False
+
+    def release(self):
+        self.calls.append('release')
+
+
+def test_scheduler_releases_the_lease_after_its_last_heartbeat():
+    scheduler = SchedulerService(EmptyDB(), api_connector=None)
+    scheduler.leader = SlowLeader()
+    try:
+        scheduler.start_scheduler()
+        assert scheduler.leader.in_heartbeat.wait(timeout=5)
+        scheduler.stop()
+    finally:
+        schedule.clear()
+
+    assert not scheduler.scheduler_thread.is_alive()
+    assert scheduler.leader.calls[-1] == 'release'
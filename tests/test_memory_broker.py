@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+import pytest
+from API.services.message_broker.backend import (
+    ATTEMPT_HEADER, LAST_ERROR_HEADER, ORIGINAL_QUEUE_HEADER, REPLAY_HEADER, MessageFailed, dead_letter_queue,
+    retry_queue
+)
+from API.services.message_broker.memory_broker import InMemoryMessageBroker
+
+QUEUE = 'test_queue'
+
+
+@pytest.fixture
+def broker():
+    broker = InMemoryMessageBroker()
+    broker.reset()
+    broker.max_attempts = 3
+    broker.retry_delay = 1
+    broker.max_retry_delay = 1
+    consumers = []
+
+    def consume(callback, queue_name=QUEUE, broadcast=False):
+        stop_event = threading.Event()
+        thread = threading.Thread(
+            target=broker.consume_broadcast if broadcast else broker.consume_messages,
+            args=(queue_name, callback), kwargs={'stop_event': stop_event}, daemon=True
+        )
+        thread.start()
+        consumers.append((stop_event, thread))
+
+    broker.consume = consume
+    yield broker
+    for stop_event, thread in consumers:
+        stop_event.set()
+        thread.join(timeout=5)
+    broker.reset()
+    broker.init_retries()
+
+
+def test_handled_message_is_acked(broker):
+    received = []
+    broker.consume(lambda ch, method, properties, body: received.append(json.loads(body)))
+
+    assert broker.publish_message(QUEUE, {'n': 1})
+    assert broker.wait_until_idle(timeout=5)
+
+    assert received == [{'n': 1}]
+    assert broker.stats()[QUEUE] == {'ready': 0, 'held': 0, 'published': 1, 'acked': 1}
+
+
+def test_failed_message_is_retried_through_its_delay_queue(broker):
+    deliveries = []
+
+    def callback(ch, method, properties, body):
+        deliveries.append(dict(properties.headers or {}))
+        return len(deliveries) > 1
+
+    broker.consume(callback)
+    broker.publish_message(QUEUE, {'n': 1})
+    assert broker.wait_until_idle(timeout=5)
+
+    assert len(deliveries) == 2
+    assert deliveries[1][ATTEMPT_HEADER] == 1
+    assert deliveries[1][ORIGINAL_QUEUE_HEADER] == QUEUE
+    assert retry_queue(QUEUE, 1) in broker.stats()
+
+
+def test_message_is_dead_lettered_after_its_last_attempt(broker):
+    attempts = []
+
+    def callback(ch, method, properties, body):
+        attempts.append(body)
+        raise ValueError('boom')
+
+    broker.consume(callback)
+    broker.publish_message(QUEUE, {'n': 1})
+    assert broker.wait_until_idle(timeout=10)
+
+    assert len(attempts) == broker.max_attempts
+    dead_letters = broker.dead_letters(QUEUE)
+    assert len(dead_letters) == 1
+    assert json.loads(dead_letters[0]['body']) == {'n': 1}
+    assert dead_letters[0]['headers'][ATTEMPT_HEADER] == broker.max_attempts
+    assert dead_letters[0]['headers'][LAST_ERROR_HEADER] == 'boom'
+    # Looking does not remove them
+    assert broker.queue_depth(dead_letter_queue(QUEUE)) == 1
+
+
+def test_failure_reason_travels_with_the_retry(broker):
+    deliveries = []
+
+    def callback(ch, method, properties, body):
+        deliveries.append(dict(properties.headers or {}))
+        if len(deliveries) == 1:
+            raise MessageFailed('wristband_sync (full) from 2025-07-01 to 2025-07-04 failed')
+
+    broker.consume(callback)
+    broker.publish_message(QUEUE, {'n': 1})
+    assert broker.wait_until_idle(timeout=5)
+
+    assert deliveries[1][LAST_ERROR_HEADER] == 'wristband_sync (full) from 2025-07-01 to 2025-07-04 failed'
+
+
+def test_replayed_dead_letter_is_redelivered(broker):
+    broker.max_attempts = 1
+    replays = []
+
+    def callback(ch, method, properties, body):
+        headers = properties.headers or {}
+        if REPLAY_HEADER not in headers:
+            return False
+        replays.append(headers[REPLAY_HEADER])
+
+    broker.consume(callback)
+    broker.publish_message(QUEUE, {'n': 1})
+    assert broker.wait_until_idle(timeout=5)
+    assert broker.queue_depth(dead_letter_queue(QUEUE)) == 1
+
+    assert broker.replay_dead_letters(QUEUE) == 1
+    assert broker.wait_until_idle(timeout=5)
+    assert replays == [1]
+    assert broker.queue_depth(dead_letter_queue(QUEUE)) == 0
+
+
+def test_unacked_messages_are_requeued_when_a_consumer_stops(broker):
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(ch, method, properties, body):
+        started.set()
+        release.wait(5)
+
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=broker.consume_messages, args=(QUEUE, slow),
+        kwargs={'prefetch_count': 2, 'stop_event': stop_event}, daemon=True
+    )
+    thread.start()
+    broker.publish_message(QUEUE, {'n': 1})
+    broker.publish_message(QUEUE, {'n': 2})
+    assert started.wait(5)
+
+    stop_event.set()
+    release.set()
+    thread.join(timeout=5)
+
+    # The message in hand was handled and acked; the prefetched one went back to the queue
+    assert broker.stats()[QUEUE]['acked'] == 1
+    assert broker.queue_depth(QUEUE) == 1
+
+
+
+def test_broadcast_reaches_every_subscriber(broker):
+    received = {'first': [], 'second': []}
+    for name in received:
+        broker.consume(
+            lambda ch, method, properties, body, name=name: received[name].append(json.loads(body)),
+            'test_exchange', broadcast=True
+        )
+
+    deadline = time.monotonic() + 5
+    while len([name for name in broker.stats() if name.startswith('test_exchange.')]) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert broker.publish_broadcast('test_exchange', {'event_ids': [12]})
+    assert broker.wait_until_idle(timeout=5)
+    assert received == {'first': [{'event_ids': [12]}], 'second': [{'event_ids': [12]}]}
+
+
+def test_reset_stops_running_consumers_first(broker):
+    thread = threading.Thread(target=broker.consume_messages, args=(QUEUE, lambda *args: None), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not broker._consumers and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    broker.reset()
+    broker.publish_message(QUEUE, {'n': 1})
+
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert broker._consumers == []
+    assert broker.stats()[QUEUE]['ready'] == 1
+
+
+def test_reset_refuses_while_a_consumer_is_busy(broker):
+    handling = threading.Event()
+    release = threading.Event()
+
+    def handle(ch, method, properties, body):
+        handling.set()
+        release.wait(5)
+
+    broker.consume(handle)
+    broker.publish_message(QUEUE, {'n': 1})
+    assert handling.wait(5)
+
+    with pytest.raises(RuntimeError):
+        broker.reset(timeout=0.1)
+    release.set()
@@ -0,0 +1,115 @@
+from API.services.data_sync.availability import PASS_TYPE_LIMITS
+from API.services.data_sync.parking_passes import ParkingPassSyncService
+from API.services.data_sync.records import ParkingPassRecord, decode_all
+
+
+class FakePassesDB:
+    """ParkingPasses and PassTypes tables in memory; fail_batches makes every execute_many fail"""
+    def __init__(self, fail_batches=False, bad_pass_ids=()):
+        self.passes = {}  # Pass_id -> [PP_id, Event_ID]
+        self.pass_types = []  # (PP_id, PassTypes, Cost)
+        self.fail_batches = fail_batches
+        self.bad_pass_ids = set(bad_pass_ids)
+        self.batches = []
+        self.single_writes = 0
+
+    def execute_many(self, query, rows):
+        self.batches.append(query.split()[2])
+        if self.fail_batches:
+            return False
+        return all([self._write(query, row) for row in rows])
+
+    def execute_query(self, query, params=None, fetch=False):
+        if query.strip().startswith('SELECT pp.Event_ID'):
+            event_count = len({str(event_id) for event_id in params if str(event_id).isdigit()})
+            event_ids, excluded = params[:event_count], set(params[event_count:])
+            counts = {}
+            pp_events = {pp_id: (pass_id, event_id) for pass_id, (pp_id, event_id) in self.passes.items()}
+            for pp_id, pass_type, _ in self.pass_types:
+                pass_id, event_id = pp_events[pp_id]
+                if str(event_id) in event_ids and pass_id not in excluded:
+                    counts[(event_id, pass_type)] = counts.get((event_id, pass_type), 0) + 1
+            return [(event_id, pass_type, count) for (event_id, pass_type), count in counts.items()]
+        if query.startswith('SELECT Pass_id, PP_id'):
+            return [(pass_id, self.passes[pass_id][0]) for pass_id in params if pass_id in self.passes]
+        self.single_writes += 1
+        return self._write(query, params)
+
+    def _write(self, query, row):
+        if 'INTO ParkingPasses' in query:
+            event_id, _, pass_id, _ = row
+            if pass_id in self.bad_pass_ids:
+                return False
+            self.passes.setdefault(pass_id, [len(self.passes) + 1, event_id])[1] = event_id
+        else:
+            self.pass_types.append(row)
+        return True
+
+    def get_row_hashes(self, table, key_column, keys):
+        return {}
+
+
+class RecordingPublisher:
+    def __init__(self):
+        self.records = []
+
+    def record(self, message):
+        self.records.append(message)
+
+
+def passes(*specs):
+    return decode_all(ParkingPassRecord, [
+        {'id': pass_id, 'event_id': event_id, 'pass_type': pass_type, 'cost': '10.00'}
+        for pass_id, event_id, pass_type in specs
+    ])
+
+
+def sync(db, records):
+    service = ParkingPassSyncService(db, api_connector=None)
+    publisher = RecordingPublisher()
+    counts = {'success': 0, 'failed': 0, 'limit_reached': 0, 'skipped': 0}
+    service.sync_chunk(records, publisher, counts)
+    return counts, publisher.records
+
+
+def test_passes_and_types_are_written_as_batches():
+    db = FakePassesDB()
+    counts, records = sync(db, passes(('p1', 12, 'General'), ('p2', 12, 'Premium'), ('p3', 13, None)))
+
+    assert counts['success'] == 3
+    assert counts['event_ids'] == {12, 13}
+    assert db.batches == ['ParkingPasses', 'PassTypes']
+    assert db.single_writes == 0
+    assert sorted(db.pass_types) == [(1, 'General', 10.0), (2, 'Premium', 10.0)]
+    assert [record['parking_pass_id'] for record in records] == [1, 2, 3]
+
+
+def test_limits_count_the_passes_earlier_in_the_chunk():
+    db = FakePassesDB()
+    limit = PASS_TYPE_LIMITS['Catering']
+    counts, _ = sync(db, passes(*((f'c{index}', 12, 'Catering') for index in range(limit + 2))))
+    assert counts['success'] == limit
+    assert counts['limit_reached'] == 2
+
+    # Stored passes count too, but a pass being updated is not counted against itself
+    counts, _ = sync(db, passes(('c0', 12, 'Catering'), ('new', 12, 'Catering'), ('other', 13, 'Catering')))
+    assert counts['limit_reached'] == 1
+    assert counts['success'] == 2
+
+
+def test_failed_batch_is_retried_row_by_row():
+    db = FakePassesDB(fail_batches=True, bad_pass_ids={'p2'})
+    counts, records = sync(db, passes(('p1', 12, 'General'), ('p2', 12, 'General'), ('p3', 12, 'General')))
+
+    assert counts['success'] == 2
+    assert counts['failed'] == 1
+    assert sorted(db.passes) == ['p1', 'p3']
+    assert len(db.pass_types) == 2
+    assert [record['status'] for record in records] == ['failed', 'success', 'success']
+
+
+def test_invalid_passes_fail_without_a_write():
+    db = FakePassesDB()
+    counts, _ = sync(db, passes((None, 12, 'General'), ('p1', None, 'General')))
+    assert counts['failed'] == 2
+    assert db.batches == []
@@ -0,0 +1,115 @@
+import threading
+import pytest
+from API.services.data_sync.pipeline import SyncPipeline
+
+
+def test_batches_are_written_in_fetch_order():
+    written = []
+    pipeline = SyncPipeline('test', lambda: iter(range(20)), lambda page: page * 2, written.append, queue_size=2)
+
+    stats = pipeline.run()
+
+    assert written == [page * 2 for page in range(20)]
+    assert {name: stage['items'] for name, stage in stats['stages'].items()} == {
+        'fetch': 20, 'transform': 20, 'write': 20
+    }
+    assert stats['queue_depth'] == {'transform': 0, 'write': 0}
+
+
+def test_empty_fetch_finishes():
+    written = []
+    stats = SyncPipeline('test', lambda: iter([]), lambda page: page, written.append).run()
+    assert written == []
+    assert stats['stages']['fetch']['items'] == 0
+
+
+def test_queues_bound_how_far_the_fetcher_runs_ahead():
+    fetched = []
+    release = threading.Event()
+
+    def fetch():
+        for page in range(50):
+            fetched.append(page)
+            yield page
+
+    def write(batch):
+        release.wait(timeout=5)
+
+    pipeline = SyncPipeline('test', fetch, lambda page: page, write, queue_size=1)
+    runner = threading.Thread(target=pipeline.run, daemon=True)
+    runner.start()
+    runner.join(timeout=0.5)
+
+    # One page in each queue, one in transform, one in write and one held by the blocked fetcher
+    assert len(fetched) <= 5
+    release.set()
+    runner.join(timeout=5)
+    assert not runner.is_alive()
+    assert len(fetched) == 50
+
+
+def test_write_failure_stops_the_fetcher_and_is_reraised():
+    fetched = []
+    written = []
+
+    def fetch():
+        page = 0
+        while True:
+            fetched.append(page)
+            yield page
+            page += 1
+
+    def write(batch):
+        if batch == 3:
+            raise RuntimeError('database down')
+        written.append(batch)
+
+    pipeline = SyncPipeline('test', fetch, lambda page: page, write, queue_size=2)
+    with pytest.raises(RuntimeError, match='database down'):
+        pipeline.run()
+
+    # Nothing after the failed batch is written, and the endless fetch was stopped
+    assert written == [0, 1, 2]
+    assert pipeline.stop_event.is_set()
+    assert len(fetched) < 20
+
+
+def test_transform_failure_drains_and_is_reraised():
+    written = []
+
+    def transform(page):
+        if page == 5:
+            raise ValueError('bad page')
+        return page
+
+    pipeline = SyncPipeline('test', lambda: iter(range(100)), transform, written.append, queue_size=1)
+    with pytest.raises(ValueError, match='bad page'):
+        pipeline.run()
+
+    assert written == list(range(len(written)))
+    assert 5 not in written
+
+
+def test_fetch_failure_is_reraised():
+    written = []
+
+    def fetch():
+        yield 1
+        yield 2
+        raise ConnectionError('SKY API unreachable')
+
+    pipeline = SyncPipeline('test', fetch, lambda page: page, written.append)
+    with pytest.raises(ConnectionError):
+        pipeline.run()
+
+    # Pages fetched before the failure may or may not have been written by then, but never out of order
+    assert written in ([], [1], [1, 2])
+
+
+def test_first_error_wins():
+    def transform(page):
+        raise ValueError(f'page {page}')
+
+    pipeline = SyncPipeline('test', lambda: iter(range(10)), transform, lambda batch: None)
+    with pytest.raises(ValueError, match='page 0'):
+        pipeline.run()
@@ -0,0 +1,45 @@
+from datetime import date
+from API.services.data_sync.ranges import format_date, parse_date, split_date_range
+
+
+def test_parse_and_format_date():
+    assert parse_date('2026-05-04') == date(2026, 5, 4)
+    assert parse_date('2026-05-04T15:30:00Z') == date(2026, 5, 4)
+    assert format_date(date(2026, 5, 4)) == '2026-05-04'
+
+
+def test_split_into_days():
+    assert split_date_range('2026-05-01', '2026-05-04') == [
+        ('2026-05-01', '2026-05-02'), ('2026-05-02', '2026-05-03'), ('2026-05-03', '2026-05-04')
+    ]
+
+
+def test_last_shard_is_cut_short():
+    assert split_date_range('2026-05-01', '2026-05-08', shard_days=3) == [
+        ('2026-05-01', '2026-05-04'), ('2026-05-04', '2026-05-07'), ('2026-05-07', '2026-05-08')
+    ]
+
+
+def test_shards_cross_month_and_year_boundaries():
+    assert split_date_range('2026-12-30', '2027-01-02', shard_days=2) == [
+        ('2026-12-30', '2027-01-01'), ('2027-01-01', '2027-01-02')
+    ]
+
+
+def test_single_shard_when_shorter_than_shard_days():
+    assert split_date_range('2026-05-01', '2026-05-03', shard_days=7) == [('2026-05-01', '2026-05-03')]
+
+
+def test_empty_or_reversed_window_is_one_shard():
+    assert split_date_range('2026-05-04', '2026-05-04') == [('2026-05-04', '2026-05-04')]
+    assert split_date_range('2026-05-04', '2026-05-01') == [('2026-05-04', '2026-05-01')]
+
+
+def test_shard_days_is_at_least_one():
+    assert split_date_range('2026-05-01', '2026-05-03', shard_days=0) == [
+        ('2026-05-01', '2026-05-02'), ('2026-05-02', '2026-05-03')
+    ]
+
+
+def test_timestamps_are_split_by_date():
+    assert split_date_range('2026-05-01T08:00:00', '2026-05-02T20:00:00') == [('2026-05-01', '2026-05-02')]
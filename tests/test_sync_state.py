@@ -0,0 +1,85 @@
+from datetime import datetime
+from API.services.data_sync.records import TicketRecord, decode_all
+from API.services.data_sync.sync_state import SyncStateService
+
+
+class FakeStateDB:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.writes = []
+
+    def execute_query(self, query, params=None, fetch=False):
+        if fetch:
+            return self.rows
+        self.writes.append(params)
+        return True
+
+
+class PagedAPI:
+    """A list endpoint over records, paged with offset/limit; fails the pages listed in fail_offsets"""
+    def __init__(self, records, fail_offsets=()):
+        self.records = records
+        self.fail_offsets = set(fail_offsets)
+        self.calls = []
+
+    def get(self, modified_since=None, offset=None, limit=None, event_id=None):
+        self.calls.append((modified_since, offset, limit, event_id))
+        if offset in self.fail_offsets:
+            return None
+        return self.records[offset:offset + limit]
+
+
+def records(count):
+    return [{'id': index, 'date_modified': f'2026-05-04T19:{index:02d}:00.5-04:00'} for index in range(count)]
+
+
+def test_fetch_changes_pages_until_a_short_page():
+    api = PagedAPI(records(7))
+    changes = SyncStateService(FakeStateDB(), page_size=3).fetch_changes(api.get, '2026-05-01T00:00:00Z')
+
+    assert changes == records(7)
+    assert [call[1] for call in api.calls] == [0, 3, 6]
+    assert all(call[0] == '2026-05-01T00:00:00Z' for call in api.calls)
+
+
+def test_fetch_changes_stops_after_a_full_last_page_with_an_empty_one():
+    api = PagedAPI(records(6))
+    assert len(SyncStateService(FakeStateDB(), page_size=3).fetch_changes(api.get, None)) == 6
+    assert [call[1] for call in api.calls] == [0, 3, 6]
+
+
+def test_fetch_changes_fails_if_any_page_fails():
+    api = PagedAPI(records(7), fail_offsets=[3])
+    assert SyncStateService(FakeStateDB(), page_size=3).fetch_changes(api.get, None) is None
+
+
+def test_fetch_changes_passes_extra_filters():
+    api = PagedAPI(records(2))
+    SyncStateService(FakeStateDB(), page_size=3).fetch_changes(api.get, None, event_id=12)
+    assert api.calls == [(None, 0, 3, 12)]
+
+
+def test_high_water_mark_keeps_the_api_string():
+    assert SyncStateService.high_water_mark(records(3)) == '2026-05-04T19:02:00.5-04:00'
+    assert SyncStateService.high_water_mark(decode_all(TicketRecord, records(3))) == '2026-05-04T19:02:00.5-04:00'
+    assert SyncStateService.high_water_mark([{'id': 1}]) is None
+
+
+def test_watermark_round_trips_unchanged():
+    db = FakeStateDB()
+    state = SyncStateService(db)
+    assert state.advance_watermark('wristband', '2026-05-04T19:02:00.5-04:00')
+    assert db.writes == [('wristband', '2026-05-04T19:02:00.5-04:00')]
+
+    db.rows = [('2026-05-04T19:02:00.5-04:00',)]
+    assert state.get_watermark('wristband') == '2026-05-04T19:02:00.5-04:00'
+
+
+def test_watermark_of_a_new_entity():
+    assert SyncStateService(FakeStateDB()).get_watermark('wristband') is None
+    assert SyncStateService(FakeStateDB([(None,)])).get_watermark('wristband') is None
+
+
+def test_watermarks_stored_as_datetimes_still_read():
+    assert SyncStateService(FakeStateDB([(datetime(2026, 5, 4, 19, 2),)])).get_watermark('x') == '2026-05-04T19:02:00'
+    assert SyncStateService(FakeStateDB([('2026-05-04 19:02:00',)])).get_watermark('x') == '2026-05-04T19:02:00'
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import pytest
+from API.services import worker as worker_module
+from API.services.auth import auth_service, bb_api_connector
+from API.services.auth.auth_service import AuthService
+from API.services.auth.bb_api_connector import BbApiConnector
+from API.services.message_broker.backend import LAST_ERROR_HEADER, SYNC_QUEUE, dead_letter_queue
+from API.services.message_broker.memory_broker import InMemoryMessageBroker
+from API.services.worker import Worker
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRISTBAND_EVENTS = 'wristband_sync_events'
+
+
+class FakeDB:
+    """Accepts every write, remembering the statements; reads find nothing stored yet"""
+    def __init__(self):
+        self.queries = []
+        self.batches = []
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def execute_query(self, query, params=None, fetch=False):
+        with self.lock:
+            self.queries.append((' '.join(query.split()), params))
+            if fetch:
+                return []
+            if query.lstrip().startswith('INSERT'):
+                self.next_id += 1
+                return self.next_id
+            return 1
+
+    def execute_many(self, query, rows):
+        with self.lock:
+            self.batches.append((' '.join(query.split()), list(rows)))
+        return True
+
+    def get_row_hashes(self, table, key_column, keys):
+        return {}
+
+    def statements(self, prefix):
+        with self.lock:
+            return [(query, params) for query, params in self.queries if query.startswith(prefix)]
+
+
+class StubConnector:
+    """Serves tickets a page at a time, or fails every request"""
+    def __init__(self, tickets=None, fail=False):
+        self.tickets = tickets or []
+        self.fail = fail
+
+    def get_tickets(self, start_date=None, end_date=None, modified_since=None, offset=None, limit=None, event_id=None):
+        if self.fail:
+            return None
+        return self.tickets[offset:offset + limit]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    monkeypatch.setenv('MESSAGE_BROKER_BACKEND', 'memory')
+    broker = InMemoryMessageBroker()
+    broker.reset()
+    broker.max_attempts = 2
+    broker.retry_delay = 1
+    broker.max_retry_delay = 1
+    yield broker
+    broker.stop_consuming()
+    broker.reset()
+    broker.init_retries()
+
+
+@pytest.fixture
+def make_worker(monkeypatch, broker):
+    workers = []
+
+    def make_worker(connector, db):
+        monkeypatch.setattr(worker_module, 'load_dotenv', lambda: None)
+        monkeypatch.setattr(worker_module, 'DBService', lambda: db)
+        monkeypatch.setattr(worker_module, 'BbApiConnector', lambda config_file_name: connector)
+        worker = Worker(queue_names=[SYNC_QUEUE, WRISTBAND_EVENTS])
+        for queue_name, callback, prefetch_count in worker.queues:
+            worker.start_consumer(queue_name, callback, prefetch_count)
+        workers.append(worker)
+        return worker
+
+    yield make_worker
+    for worker in workers:
+        worker.stop_event.set()
+        for stops in list(worker.consumers.values()):
+            for consumer_stop in list(stops):
+                consumer_stop.set()
+        for thread in worker.threads:
+            thread.join(timeout=5)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_api_connector_takes_its_config_file(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    monkeypatch.setattr(bb_api_connector, 'load_dotenv', lambda: None)
+    monkeypatch.setattr(auth_service, 'load_dotenv', lambda: None)
+    monkeypatch.setattr(BbApiConnector, '_instance', None)
+    monkeypatch.setattr(AuthService, '_instance', None)
+
+    connector = BbApiConnector(config_file_name='API/resources/app_secrets.json')
+    assert connector.auth_service.app_id == 'xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx'
+    assert connector.test_api_endpoint.startswith('https://')
+    assert BbApiConnector('app_secrets.json') is connector
+
+
+def test_worker_runs_a_delta_sync_end_to_end(broker, make_worker):
+    tickets = [
+        {'id': f't{index}', 'event_id': 12, 'issued_at': '2026-05-04T19:30:00',
+         'date_modified': f'2026-05-04T19:30:{index:02d}Z'}
+        for index in range(3)
+    ]
+    db = FakeDB()
+    worker = make_worker(StubConnector(tickets), db)
+
+    broker.publish_sync_request({'type': 'wristband_sync', 'mode': 'delta'})
+
+    assert wait_for(lambda: broker.stats().get(SYNC_QUEUE, {}).get('acked') == 1)
+    assert broker.wait_until_idle(timeout=5)
+    [(query, rows)] = db.batches
+    assert query.startswith('INSERT INTO Wristbands')
+    assert [row[2] for row in rows] == ['t0', 't1', 't2']
+    assert [params for _, params in db.statements('INSERT INTO SyncState')] == [('wristband', '2026-05-04T19:30:02Z')]
+    assert [params for _, params in db.statements('INSERT INTO SyncChanges')] == [('wristband', 3)]
+    # The per-record and summary notifications reach the worker's own event queue and are acked there
+    assert broker.stats()[WRISTBAND_EVENTS]['acked'] >= 1
+    assert broker.queue_depth(dead_letter_queue(SYNC_QUEUE)) == 0
+    assert worker.busy_seconds(SYNC_QUEUE) > 0
+
+
+def test_worker_dead_letters_a_failing_sync_with_its_reason(broker, make_worker):
+    db = FakeDB()
+    make_worker(StubConnector(fail=True), db)
+
+    broker.publish_sync_request({'type': 'wristband_sync', 'mode': 'delta'})
+
+    assert wait_for(lambda: broker.queue_depth(dead_letter_queue(SYNC_QUEUE)) == 1)
+    _, headers, delivery_tag = broker.get_message(dead_letter_queue(SYNC_QUEUE))
+    broker.ack_message(delivery_tag)
+    assert 'wristband_sync (delta)' in headers[LAST_ERROR_HEADER]
+    assert db.batches == []
+    assert db.statements('INSERT INTO SyncState') == []
+
+
+def test_consumer_that_cannot_connect_is_restarted(monkeypatch, broker, make_worker):
+    monkeypatch.setenv('WORKER_RESTART_BACKOFF', '0.1')
+    consume_messages = broker.consume_messages
+    attempts = []
+
+    def flaky_consume(queue_name, *args, **kwargs):
+        attempts.append(queue_name)
+        if attempts.count(queue_name) == 1:
+            return False  # as MessageBroker does when it cannot reach RabbitMQ
+        return consume_messages(queue_name, *args, **kwargs)
+
+    monkeypatch.setattr(broker, 'consume_messages', flaky_consume)
+    db = FakeDB()
+    worker = make_worker(StubConnector([]), db)
+
+    broker.publish_sync_request({'type': 'wristband_sync', 'mode': 'delta'})
+
+    assert wait_for(lambda: broker.stats().get(SYNC_QUEUE, {}).get('acked') == 1)
+    assert attempts.count(SYNC_QUEUE) == 2
+    assert worker.active_consumers(SYNC_QUEUE) == 1
+
+
+def test_backfill_is_not_planned_when_its_customer_sync_fails(broker, make_worker):
+    db = FakeDB()
+    worker = make_worker(StubConnector(), db)
+    planned = []
+    worker.customer_sync_service.sync_customers_delta = lambda: False
+    worker.backfill_coordinator.plan = lambda start_date, end_date: planned.append((start_date, end_date)) or 1
+
+    assert not worker.plan_backfill('2026-01-01', '2026-03-01')
+    assert planned == []
+
+    worker.customer_sync_service.sync_customers_delta = lambda: True
+    assert worker.plan_backfill('2026-01-01', '2026-03-01')
+    assert planned == [('2026-01-01', '2026-03-01')]